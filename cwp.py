@@ -1,30 +1,123 @@
 # this script is used on windows to wrap shortcuts so that they are executed within an environment
-#   It only sets the appropriate prefix PATH entries - it does not actually activate environments
+#   It applies the activation snapshot menuinst captured at install time, if it is still current;
+#   otherwise it only sets the appropriate prefix PATH entries.
+#
+# Shortcuts run it with `python -I -S`, and when menuinst wrote a launch profile for the prefix
+# (see menuinst/launch.py) only the standard library is needed: the profile is applied and the
+# process replaces itself with the target.  Without a profile we fall back to working everything
+# out here, which needs site-packages (for menuinst.knownfolders).
 
+import json
 import os
 import sys
-import subprocess
-from os.path import join, pathsep
+from os.path import expandvars, isdir, join, normcase, pathsep
 
-from menuinst.knownfolders import FOLDERID, get_folder_path, PathNotFoundException
+# keep in sync with menuinst.launch.PROFILE_PATH
+PROFILE_PATH = join('etc', 'menuinst', 'launch.json')
+PROFILE_VERSION = 1
 
 # call as: python cwp.py PREFIX ARGs...
 
-prefix = sys.argv[1]
-args = sys.argv[2:]
-
-new_paths = pathsep.join([prefix,
-                         join(prefix, "Library", "mingw-w64", "bin"),
-                         join(prefix, "Library", "usr", "bin"),
-                         join(prefix, "Library", "bin"),
-                         join(prefix, "Scripts")])
-env = os.environ.copy()
-env['PATH'] = new_paths + pathsep + env['PATH']
-env['CONDA_PREFIX'] = prefix
-
-documents_folder, exception = get_folder_path(FOLDERID.Documents)
-if exception:
-    documents_folder, exception = get_folder_path(FOLDERID.PublicDocuments)
-if not exception:
-    os.chdir(documents_folder)
-sys.exit(subprocess.call(args, env=env))
+
+def dedupe_path(entries):
+    seen = set()
+    result = []
+    for entry in entries:
+        key = normcase(entry.rstrip('\\/'))
+        if entry and key not in seen:
+            seen.add(key)
+            result.append(entry)
+    return result
+
+
+def load_profile(prefix):
+    try:
+        with open(join(prefix, PROFILE_PATH)) as fi:
+            profile = json.load(fi)
+    except (IOError, OSError, ValueError):
+        return None
+    if profile.get('version') != PROFILE_VERSION:
+        return None
+    return profile
+
+
+def default_profile(prefix):
+    return {
+        'path': [prefix,
+                 join(prefix, "Library", "mingw-w64", "bin"),
+                 join(prefix, "Library", "usr", "bin"),
+                 join(prefix, "Library", "bin"),
+                 join(prefix, "Scripts")],
+        'env': {'CONDA_PREFIX': prefix},
+        'cwd': None,
+    }
+
+
+def documents_folder():
+    if sys.platform != 'win32':
+        return None
+    if sys.flags.no_site:
+        import site
+        site.main()
+    from menuinst.knownfolders import FOLDERID, get_folder_path
+
+    documents_folder, exception = get_folder_path(FOLDERID.Documents)
+    if exception:
+        documents_folder, exception = get_folder_path(FOLDERID.PublicDocuments)
+    if not exception:
+        return documents_folder
+    return None
+
+
+def activation_is_current(snapshot):
+    # see menuinst.activation: the snapshot is stale once anything it
+    # depends on was touched
+    for path, mtime in snapshot['watch'].items():
+        try:
+            current = os.stat(path).st_mtime
+        except OSError:
+            current = None
+        if current != mtime:
+            return False
+    return True
+
+
+def launch_env(profile, environ):
+    env = dict(environ)
+    snapshot = profile.get('activation')
+    if snapshot and activation_is_current(snapshot):
+        for name in snapshot['unset']:
+            env.pop(name, None)
+        spec = snapshot
+    else:
+        spec = profile
+    env['PATH'] = pathsep.join(dedupe_path(spec['path'] + env.get('PATH', '').split(pathsep)))
+    env.update(spec['env'])
+    return env
+
+
+def main(argv):
+    prefix = argv[1]
+    args = argv[2:]
+
+    profile = load_profile(prefix) or default_profile(prefix)
+    env = launch_env(profile, os.environ)
+
+    cwd = expandvars(profile['cwd'] or '')
+    if not (cwd and isdir(cwd)):
+        cwd = documents_folder()
+    if cwd:
+        os.chdir(cwd)
+
+    target = args[0]
+    if sys.platform == 'win32':
+        # the C runtime joins the arguments without quoting them
+        from subprocess import list2cmdline
+        args = [list2cmdline([arg]) for arg in args]
+    sys.stdout.flush()
+    sys.stderr.flush()
+    os.execvpe(target, args, env)
+
+
+if __name__ == '__main__':
+    main(sys.argv)
@@ -6,8 +6,13 @@ from __future__ import absolute_import
 import logging
 import sys
 import json
+import threading
+from collections import namedtuple
 from os.path import abspath, basename, exists, join
 
+from .context import InstallContext
+from .fs import Recorder, StatCache
+from .result import InstallResult
 from ._version import get_versions
 __version__ = get_versions()['version']
 del get_versions
@@ -21,58 +26,225 @@ elif sys.platform == 'darwin':
 
 elif sys.platform == 'win32':
     from .win32 import Menu, ShortCut
-    from .win_elevate import isUserAdmin, runAsAdmin
+    from .win_elevate import isUserAdmin
 
 
-def _install(path, remove=False, prefix=sys.prefix, mode=None, root_prefix=sys.prefix):
+def _menu_name(data):
+    try:
+        return data['menu_name']
+    except KeyError:
+        return 'Python-%d.%d' % sys.version_info[:2]
+
+
+def _menu(data, prefix, mode, root_prefix, context):
+    """
+    The Menu of the menu file content `data` of `prefix`.
+    """
     if abspath(prefix) == abspath(root_prefix):
         env_name = None
     else:
         env_name = basename(prefix)
+    return Menu(_menu_name(data), prefix=prefix, env_name=env_name, mode=mode,
+                root_prefix=root_prefix, context=context)
 
-    data = json.load(open(path))
-    try:
-        menu_name = data['menu_name']
-    except KeyError:
-        menu_name = 'Python-%d.%d' % sys.version_info[:2]
 
-    shortcuts = data['menu_items']
-    m = Menu(menu_name, prefix=prefix, env_name=env_name, mode=mode, root_prefix=root_prefix)
+def _recording(context, listener):
+    """
+    `context`, with the changes made to its filesystem reported to
+    `listener` (see fs.Recorder).
+    """
+    if context is None:
+        context = InstallContext.current()
+    fs = context.fs
+    if not isinstance(fs, StatCache):
+        # the metadata of what we touch is only fetched once per install
+        fs = StatCache(fs)
+    return context.with_fs(Recorder(fs, listener))
+
+
+def _steps(data, remove, prefix, mode, root_prefix, context, menu=True, shortcuts=True,
+           deferred=None):
+    """
+    The steps of an install (or removal), in order, as [(phase, key,
+    function)]: key is None for the menu, else the id of the shortcut.
+    """
+    items = data['menu_items']
+    m = _menu(data, prefix, mode, root_prefix, context)
+    # (a ShortCut gets what the menu sets up when it is made)
+    steps = []
     if remove:
-        for sc in shortcuts:
-            ShortCut(m, sc).remove()
-        m.remove()
+        if shortcuts:
+            steps.extend(('shortcuts', sc.get('id') or sc['name'],
+                          lambda sc=sc: ShortCut(m, sc).remove()) for sc in items)
+        if menu:
+            steps.append(('menu', None, m.remove))
     else:
-        m.create()
-        for sc in shortcuts:
-            ShortCut(m, sc).create()
+        if menu:
+            steps.append(('menu', None, m.create))
+        elif shortcuts:
+            steps.append(('menu', None, m.prepare))
+        if shortcuts:
+            steps.extend(('shortcuts', sc.get('id') or sc['name'],
+                          lambda sc=sc: ShortCut(m, sc).create(deferred=deferred))
+                         for sc in items)
+    return steps
+
+
+def _install(path, remove=False, prefix=sys.prefix, mode=None, root_prefix=sys.prefix,
+             context=None, menu=True, shortcuts=True, data=None, deferred=None):
+    """
+    `menu` and `shortcuts` select what is done: the menu itself, which may
+    be shared with other prefixes (e.g. the Linux menu file), and the
+    shortcuts of this prefix (which need the menu to exist).
+
+    `data` is the content of the menu file, if it is not to be read from
+    `path` (e.g. to remove the menu of a file which was deleted).
+
+    `deferred`, if given, is a list the steps of the shortcuts which can be
+    done later are appended to (see progress.py).
+
+    Returns an InstallResult.
+    """
+    result = InstallResult(path, prefix, remove)
+    with result.phase('total'):
+        with result.phase('read'):
+            if data is None:
+                data = json.load(open(path))
+        context = _recording(context, result.record)
+        for phase, key, step in _steps(data, remove, prefix, mode, root_prefix, context,
+                                       menu, shortcuts, deferred):
+            with result.phase(phase):
+                step()
+    return result
+
 
+# kind is 'planned' (path is the menu file, detail the ids of its shortcuts),
+# 'mkdir', 'wrote' (with the size and the seconds it took, if known),
+# 'removed', 'skipped' (a file which was up to date), 'unchanged' (path is
+# the id of a shortcut which was up to date) or 'error' (path is the menu
+# file or the id, detail what went wrong)
+Event = namedtuple('Event', ['kind', 'path', 'size', 'duration', 'detail'])
 
-def install(path, remove=False, prefix=sys.prefix, recursing=False, root_prefix=sys.prefix):
+
+def iter_install(path, remove=False, prefix=sys.prefix, root_prefix=sys.prefix, context=None,
+                 mode=None, deferred=None):
+    """
+    install() one step at a time, the menu and every shortcut, yielding
+    the Events of a step as soon as it is done.  Stopping the iteration
+    cancels the steps left; an error ends it.  `mode` (default: the
+    context's) and `deferred` are those of _install().
+
+    Without a `context`, the current user's folders (on Linux, root's: the
+    system's) are used; no elevation is attempted.
+    """
+    try:
+        with open(path) as fi:
+            data = json.load(fi)
+        keys = [sc.get('id') or sc['name'] for sc in data['menu_items']]
+    except (IOError, OSError, ValueError, KeyError) as e:
+        yield Event('error', path, None, None, '%s: %s' % (type(e).__name__, e))
+        return
+    yield Event('planned', path, None, None, keys)
+
+    events = []
+    thread = threading.current_thread()
+
+    def listener(kind, changed, size, duration):
+        # not what background threads (e.g. the trash's) do meanwhile
+        if threading.current_thread() is thread:
+            if kind in ('created', 'updated'):
+                kind = 'wrote'
+            events.append(Event(kind, changed, size, duration, None))
+
+    context = _recording(context, listener)
+    if mode is None:
+        mode = context.mode
+    for phase, key, step in _steps(data, remove, prefix, mode, root_prefix, context,
+                                   deferred=deferred):
+        try:
+            step()
+        except Exception as e:
+            error = Event('error', path if key is None else key, None, None,
+                          '%s: %s' % (type(e).__name__, e))
+        else:
+            error = None
+        done, events[:] = events[:], []
+        for event in done:
+            yield event
+        if error is not None:
+            yield error
+            return
+        if key is not None and not remove and all(e.kind == 'skipped' for e in done):
+            yield Event('unchanged', key, None, None, None)
+
+
+def install(path, remove=False, prefix=sys.prefix, recursing=False, root_prefix=sys.prefix,
+            context=None, destdir=None, progressive=False):
     """
     Install Menu and shortcuts
 
     # Specifying `root_prefix` is used with conda-standalone, because we can't use
     # `sys.prefix`, therefore we need to specify it  
+
+    `context` (see context.InstallContext) says where to install to, by
+    default the current user's (or on Linux, root's: the system's) folders.
+    Installs with different contexts can run concurrently in threads.  With
+    an explicit context, no elevation is attempted.
+
+    `destdir` stages a system-wide install below that folder (for building
+    images or packages), as with InstallContext.system(destdir).
+
+    With `progressive`, the menu entries are written, and what else the
+    shortcuts install (e.g. their copies on the desktop) is left to a
+    background thread: a progress.Handle to that is the `pending` of the
+    result.
+
+    Returns an InstallResult (see result.py) of what was done.
+    """
+    deferred = [] if progressive and not remove else None
+    if remove:
+        # what earlier progressive installs left to do must not come back
+        from .progress import scheduler
+        scheduler.wait()
+    if context is None and destdir is not None:
+        context = InstallContext.system(destdir)
+    if context is not None:
+        result = _install(path, remove, prefix, mode=context.mode, root_prefix=root_prefix,
+                          context=context, deferred=deferred)
+    else:
+        result = _install_default(path, remove, prefix, recursing, root_prefix, deferred)
+    if progressive:
+        from .progress import scheduler
+        result.pending = scheduler.submit(deferred or [])
+    return result
+
+
+def _install_default(path, remove, prefix, recursing, root_prefix, deferred):
+    """
+    install() without a context: where depends on the root prefix and the
+    privileges we have or get.
     """
     # this root_prefix is intentional.  We want to reflect the state of the root installation.
     if sys.platform == 'win32' and not exists(join(root_prefix, '.nonadmin')):
         if isUserAdmin():
-            _install(path, remove, prefix, mode='system', root_prefix=root_prefix)
+            return _install(path, remove, prefix, mode='system', root_prefix=root_prefix,
+                            deferred=deferred)
         else:
-            from pywintypes import error
-            retcode = 1
-            try:
-                if not recursing:
-                    retcode = runAsAdmin([join(root_prefix, 'python'), '-c',
-                                          "import menuinst; menuinst.install(%r, %r, %r, %r, %r)" % (
-                                              path, bool(remove), prefix, True, root_prefix)])
-            except error:
-                pass
-
-            if retcode != 0:
-                logging.warn("Insufficient permissions to write menu folder.  "
-                             "Falling back to user location")
-                _install(path, remove, prefix, mode='user', root_prefix=root_prefix)
+            # All the jobs of this process go to the same elevated worker, so
+            # the user gets (at most) one UAC prompt per transaction.
+            result = None
+            if not recursing:
+                from .worker import elevated_session
+                session = elevated_session(root_prefix)
+                if session is not None:
+                    result = session.install(path, remove, prefix, root_prefix)
+
+            if result and result['ok']:
+                return InstallResult.from_json(result['result'])
+            logging.warn("Insufficient permissions to write menu folder.  "
+                         "Falling back to user location")
+            return _install(path, remove, prefix, mode='user', root_prefix=root_prefix,
+                            deferred=deferred)
     else:
-        _install(path, remove, prefix, mode='user', root_prefix=root_prefix)
+        return _install(path, remove, prefix, mode='user', root_prefix=root_prefix,
+                        deferred=deferred)
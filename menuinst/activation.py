@@ -0,0 +1,202 @@
+# Copyright (c) 2013-2017 Continuum Analytics, Inc.
+# All rights reserved.
+"""
+Install-time snapshot of what activating an environment does to os.environ.
+
+Shortcuts used to either run the full conda activation (including every
+etc/conda/activate.d hook) on each launch, or only set a few PATH entries.
+Instead, the activation is run once per prefix when menus are installed and
+its effect is stored as
+
+    {'path': [entries prepended to PATH],
+     'env': {variables set or changed},
+     'unset': [variables removed],
+     'watch': {path: mtime or None}}
+
+in the launch profile (see launch.py), where the launchers apply it directly.
+`watch` lists what the activation depends on (conda-meta/state holding the
+environment's variables, and the activate.d hooks); when any of these
+changed, the snapshot is stale and gets captured again.  conda writes the
+conda-meta records of a transaction only after menus have been installed, so
+those are not watched, or every snapshot would be stale at birth.
+
+The installer itself often runs in the activated environment, where the
+activation would change nothing; so both sides of the difference are taken
+from its environment as it would be without any activation (see
+base_environ()), which is also what a shortcut starts from.
+"""
+from __future__ import absolute_import
+
+import json
+import logging
+import os
+import re
+import subprocess
+import sys
+from os.path import abspath, exists, isdir, join, normcase, pathsep, sep
+
+try:
+    from shlex import quote
+except ImportError:
+    from pipes import quote
+
+
+logger = logging.getLogger(__name__)
+
+DUMP_ENV = 'import json,os,sys;json.dump(dict(os.environ),sys.stdout)'
+SHELL_NAME = re.compile(r'[A-Za-z_][A-Za-z0-9_]*$')
+# set by the shell itself rather than by the activation
+IGNORED = frozenset(['_', 'SHLVL', 'PWD', 'OLDPWD', 'PS1'])
+# set by conda's activation, which stacks on them when they are there
+ACTIVATION_VARS = frozenset(['CONDA_PREFIX', 'CONDA_SHLVL', 'CONDA_DEFAULT_ENV',
+                             'CONDA_PROMPT_MODIFIER', 'CONDA_EXE', 'CONDA_PYTHON_EXE',
+                             '_CE_CONDA', '_CE_M'])
+STACKED_PREFIX = re.compile(r'CONDA_PREFIX_\d+$')
+# the activate.d hooks of conda-forge keep what they override in these
+BACKUP = 'CONDA_BACKUP_'
+
+
+def watched_paths(prefix):
+    activate_d = join(prefix, 'etc', 'conda', 'activate.d')
+    paths = [join(prefix, 'conda-meta', 'state'), activate_d]
+    if isdir(activate_d):
+        paths.extend(join(activate_d, fn) for fn in sorted(os.listdir(activate_d)))
+    return paths
+
+
+def fingerprint(prefix):
+    result = {}
+    for path in watched_paths(prefix):
+        try:
+            result[path] = os.stat(path).st_mtime
+        except OSError:
+            result[path] = None
+    return result
+
+
+def is_current(snapshot, prefix):
+    return bool(snapshot) and snapshot.get('watch') == fingerprint(prefix)
+
+
+def activate_script(root_prefix):
+    if sys.platform == 'win32':
+        return join(root_prefix, 'Scripts', 'activate.bat')
+    return join(root_prefix, 'bin', 'activate')
+
+
+def _below(path, prefixes):
+    path = normcase(abspath(path))
+    return any(path == p or path.startswith(p.rstrip(sep) + sep) for p in prefixes)
+
+
+def base_environ(prefix, environ=None):
+    """
+    `environ` (default: os.environ) without what activating `prefix`, or
+    the environment active in it, set: the variables of conda's activation,
+    and the PATH entries below either prefix.  What the activate.d hooks
+    backed up is restored.
+    """
+    environ = os.environ if environ is None else environ
+    prefixes = [normcase(abspath(p)) for p in (prefix, environ.get('CONDA_PREFIX')) if p]
+    env = {}
+    for name, value in environ.items():
+        if name in ACTIVATION_VARS or STACKED_PREFIX.match(name) or name.startswith(BACKUP):
+            continue
+        if BACKUP + name in environ:
+            continue
+        env[name] = value
+    for name, value in environ.items():
+        if name.startswith(BACKUP) and value:
+            env[name[len(BACKUP):]] = value
+    env['PATH'] = pathsep.join(p for p in environ.get('PATH', '').split(pathsep)
+                               if p and not _below(p, prefixes))
+    return env
+
+
+def _dump_command(prefix, root_prefix, activate):
+    python = sys.executable
+    if sys.platform == 'win32':
+        cmd = '"%s" -c "%s"' % (python, DUMP_ENV)
+        if activate:
+            cmd = 'call "%s" "%s" >nul 2>&1 && %s' % (activate_script(root_prefix), prefix, cmd)
+        # cmd.exe needs the whole command line as one string, see /s in `cmd /?`
+        return '"%s" /d /s /c "%s"' % (os.environ.get('COMSPEC', 'cmd.exe'), cmd)
+    script = 'exec "$3" -c "$4"'
+    if activate:
+        script = '. "$1" "$2" >/dev/null 2>&1 && ' + script
+    # bash, as only its `.` passes arguments to the sourced script
+    return ['/bin/bash', '-c', script, 'bash', activate_script(root_prefix), prefix, python,
+            DUMP_ENV]
+
+
+def diff_env(before, after):
+    before_path = before.get('PATH', '').split(pathsep)
+    return {
+        'path': [p for p in after.get('PATH', '').split(pathsep) if p and p not in before_path],
+        'env': dict((k, v) for k, v in after.items()
+                    if k != 'PATH' and k not in IGNORED and before.get(k) != v),
+        'unset': sorted(k for k in before if k not in after and k not in IGNORED),
+    }
+
+
+def capture(prefix, root_prefix, run=subprocess.check_output):
+    """
+    Run the activation of `prefix` and return its snapshot.  Raises
+    OSError or CalledProcessError when the activation cannot be run.
+    """
+    watch = fingerprint(prefix)
+    env = base_environ(prefix)
+    before = json.loads(run(_dump_command(prefix, root_prefix, False), env=env))
+    after = json.loads(run(_dump_command(prefix, root_prefix, True), env=env))
+    snapshot = diff_env(before, after)
+    snapshot['watch'] = watch
+    return snapshot
+
+
+def current_snapshot(prefix, root_prefix, stored=None):
+    """
+    Return `stored` if it is still current, otherwise a freshly captured
+    snapshot, or None if the prefix cannot be activated from here.
+    """
+    if is_current(stored, prefix):
+        return stored
+    if not exists(activate_script(root_prefix)):
+        return None
+    try:
+        return capture(prefix, root_prefix)
+    except (OSError, ValueError, subprocess.CalledProcessError) as e:
+        logger.warning("menuinst: could not capture the activation of %s: %s", prefix, e)
+        return None
+
+
+def render_posix_launcher(snapshot, prefix, root_prefix):
+    """
+    Return a bash script which runs its arguments with the snapshot
+    applied, or with a full activation when the snapshot went stale.
+    """
+    stale = []
+    for path, mtime in sorted(snapshot['watch'].items()):
+        if mtime is None:
+            stale.append('[ -e %s ]' % quote(path))
+        else:
+            stale.append('[ %s -nt "$0" ]' % quote(path))
+    lines = [
+        '#!/bin/bash',
+        '# Generated by menuinst: run a command in the environment %s' % prefix,
+        '# as activated when its menus were installed.',
+        'if %s; then' % ' || '.join(stale),
+        '    . %s %s >/dev/null 2>&1' % (quote(activate_script(root_prefix)), quote(prefix)),
+        '    exec "$@"',
+        'fi',
+    ]
+    # the shell cannot name anything else (e.g. exported bash functions)
+    for name in snapshot['unset']:
+        if SHELL_NAME.match(name):
+            lines.append('unset %s' % name)
+    for name, value in sorted(snapshot['env'].items()):
+        if SHELL_NAME.match(name):
+            lines.append('export %s=%s' % (name, quote(value)))
+    if snapshot['path']:
+        lines.append('export PATH=%s"${PATH:+:$PATH}"' % quote(pathsep.join(snapshot['path'])))
+    lines.append('exec "$@"')
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,173 @@
+# Copyright (c) 2013-2017 Continuum Analytics, Inc.
+# All rights reserved.
+"""
+Installs and removals for asyncio programs.
+
+install_async() and remove_async() run the steps of install() (the menu,
+then every shortcut) in a thread pool shared by all of them, so that any
+number of them can be awaited on one event loop while no more than
+`DEFAULT_WORKERS` threads touch the disk.  They return the InstallResult
+(see result.py) of what they did, as install() does.  The activation of the prefix,
+which runs the shell, is captured beforehand with asyncio subprocesses
+(see activation.py).
+
+A cancelled install stops between two steps: the one under way when it
+is cancelled is finished in its thread, no other is started.
+
+Without an explicit context on Windows, where an install may need an
+elevated process (started by the shell, for the UAC prompt), the whole of
+install() runs in the pool.
+"""
+from __future__ import absolute_import
+
+import asyncio
+import functools
+import json
+import logging
+import subprocess
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from os.path import exists
+
+from . import _recording, _steps, activation, install
+from .launch import read_profile, update as update_launch_profile
+from .progress import scheduler
+from .result import InstallResult
+
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_WORKERS = 8
+
+_executor = None
+_lock = threading.Lock()
+
+
+def default_executor():
+    """
+    The thread pool shared by the installs which are not given one.
+    """
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=DEFAULT_WORKERS,
+                                           thread_name_prefix='menuinst-aio')
+        return _executor
+
+
+async def _call(executor, func, *args):
+    return await asyncio.wrap_future(executor.submit(func, *args))
+
+
+async def _output(cmd, env, executor):
+    if isinstance(cmd, str):
+        # a command line for cmd.exe, which asyncio cannot pass on as it is
+        return await _call(executor, functools.partial(subprocess.check_output, cmd, env=env))
+    proc = await asyncio.create_subprocess_exec(*cmd, stdout=subprocess.PIPE, env=env)
+    try:
+        out, _ = await proc.communicate()
+    except BaseException:
+        if proc.returncode is None:
+            proc.kill()
+        raise
+    if proc.returncode:
+        raise subprocess.CalledProcessError(proc.returncode, cmd, out)
+    return out
+
+
+async def capture(prefix, root_prefix, executor=None):
+    """
+    activation.capture(), with the shell run as an asyncio subprocess.
+    """
+    executor = executor or default_executor()
+    watch = await _call(executor, activation.fingerprint, prefix)
+    env = activation.base_environ(prefix)
+    before = json.loads(await _output(activation._dump_command(prefix, root_prefix, False),
+                                      env, executor))
+    after = json.loads(await _output(activation._dump_command(prefix, root_prefix, True),
+                                     env, executor))
+    snapshot = activation.diff_env(before, after)
+    snapshot['watch'] = watch
+    return snapshot
+
+
+def _stale(prefix, root_prefix):
+    stored = read_profile(prefix)
+    return (not activation.is_current(stored and stored.get('activation'), prefix) and
+            exists(activation.activate_script(root_prefix)))
+
+
+async def _prepare(prefix, root_prefix, context, executor):
+    # what the backends' Menu.prepare() would run the shell for (a staged
+    # prefix, or one not on the real filesystem, is not activated)
+    if context.destdir or not context.fs.native:
+        return
+    if not await _call(executor, _stale, prefix, root_prefix):
+        return
+    try:
+        snapshot = await capture(prefix, root_prefix, executor)
+    except (OSError, ValueError, subprocess.CalledProcessError) as e:
+        logger.warning("menuinst: could not capture the activation of %s: %s", prefix, e)
+        return
+    await _call(executor, update_launch_profile, prefix, root_prefix, None, snapshot,
+                context.fs)
+
+
+def _read(path):
+    with open(path) as fi:
+        return json.load(fi)
+
+
+def _timed(result, phase, step):
+    with result.phase(phase):
+        step()
+
+
+async def _run(path, remove, prefix, root_prefix, context, executor, progressive=False):
+    executor = executor or default_executor()
+    if context is None and sys.platform == 'win32':
+        return await _call(executor, functools.partial(
+            install, path, remove, prefix, root_prefix=root_prefix, progressive=progressive))
+    if context is None:
+        from .context import InstallContext
+        context = InstallContext.current()
+    if remove:
+        # what earlier progressive installs left to do must not come back
+        await _call(executor, scheduler.wait)
+
+    deferred = [] if progressive and not remove else None
+    result = InstallResult(path, prefix, remove)
+    context = _recording(context, result.record)
+    with result.phase('total'):
+        with result.phase('read'):
+            data = await _call(executor, _read, path)
+        if not remove:
+            with result.phase('menu'):
+                await _prepare(prefix, root_prefix, context, executor)
+        steps = await _call(executor, _steps, data, remove, prefix, context.mode, root_prefix,
+                            context, True, True, deferred)
+        for phase, key, step in steps:
+            # cancelling stops here, after the step under way (if any) is
+            # finished in its thread
+            await _call(executor, _timed, result, phase, step)
+    if progressive:
+        result.pending = scheduler.submit(deferred or [])
+    return result
+
+
+async def install_async(path, prefix=sys.prefix, root_prefix=sys.prefix, context=None,
+                        executor=None, progressive=False):
+    """
+    install() for asyncio; returns its InstallResult.  `executor` is the
+    thread pool to use (default: one shared by all).
+    """
+    return await _run(path, False, prefix, root_prefix, context, executor, progressive)
+
+
+async def remove_async(path, prefix=sys.prefix, root_prefix=sys.prefix, context=None,
+                       executor=None):
+    """
+    install(remove=True) for asyncio, see install_async().
+    """
+    return await _run(path, True, prefix, root_prefix, context, executor)
@@ -0,0 +1,111 @@
+# Copyright (c) 2013-2017 Continuum Analytics, Inc.
+# All rights reserved.
+"""
+The Info.plist of an OS X application bundle, as plain Python objects.
+
+Besides the required keys, a shortcut may specify (all optional):
+
+    "identifier": "org.spyder-ide.spyder",
+    "version": "4.2.5",
+    "document_types": [{"name": "Python script", "extensions": ["py"],
+                        "role": "Editor"}],
+    "url_schemes": [{"name": "Jupyter", "schemes": ["jupyter"]}],
+    "environment": {"SPYDER_DEBUG": "0"}
+
+Serialized plists are not kept here: the bundles of identical applications
+in many environments share their Info.plist through the cache of rendered
+files (see cache.py), keyed by a hash of the shortcut spec.  Installs
+without that cache (staged ones, or not on the real filesystem: see
+darwin.Menu) serialize each plist they write.
+"""
+from __future__ import absolute_import
+
+import plistlib
+import re
+
+
+def bundle_identifier(name):
+    # only alphanumerics, hyphens and periods are allowed
+    return 'com.%s' % re.sub(r'[^A-Za-z0-9.-]+', '-', name).strip('-')
+
+
+class DocumentType(object):
+
+    def __init__(self, name, extensions=(), content_types=(), role='Viewer'):
+        self.name = name
+        self.extensions = list(extensions)
+        self.content_types = list(content_types)
+        self.role = role
+
+    def to_dict(self):
+        d = {'CFBundleTypeName': self.name, 'CFBundleTypeRole': self.role}
+        if self.extensions:
+            d['CFBundleTypeExtensions'] = self.extensions
+        if self.content_types:
+            d['LSItemContentTypes'] = self.content_types
+        return d
+
+
+class URLScheme(object):
+
+    def __init__(self, name, schemes, role='Viewer'):
+        self.name = name
+        self.schemes = list(schemes)
+        self.role = role
+
+    def to_dict(self):
+        return {'CFBundleURLName': self.name, 'CFBundleURLSchemes': self.schemes,
+                'CFBundleTypeRole': self.role}
+
+
+class BundleInfo(object):
+
+    def __init__(self, name, executable, icon_file=None, identifier=None, version='1.0.0',
+                 short_version=None, document_types=(), url_schemes=(), environment=None):
+        self.name = name
+        self.executable = executable
+        self.icon_file = icon_file
+        self.identifier = identifier or bundle_identifier(name)
+        self.version = version
+        self.short_version = short_version or version
+        self.document_types = list(document_types)
+        self.url_schemes = list(url_schemes)
+        self.environment = dict(environment or {})
+
+    @classmethod
+    def from_shortcut(cls, shortcut, executable, icon_file=None):
+        return cls(
+            shortcut['name'], executable, icon_file,
+            identifier=shortcut.get('identifier'),
+            version=shortcut.get('version', '1.0.0'),
+            document_types=[DocumentType(**d) for d in shortcut.get('document_types', [])],
+            url_schemes=[URLScheme(**d) for d in shortcut.get('url_schemes', [])],
+            environment=shortcut.get('environment'),
+        )
+
+    def to_dict(self):
+        d = dict(
+            CFBundleName=self.name,
+            CFBundleExecutable=self.executable,
+            CFBundleGetInfoString='%s-%s' % (self.name, self.version),
+            CFBundleIdentifier=self.identifier,
+            CFBundlePackageType='APPL',
+            CFBundleVersion=self.version,
+            CFBundleShortVersionString=self.short_version,
+        )
+        if self.icon_file:
+            d['CFBundleIconFile'] = self.icon_file
+        if self.document_types:
+            d['CFBundleDocumentTypes'] = [t.to_dict() for t in self.document_types]
+        if self.url_schemes:
+            d['CFBundleURLTypes'] = [s.to_dict() for s in self.url_schemes]
+        if self.environment:
+            d['LSEnvironment'] = self.environment
+        return d
+
+    def dumps(self, fmt=plistlib.FMT_XML):
+        """
+        Return the serialized plist; FMT_BINARY is faster for LaunchServices
+        to parse.  Every call serializes it again (see above).
+        """
+        return plistlib.dumps(self.to_dict(), fmt=fmt)
@@ -0,0 +1,301 @@
+# Copyright (c) 2013-2017 Continuum Analytics, Inc.
+# All rights reserved.
+"""
+Content-addressed cache of rendered shortcut files, shared by all the
+environments of a root prefix.
+
+Rendered files are stored once, as blobs named after a hash of their content
+and mode (objects/ab/cdef...), and installed by cloning them (see clone.py),
+so identical files (icons, plists which do not depend on the prefix, ...) of
+many environments end up as reflinks of the same blob where the filesystem
+has them, and as copies elsewhere.  They are never hard links: installed
+files get edited in place (by menu editors, or reconcile.py touching them),
+which must not change the blob under every other environment.  What a
+shortcut renders to is remembered under a key made from its spec and inputs
+(entries/<key>.json, a {relpath: [blob, mode]} manifest), so it is not even
+rendered again.
+
+Entries are evicted least recently used first once the cache grows beyond
+its size limit (see Cache.gc() and `menuinst gc`).  Removing blobs never
+affects installed files, which are independent reflinks or copies; an
+install which finds a blob gone in the meantime renders its files again
+(see Cache.apply()).
+"""
+from __future__ import absolute_import
+
+import atexit
+import errno
+import hashlib
+import json
+import logging
+import os
+import stat
+import threading
+from os.path import dirname, isdir, isfile, join
+
+from .clone import cloner as default_cloner
+from .filetree import File
+from .fs import os_fs
+from .utils import rm_rf
+
+
+logger = logging.getLogger(__name__)
+
+CACHE_VERSION = 1
+DEFAULT_MAX_SIZE = 256 * 1024 * 1024
+# keep the cache out of the way of conda, with the root prefix's other state
+CACHE_PATH = join('var', 'cache', 'menuinst')
+
+
+def make_key(*parts):
+    spec = json.dumps([CACHE_VERSION] + list(parts), sort_keys=True)
+    return hashlib.sha256(spec.encode('utf-8')).hexdigest()
+
+
+def fingerprint(path):
+    """
+    What identifies an input file (e.g. an icon) in a key, without reading it.
+    """
+    try:
+        st = os.stat(path)
+    except OSError:
+        return [path, None]
+    return [path, st.st_size, st.st_mtime]
+
+
+class Cache(object):
+
+    def __init__(self, root, max_size=DEFAULT_MAX_SIZE, cloner=default_cloner):
+        self.root = root
+        self.max_size = max_size
+        self.cloner = cloner
+        self.dirty = False
+
+    def _entry_path(self, key):
+        return join(self.root, 'entries', key + '.json')
+
+    def _blob_path(self, name):
+        return join(self.root, 'objects', name[:2], name[2:])
+
+    def _write_atomic(self, path, data, mode=0o644):
+        if not isdir(dirname(path)):
+            os.makedirs(dirname(path), exist_ok=True)
+        tmp_path = '%s.%d.%d.tmp' % (path, os.getpid(), threading.current_thread().ident)
+        with open(tmp_path, 'wb') as fo:
+            fo.write(data)
+        os.chmod(tmp_path, mode)
+        os.rename(tmp_path, path)
+
+    def store(self, data, mode=0o644):
+        """
+        Store `data` as a blob (if it is not there yet) and return its name.
+        """
+        name = '%s-%o' % (hashlib.sha256(data).hexdigest(), mode)
+        path = self._blob_path(name)
+        if not isfile(path):
+            self._write_atomic(path, data, mode)
+            self.dirty = True
+        return name
+
+    def lookup(self, key):
+        """
+        Return the files stored under `key` as {relpath: File}, or None.
+        """
+        path = self._entry_path(key)
+        try:
+            with open(path) as fi:
+                manifest = json.load(fi)
+            files = {}
+            for relpath, (name, mode) in manifest.items():
+                blob = self._blob_path(name)
+                if not isfile(blob):
+                    return None
+                # not `shared`: see above
+                files[relpath] = File(source=blob, mode=mode)
+        except (IOError, OSError, ValueError):
+            return None
+        try:
+            os.utime(path, None)  # for the LRU order
+        except OSError:
+            pass
+        return files
+
+    def put(self, key, files):
+        """
+        Store `files` ({relpath: File}) under `key`, and return them as
+        cached files.
+        """
+        manifest = {}
+        for relpath, f in files.items():
+            manifest[relpath] = [self.store(f.read(), f.mode), f.mode]
+        self._write_atomic(self._entry_path(key),
+                           json.dumps(manifest, sort_keys=True).encode('utf-8'))
+        self.dirty = True
+        return self.lookup(key)
+
+    def rendered(self, key, render):
+        """
+        Return the files under `key`, calling `render()` (which returns
+        {relpath: File}) to create them on a miss.  If the cache cannot be
+        written, the freshly rendered files are returned instead.
+        """
+        files = self.lookup(key)
+        if files is None:
+            files = render()
+            try:
+                files = self.put(key, files) or files
+            except (IOError, OSError) as e:
+                logger.warning("Could not write to the cache in %s: %s" % (self.root, e))
+        return files
+
+    def apply(self, key, render, install):
+        """
+        Return `install(files)`, with the files under `key` (see rendered()).
+        A blob may be removed by the gc() of another process before it is
+        cloned, in which case `install` is called again with the files
+        `render()` returns.
+        """
+        files = self.rendered(key, render)
+        try:
+            return install(files)
+        except (IOError, OSError) as e:
+            if e.errno != errno.ENOENT or all(f.source is None or os.path.lexists(f.source)
+                                              for f in files.values()):
+                raise
+            logger.debug("A blob of %s was removed while in use, rendering again" % key)
+            return install(render())
+
+    def install(self, files, root, fs=os_fs):
+        """
+        Put `files` (normally from rendered()) in place under `root` on the
+        (real, maybe wrapped) filesystem `fs`.  A file which already has the
+        content is left alone; one which differs is replaced at once (the
+        new file is cloned next to it, and renamed over it), so it is never
+        missing in between.
+        """
+        for relpath, f in files.items():
+            path = join(root, *relpath.split('/'))
+            if not fs.isdir(dirname(path)):
+                fs.makedirs(dirname(path), exist_ok=True)
+            existed = fs.lexists(path)
+            if existed and fs.isfile(path) and not fs.islink(path) and f.matches(path, fs):
+                if stat.S_IMODE(fs.stat(path).st_mode) == f.mode:
+                    fs.skipped(path)
+                    continue
+                fs.chmod(path, f.mode)
+                fs.changed(path, True)
+                continue
+            if existed and fs.isdir(path):
+                rm_rf(path, fs)
+                existed = False
+            tmp_path = '%s.%d.%d.tmp' % (path, os.getpid(), threading.current_thread().ident)
+            try:
+                if f.source is not None:
+                    self.cloner.clone_file(f.source, tmp_path, f.shared)
+                else:
+                    with open(tmp_path, 'wb') as fo:
+                        fo.write(f.data)
+                # a clone does not always keep the mode
+                if stat.S_IMODE(os.stat(tmp_path).st_mode) != f.mode:
+                    os.chmod(tmp_path, f.mode)
+                os.replace(tmp_path, path)
+            except BaseException:
+                if os.path.lexists(tmp_path):
+                    os.unlink(tmp_path)
+                raise
+            fs.changed(path, existed)
+
+    def entries(self):
+        """
+        Return [(last use, key)] of all entries, least recently used first.
+        """
+        result = []
+        entries_dir = join(self.root, 'entries')
+        if isdir(entries_dir):
+            for entry in os.scandir(entries_dir):
+                if entry.name.endswith('.json'):
+                    result.append((entry.stat().st_mtime, entry.name[:-5]))
+        return sorted(result)
+
+    def _blobs(self):
+        """
+        Return {blob name: size} of all blobs.
+        """
+        blobs = {}
+        objects_dir = join(self.root, 'objects')
+        if isdir(objects_dir):
+            for sub in os.scandir(objects_dir):
+                for entry in os.scandir(sub.path):
+                    if not entry.name.endswith('.tmp'):
+                        blobs[sub.name + entry.name] = entry.stat().st_size
+        return blobs
+
+    def _referenced(self, key):
+        try:
+            with open(self._entry_path(key)) as fi:
+                return set(name for name, mode in json.load(fi).values())
+        except (IOError, OSError, ValueError):
+            return set()
+
+    def size(self):
+        return sum(self._blobs().values())
+
+    def gc(self, max_size=None):
+        """
+        Evict least recently used entries until the blobs still referenced
+        fit in `max_size` bytes (default: self.max_size), and remove the
+        blobs no entry references.  Returns the evicted keys.
+        """
+        if max_size is None:
+            max_size = self.max_size
+        blobs = self._blobs()
+        entries = self.entries()
+        refs = dict((key, self._referenced(key)) for _, key in entries)
+
+        def live_size():
+            names = set()
+            for r in refs.values():
+                names.update(r)
+            return sum(blobs.get(name, 0) for name in names), names
+
+        evicted = []
+        size, live = live_size()
+        for _, key in entries:
+            if size <= max_size:
+                break
+            os.unlink(self._entry_path(key))
+            del refs[key]
+            evicted.append(key)
+            size, live = live_size()
+        for name in set(blobs) - live:
+            os.unlink(self._blob_path(name))
+        self.dirty = False
+        return evicted
+
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+def cache_for(root_prefix):
+    """
+    Return the cache shared by the environments of `root_prefix`; it can be
+    moved elsewhere with the MENUINST_CACHE_DIR environment variable.
+    """
+    root = os.environ.get('MENUINST_CACHE_DIR') or join(root_prefix, CACHE_PATH)
+    with _caches_lock:
+        if root not in _caches:
+            _caches[root] = Cache(root)
+        return _caches[root]
+
+
+def collect_garbage():
+    for c in _caches.values():
+        if c.dirty:
+            try:
+                c.gc()
+            except (IOError, OSError) as e:
+                logger.warning("Could not clean up the cache in %s: %s" % (c.root, e))
+
+
+atexit.register(collect_garbage)
@@ -0,0 +1,125 @@
+# Copyright (c) 2013-2017 Continuum Analytics, Inc.
+# All rights reserved.
+"""
+Copy files as cheaply as the filesystem allows.
+
+Strategies are tried in order: a reflink (copy-on-write clone: FICLONE on
+Linux, clonefile() on OS X), os.copy_file_range() (in-kernel copy), a hard
+link (only where the caller says it is safe, i.e. for files which are never
+modified in place), and finally a plain copy.  When a strategy is not
+supported between two devices, that is remembered and it is not tried again
+for them.
+"""
+from __future__ import absolute_import
+
+import ctypes
+import errno
+import os
+import shutil
+import sys
+from os.path import dirname, join, lexists
+
+
+# _IOW(0x94, 9, int) from linux/fs.h
+FICLONE = 0x40049409
+
+# errors meaning "this strategy does not work here", as opposed to a real
+# problem with the files themselves
+UNSUPPORTED = frozenset(getattr(errno, name) for name in (
+    'EXDEV', 'EOPNOTSUPP', 'ENOTSUP', 'ENOTTY', 'EINVAL', 'ENOSYS', 'EPERM', 'EMLINK',
+    'EBADF', 'ETXTBSY') if hasattr(errno, name))
+
+
+def reflink(src, dst):
+    if sys.platform == 'darwin':
+        libc = ctypes.CDLL(None, use_errno=True)
+        if libc.clonefile(src.encode('utf-8'), dst.encode('utf-8'), 0) != 0:
+            e = ctypes.get_errno()
+            raise OSError(e, os.strerror(e))
+    elif sys.platform.startswith('linux'):
+        import fcntl
+        with open(src, 'rb') as fsrc, open(dst, 'wb') as fdst:
+            fcntl.ioctl(fdst.fileno(), FICLONE, fsrc.fileno())
+        shutil.copymode(src, dst)
+    else:
+        raise OSError(errno.ENOTSUP, "reflinks are not supported on %s" % sys.platform)
+
+
+def copy_range(src, dst):
+    if not hasattr(os, 'copy_file_range'):
+        raise OSError(errno.ENOSYS, "os.copy_file_range() is not available")
+    with open(src, 'rb') as fsrc, open(dst, 'wb') as fdst:
+        remaining = os.fstat(fsrc.fileno()).st_size
+        while remaining > 0:
+            n = os.copy_file_range(fsrc.fileno(), fdst.fileno(), remaining)
+            if n == 0:
+                break
+            remaining -= n
+    shutil.copymode(src, dst)
+
+
+def hardlink(src, dst):
+    os.link(src, dst)
+
+
+def copy(src, dst):
+    shutil.copyfile(src, dst)
+    shutil.copymode(src, dst)
+
+
+STRATEGIES = [
+    ('reflink', reflink),
+    ('copy_file_range', copy_range),
+    ('hardlink', hardlink),
+    ('copy', copy),
+]
+
+
+class Cloner(object):
+
+    def __init__(self, strategies=STRATEGIES):
+        self.strategies = list(strategies)
+        # (strategy name, source device, destination device) known not to work
+        self.unsupported = set()
+
+    def clone_file(self, src, dst, allow_hardlink=False):
+        """
+        Copy `src` to the (not yet existing) `dst`, and return the name of
+        the strategy that did it.
+        """
+        devices = (os.stat(src).st_dev, os.stat(dirname(dst) or '.').st_dev)
+        last_error = None
+        for name, func in self.strategies:
+            if name == 'hardlink' and not allow_hardlink:
+                continue
+            if (name,) + devices in self.unsupported:
+                continue
+            try:
+                func(src, dst)
+                return name
+            except (IOError, OSError) as e:
+                if e.errno not in UNSUPPORTED:
+                    raise
+                self.unsupported.add((name,) + devices)
+                last_error = e
+                if lexists(dst):
+                    os.unlink(dst)
+        raise last_error or OSError(errno.ENOTSUP, "no way to copy %s" % src)
+
+    def clone_tree(self, src, dst, allow_hardlink=lambda relpath: False):
+        """
+        Recreate the directory tree `src` at `dst` (which must not exist yet)
+        and return {relative path: strategy} for the files.
+        """
+        used = {}
+        for dirpath, dirnames, filenames in os.walk(src):
+            rel = os.path.relpath(dirpath, src)
+            rel = '' if rel == '.' else rel.replace(os.sep, '/') + '/'
+            os.mkdir(join(dst, rel) if rel else dst)
+            for name in filenames:
+                used[rel + name] = self.clone_file(join(dirpath, name), join(dst, rel, name),
+                                                   allow_hardlink(rel + name))
+        return used
+
+
+cloner = Cloner()
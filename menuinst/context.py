@@ -0,0 +1,159 @@
+# Copyright (c) 2013-2017 Continuum Analytics, Inc.
+# All rights reserved.
+"""
+Where menus are installed to, as an explicit object instead of module globals.
+
+An InstallContext holds the folders of one installation target (a user
+account, or the whole system) and is passed to Menu and ShortCut, so a single
+process can provision the menus of many users, from as many threads as it
+likes.  Contexts are not modified after creation.  Edits of a shared file
+(the Linux menu file) are serialized by a lock which all contexts using that
+file share.
+
+A context with a `destdir` stages the installation for an image or package
+build: every file is written below destdir (e.g. /usr/share/applications to
+$DESTDIR/usr/share/applications), while the paths within the files are those
+of the running system.  See manifest.py for listing what was produced.
+
+All files are accessed through the context's `fs` (see fs.py), the real
+filesystem unless given otherwise.
+"""
+from __future__ import absolute_import
+
+import copy
+import ntpath
+import os
+import threading
+from os.path import abspath, expanduser, join
+
+from .fs import os_fs
+
+
+SYS_MENU_FILE = '/etc/xdg/menus/applications.menu'
+
+_locks = {}
+_locks_guard = threading.Lock()
+
+
+def lock_for(path):
+    """
+    Return the lock serializing edits of the file at `path`.
+    """
+    with _locks_guard:
+        return _locks.setdefault(abspath(path), threading.RLock())
+
+
+class InstallContext(object):
+    """
+    `mode` is 'user' or 'system'.
+
+    Linux (freedesktop.org):
+        datadir     contains the desktop and directory entries
+        confdir     contains the XML menu files
+    OS X:
+        applications_dir    where the .app bundles go
+    Windows:
+        dirs        {'start', 'desktop', 'quicklaunch', 'documents', 'profile'}
+                    folders; None to use the known folders of the current user
+    """
+    def __init__(self, mode, datadir=None, confdir=None, applications_dir='/Applications',
+                 dirs=None, sys_menu_file=SYS_MENU_FILE, destdir=None, fs=None):
+        self.mode = mode
+        self.datadir = datadir
+        self.confdir = confdir
+        self.applications_dir = applications_dir
+        self.dirs = dict(dirs) if dirs is not None else None
+        self.sys_menu_file = sys_menu_file
+        self.destdir = destdir
+        self.fs = fs or os_fs
+
+    def __repr__(self):
+        return 'InstallContext(%r, datadir=%r, confdir=%r, destdir=%r)' % (
+            self.mode, self.datadir, self.confdir, self.destdir)
+
+    def with_fs(self, fs):
+        """
+        Return a copy of this context, accessing its files through `fs`.
+        """
+        context = copy.copy(self)
+        context.fs = fs
+        return context
+
+    def staged(self, path):
+        """
+        Where the file which will be at `path` on the running system is
+        written to.
+        """
+        if not self.destdir or path is None:
+            return path
+        drive, rest = ntpath.splitdrive(path)
+        return join(self.destdir, drive.rstrip(':'), rest.lstrip('/\\'))
+
+    # the Linux locations are where files are written to, i.e. staged
+
+    @property
+    def appdir(self):
+        return self.staged(join(self.datadir, 'applications'))
+
+    @property
+    def directory_dir(self):
+        return self.staged(join(self.datadir, 'desktop-directories'))
+
+    @property
+    def menu_file(self):
+        return self.staged(join(self.confdir, 'menus', 'applications.menu'))
+
+    @property
+    def lock(self):
+        return lock_for(self.menu_file)
+
+    @classmethod
+    def system(cls, destdir=None, fs=None):
+        return cls('system', '/usr/share', '/etc/xdg', destdir=destdir, fs=fs)
+
+    @classmethod
+    def user(cls, home=None, environ=None, fs=None):
+        """
+        The context of the user whose home is `home`, or of ourselves, whose
+        OS X applications have always gone to /Applications.  The XDG
+        variables of `environ` are only honoured for our own home.
+        """
+        applications_dir = '/Applications'
+        if home is None:
+            home = expanduser('~')
+            if environ is None:
+                environ = os.environ
+        else:
+            applications_dir = join(home, 'Applications')
+        environ = environ or {}
+        return cls('user',
+                   environ.get('XDG_DATA_HOME') or abspath(join(home, '.local', 'share')),
+                   environ.get('XDG_CONFIG_HOME') or abspath(join(home, '.config')),
+                   applications_dir=applications_dir, fs=fs)
+
+    @classmethod
+    def current(cls):
+        """
+        What a plain install of this process targets: the whole system when
+        running as root, our own account otherwise.
+        """
+        if hasattr(os, 'getuid') and os.getuid() == 0:
+            return cls.system()
+        return cls.user()
+
+    @classmethod
+    def windows_user(cls, profile, fs=None):
+        """
+        The context of the Windows user whose profile folder is `profile`,
+        with the default locations of the known folders.
+        """
+        programs = ntpath.join(profile, 'AppData', 'Roaming', 'Microsoft', 'Windows',
+                               'Start Menu', 'Programs')
+        return cls('user', dirs={
+            'start': programs,
+            'desktop': ntpath.join(profile, 'Desktop'),
+            'quicklaunch': ntpath.join(profile, 'AppData', 'Roaming', 'Microsoft',
+                                       'Internet Explorer', 'Quick Launch'),
+            'documents': ntpath.join(profile, 'Documents'),
+            'profile': profile,
+        }, fs=fs)
@@ -2,23 +2,80 @@
 # Copyright (c) 2013 Continuum Analytics, Inc.
 # All rights reserved.
 
+import hashlib
 import os
+import plistlib
 import sys
-import shutil
-from os.path import basename, join
-from plistlib import Plist, writePlist
+from os.path import basename, isdir, join, lexists
 
-from utils import rm_rf
+from . import filetree
+from .bundleinfo import BundleInfo
+from .cache import cache_for, fingerprint, make_key
+from .clone import cloner
+from .context import InstallContext
+from .filetree import File, PlistFile
+from .fs import os_fs
+from .launch import add_menu, launcher_path, remove_menu, update as update_launch_profile
+from .trash import discard, resume as resume_trash
+from .utils import rm_empty_dir, rm_rf
+
+# binary plists are faster for LaunchServices to parse
+PLIST_FORMAT = plistlib.FMT_BINARY
+
+
+def skeletons_dir(prefix):
+    return join(prefix, 'etc', 'menuinst', 'skeletons')
 
 
 class Menu(object):
-    def __init__(self, unused_name, prefix, env_name, mode=None):
+    def __init__(self, name, prefix, env_name, mode=None, root_prefix=sys.prefix,
+                 context=None):
+        self.context = context or InstallContext.current()
+        # the applications are not grouped, the name only tells the menus
+        # of the prefix apart (see launch.add_menu())
+        self.name = name
         self.prefix = prefix
         self.env_name = env_name
+        self.root_prefix = root_prefix
+        self.launcher = None
+        self.fs = self.context.fs
+        # the cache (and what is cloned from it) has to be on the real filesystem;
+        # a staged install gets files of its own, not clones from the cache of
+        # the host it is built on
+        if self.fs.native and not self.context.destdir:
+            self.cache = cache_for(root_prefix)
+        else:
+            self.cache = None
+    def _resume_trash(self):
+        # what earlier removals left to be deleted
+        resume_trash(self.context.staged(self.context.applications_dir), self.fs)
+
     def create(self):
-        pass
+        self._resume_trash()
+        self.prepare()
+    def prepare(self):
+        # the application scripts run through the prefix's launcher, which
+        # applies the activation captured here (a staged prefix, or one not
+        # on the real filesystem, cannot be activated, so its applications
+        # run as is)
+        if not self._launches():
+            return
+        add_menu(self.prefix, self.name, self.fs)
+        if update_launch_profile(self.prefix, self.root_prefix, fs=self.fs)['activation']:
+            self.launcher = launcher_path(self.prefix)
+
+    def _launches(self):
+        return self.fs.native and not self.context.destdir
+
     def remove(self):
-        pass
+        self._resume_trash()
+        if self._launches():
+            remove_menu(self.prefix, self.name, self.fs)
+        # the skeletons are only built on the real filesystem, see
+        # Application.skeleton()
+        if self.fs.native:
+            rm_rf(self.context.staged(skeletons_dir(self.prefix)))
+            rm_empty_dir(self.context.staged(join(self.prefix, 'etc', 'menuinst')))
 
 
 class ShortCut(object):
@@ -26,15 +83,28 @@ class ShortCut(object):
     def __init__(self, menu, shortcut):
         self.shortcut = shortcut
         self.prefix = menu.prefix
+        self.env_name = menu.env_name
+        self.launcher = menu.launcher
+        self.cache = menu.cache
         self.name = shortcut['name']
-        self.path = '/Applications/%s.app' % self.name
+        self.path = join(menu.context.applications_dir, '%s.app' % self.name)
+        self.context = menu.context
         self.shortcut = shortcut
 
     def remove(self):
-        rm_rf(self.path)
+        # the bundle is moved out of the way right away, and deleted in the
+        # background
+        discard(self.context.staged(self.path), self.context.fs)
+        if self.context.fs.native:
+            self.application().remove_skeleton()
 
-    def create(self):
-        Application(self.path, self.shortcut, self.prefix).create()
+    def create(self, deferred=None):
+        # the bundle is all there is to it, so nothing is deferred
+        self.application().create()
+
+    def application(self):
+        return Application(self.path, self.shortcut, self.prefix, self.env_name,
+                           self.launcher, self.cache, self.context.staged, self.context.fs)
 
 
 class Application(object):
@@ -43,21 +113,28 @@ class Application(object):
     be standalone executable, but more likely a Python script which is
     interpreted by the framework Python interpreter.
     """
-    def __init__(self, app_path, shortcut, prefix, env_name, env_setup_cmd):
+    def __init__(self, app_path, shortcut, prefix, env_name=None, launcher=None, cache=None,
+                 staged=None, fs=os_fs):
         """
         Required:
         ---------
         shortcut is a dictionary defining a shortcut per the AppInst standard.
+
+        `staged` maps the paths of the running system to where they are
+        written to and read from (see InstallContext.staged), on `fs`.
         """
         # Store the required values out of the shortcut definition.
         self.app_path = app_path
+        self.shortcut = shortcut
         self.prefix = prefix
         self.name = shortcut['name']
         self.cmd = shortcut['cmd']
         self.icns = shortcut['icns']
         self.env_name = env_name
-        self.env_setup_cmd = env_setup_cmd
-
+        self.launcher = launcher
+        self.cache = cache
+        self.staged = staged or (lambda path: path)
+        self.fs = fs
 
         for a, b in [
             ('${BIN_DIR}', join(prefix, 'bin')),
@@ -74,45 +151,102 @@ class Application(object):
         self.executable_path = join(self.macos_dir, self.executable)
 
     def create(self):
-        self._create_dirs()
-        self._write_pkginfo()
-        shutil.copy(self.icns, self.resources_dir)
-        self._writePlistInfo()
-        self._write_script()
-
-    def _create_dirs(self):
-        rm_rf(self.app_path)
-        os.makedirs(self.resources_dir)
-        os.makedirs(self.macos_dir)
-
-    def _write_pkginfo(self):
-        fo = open(join(self.contents_dir, 'PkgInfo'), 'w')
-        fo.write(('APPL%s????' % self.name.replace(' ', ''))[:8])
-        fo.close()
-
-    def _writePlistInfo(self):
         """
-        Writes the Info.plist file in the Contests directory.
+        Create the bundle, or update an existing one in place: only files
+        which differ are written, so an unchanged application is left alone.
+        A new bundle on the real filesystem starts out as a clone of the
+        prefix's skeleton.  With a cache (see cache.py), files are cloned
+        from there.
+        """
+        app_path = self.staged(self.app_path)
+        if self.fs.native and not lexists(app_path):
+            cloner.clone_tree(self.skeleton(), app_path,
+                              lambda relpath: relpath.startswith('Contents/Resources/'))
+        if self.cache is not None:
+            ops = self.cache.apply(self.cache_key(), self.bundle_files,
+                                   lambda files: filetree.sync(app_path, files, cloner, self.fs))
+        else:
+            ops = filetree.sync(app_path, self.bundle_files(), cloner, self.fs)
+        if not ops:
+            self.fs.skipped(app_path)
+        return ops
+
+    def cache_key(self):
+        return make_key('osx', self.shortcut, self.prefix, self.env_name, self.launcher,
+                        PLIST_FORMAT.name, fingerprint(self.staged(self.icns)))
+
+    def skeleton_path(self):
         """
-        pl = Plist(
-            CFBundleExecutable=self.executable,
-            CFBundleGetInfoString='%s-1.0.0' % self.name,
-            CFBundleIconFile=basename(self.icns),
-            CFBundleIdentifier='com.%s' % self.name,
-            CFBundlePackageType='APPL',
-            CFBundleVersion='1.0.0',
-            CFBundleShortVersionString='1.0.0',
-            )
-        writePlist(pl, join(self.contents_dir, 'Info.plist'))
-
-    def _write_script(self):
-        fo = open(self.executable_path, 'w')
-        fo.write( """\
+        Where the skeleton bundle for our icon is; raises OSError if the
+        icon is missing.
+        """
+        st = os.stat(self.staged(self.icns))
+        key = hashlib.sha1(('%s\0%d\0%d' % (self.icns, st.st_size, st.st_mtime))
+                           .encode('utf-8')).hexdigest()[:16]
+        return self.staged(join(skeletons_dir(self.prefix), key))
+
+    def skeleton(self):
+        """
+        Return the path of the skeleton bundle for our icon, building it on
+        first use.  It holds what is shared by the applications of a prefix
+        (the directories and the icon), so each application only has to
+        write its Info.plist, PkgInfo and launcher script.
+        """
+        icns = self.staged(self.icns)
+        path = self.skeleton_path()
+        if not isdir(path):
+            tmp_path = '%s.%d.tmp' % (path, os.getpid())
+            filetree.sync(tmp_path, {
+                'Contents/Resources/' + basename(self.icns): File(source=icns),
+            }, cloner)
+            try:
+                os.rename(tmp_path, path)
+            except OSError:
+                # somebody else was faster
+                discard(tmp_path)
+        return path
+
+    def remove_skeleton(self):
+        """
+        Remove the skeleton bundle for our icon, if there is one (another
+        application of the prefix with the same icon builds it again).
+        """
+        try:
+            path = self.skeleton_path()
+        except OSError:
+            # the icon went first: Menu.remove() removes all of them
+            return
+        rm_rf(path)
+        rm_empty_dir(self.staged(skeletons_dir(self.prefix)))
+
+    def bundle_files(self):
+        """
+        The desired content of the bundle, as {relative path: File}.
+        """
+        contents = 'Contents/'
+        info = self.bundle_info()
+        return {
+            contents + 'PkgInfo': File(self._pkginfo()),
+            contents + 'Info.plist': PlistFile(info.to_dict(),
+                                               data=info.dumps(PLIST_FORMAT)),
+            contents + 'Resources/' + basename(self.icns): File(source=self.staged(self.icns)),
+            contents + 'MacOS/' + self.executable: File(self._script(), mode=0o755),
+        }
+
+    def _pkginfo(self):
+        return ('APPL%s????' % self.name.replace(' ', ''))[:8].encode('utf-8')
+
+    def bundle_info(self):
+        return BundleInfo.from_shortcut(self.shortcut, self.executable, basename(self.icns))
+
+    def _script(self):
+        python = '%s/python.app/Contents/MacOS/python' % self.prefix
+        if self.launcher:
+            python = '/bin/bash "%s" %s' % (self.launcher, python)
+        return ("""\
 #!/bin/bash
-%s/python.app/Contents/MacOS/python %s
-""" % (self.prefix, self.cmd))
-        fo.close()
-        os.chmod(self.executable_path, 0o755)
+%s %s
+""" % (python, self.cmd)).encode('utf-8')
 
 
 if __name__ == '__main__':
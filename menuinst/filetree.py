@@ -0,0 +1,170 @@
+# Copyright (c) 2013-2017 Continuum Analytics, Inc.
+# All rights reserved.
+"""
+Bring a directory tree (e.g. an .app bundle) to a desired state by applying
+only the differences, instead of deleting and recreating it.
+
+The desired state is a dict mapping '/'-separated paths relative to the root
+to File objects; directories are implied by the files they contain.  plan()
+compares it with what exists on disk and returns a list of operations:
+
+    ('mkdir', relpath)    create a missing directory
+    ('write', relpath)    (re)write a missing or different file
+    ('chmod', relpath)    fix the mode of an otherwise identical file
+    ('remove', relpath)   remove something which is not wanted
+
+which apply() then carries out.  plan() only reads the tree.  Both work on
+the given filesystem (see fs.py).
+"""
+from __future__ import absolute_import
+
+import plistlib
+import stat
+from os.path import join
+
+from .fs import os_fs
+from .utils import rm_rf
+
+
+class File(object):
+    """
+    A file with the given bytes, or a copy of the file at `source`.  A
+    `shared` source is never modified in place, so it may be hard linked.
+    """
+    def __init__(self, data=None, source=None, mode=0o644, shared=False):
+        assert (data is None) != (source is None)
+        self.data = data
+        self.source = source
+        self.mode = mode
+        self.shared = shared
+
+    def read(self, fs=os_fs):
+        if self.data is not None:
+            return self.data
+        return fs.read_bytes(self.source)
+
+    def matches(self, path, fs=os_fs):
+        """
+        Does the (existing, regular) file at `path` have our content?
+        """
+        if self.source is not None:
+            if fs.stat(self.source).st_size != fs.stat(path).st_size:
+                return False
+        return fs.read_bytes(path) == self.read(fs)
+
+
+class PlistFile(File):
+    """
+    A property list, which matches an existing file holding the same
+    values, whatever format (XML or binary) that file was written in.
+    """
+    def __init__(self, value, fmt=plistlib.FMT_XML, mode=0o644, data=None):
+        if data is None:
+            data = plistlib.dumps(value, fmt=fmt)
+        File.__init__(self, data, mode=mode)
+        self.value = value
+
+    def matches(self, path, fs=os_fs):
+        try:
+            return plistlib.loads(fs.read_bytes(path)) == self.value
+        except Exception:  # plistlib raises all sorts of errors for garbage
+            return False
+
+
+def _parents(relpath):
+    parts = relpath.split('/')[:-1]
+    return ['/'.join(parts[:i + 1]) for i in range(len(parts))]
+
+
+def _scan(root, fs=os_fs):
+    """
+    Return ({relpath: lstat result} for files, set of relpaths of dirs).
+    """
+    files, dirs = {}, set()
+    for dirpath, dirnames, filenames in fs.walk(root):
+        rel = dirpath[len(root):].replace('\\', '/').strip('/')
+        rel = rel + '/' if rel else ''
+        for name in dirnames:
+            if fs.islink(join(dirpath, name)):
+                files[rel + name] = fs.stat(join(dirpath, name))
+            else:
+                dirs.add(rel + name)
+        for name in filenames:
+            files[rel + name] = fs.stat(join(dirpath, name))
+    return files, dirs
+
+
+def plan(root, desired, fs=os_fs):
+    ops = []
+    files, dirs = _scan(root, fs) if fs.isdir(root) else ({}, set())
+    wanted_dirs = set()
+    for relpath in desired:
+        wanted_dirs.update(_parents(relpath))
+
+    # removals first, deepest paths first, so a file can replace a directory
+    for relpath in sorted(set(files) - set(desired), reverse=True):
+        ops.append(('remove', relpath))
+    for relpath in sorted(dirs - wanted_dirs, reverse=True):
+        ops.append(('remove', relpath))
+    for relpath in sorted(set(desired) & dirs, reverse=True):
+        ops.append(('remove', relpath))
+
+    if not fs.isdir(root):
+        if fs.lexists(root):
+            ops.append(('remove', ''))
+        ops.append(('mkdir', ''))
+    for relpath in sorted(wanted_dirs - dirs):
+        ops.append(('mkdir', relpath))
+
+    for relpath in sorted(desired):
+        f = desired[relpath]
+        st = files.get(relpath)
+        if (st is None or not stat.S_ISREG(st.st_mode) or
+                not f.matches(join(root, relpath), fs)):
+            ops.append(('write', relpath))
+        elif stat.S_IMODE(st.st_mode) != f.mode:
+            ops.append(('chmod', relpath))
+    return ops
+
+
+def apply(root, ops, desired, cloner=None, fs=os_fs):
+    """
+    Carry out `ops`.  Files with a `source` are copied with `cloner` (see
+    clone.py) when one is given, and the filesystem is the real one.
+    """
+    if not fs.native:
+        cloner = None
+    for op, relpath in ops:
+        path = join(root, relpath) if relpath else root
+        if op == 'remove':
+            rm_rf(path, fs)
+        elif op == 'mkdir':
+            if relpath:
+                fs.mkdir(path)
+            else:
+                fs.makedirs(path)
+        elif op == 'write':
+            f = desired[relpath]
+            if fs.lexists(path):
+                fs.unlink(path)
+            if f.source is not None and cloner is not None:
+                cloner.clone_file(f.source, path, f.shared)
+                fs.changed(path, False)
+            else:
+                fs.write_bytes(path, f.read(fs))
+            # a hard link to a shared file may not be ours to chmod
+            if stat.S_IMODE(fs.stat(path).st_mode) != f.mode:
+                fs.chmod(path, f.mode)
+        elif op == 'chmod':
+            fs.chmod(path, desired[relpath].mode)
+        else:
+            raise ValueError("unknown operation: %r" % op)
+
+
+def sync(root, desired, cloner=None, fs=os_fs):
+    """
+    Make the tree at `root` look like `desired`, and return what was done.
+    """
+    ops = plan(root, desired, fs)
+    apply(root, ops, desired, cloner, fs)
+    return ops
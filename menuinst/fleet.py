@@ -0,0 +1,175 @@
+# Copyright (c) 2013-2017 Continuum Analytics, Inc.
+# All rights reserved.
+"""
+(Re)install, or remove, the menus of every environment at once.
+
+discover() finds the prefixes (the root prefix, its envs/ and those listed
+in ~/.conda/environments.txt) and their Menu/*.json files.  fleet() then
+works in two steps:
+
+  - what the menus of different prefixes share (the Linux menu file, the
+    desktop directory entries) is done by this process, once per menu
+  - the shortcuts of every prefix are installed (or removed) by a pool of
+    processes
+
+The install location is resolved once here and handed to the workers.  The
+outcome is one Provisioned result per menu file.
+"""
+from __future__ import absolute_import
+
+import json
+import os
+import sys
+import traceback
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from os.path import abspath, expanduser, isdir, join, realpath
+
+from . import _install
+from .context import InstallContext
+
+
+ENVIRONMENTS_TXT = join('~', '.conda', 'environments.txt')
+
+# status is 'ok' or 'error' (with the error as detail)
+Provisioned = namedtuple('Provisioned', ['prefix', 'path', 'status', 'detail'])
+
+
+def _subdirs(path):
+    try:
+        return sorted(entry.path for entry in os.scandir(path) if entry.is_dir())
+    except OSError:
+        return []
+
+
+def environments(root_prefix, environments_txt=None):
+    """
+    Return the prefixes of `root_prefix`: itself, those in its envs/ and
+    those listed in `environments_txt`, which still exist.
+    """
+    prefixes = [root_prefix] + _subdirs(join(root_prefix, 'envs'))
+    try:
+        with open(expanduser(environments_txt or ENVIRONMENTS_TXT)) as fi:
+            prefixes.extend(line.strip() for line in fi if line.strip())
+    except (IOError, OSError):
+        pass
+    seen = set()
+    result = []
+    for prefix in prefixes:
+        if realpath(prefix) not in seen and isdir(prefix):
+            seen.add(realpath(prefix))
+            result.append(prefix)
+    return result
+
+
+def menu_files(prefix):
+    try:
+        return sorted(entry.path for entry in os.scandir(join(prefix, 'Menu'))
+                      if entry.name.endswith('.json') and entry.is_file())
+    except OSError:
+        return []
+
+
+def discover(root_prefix, environments_txt=None):
+    """
+    Return [(prefix, [menu file])] of the prefixes which have menus.
+    """
+    result = []
+    for prefix in environments(root_prefix, environments_txt):
+        paths = menu_files(prefix)
+        if paths:
+            result.append((prefix, paths))
+    return result
+
+
+def default_context(root_prefix):
+    """
+    Where a fleet install goes: what install() would pick (without the
+    elevation), with the Windows folders resolved.
+    """
+    if sys.platform == 'win32':
+        from .win32 import resolved_context
+        from .win_elevate import isUserAdmin
+        nonadmin = os.path.exists(join(root_prefix, '.nonadmin'))
+        return resolved_context('user' if nonadmin or not isUserAdmin() else 'system')
+    return InstallContext.current()
+
+
+def _menu_key(path, prefix):
+    """
+    What identifies the shared part of a menu: on Linux, the menu's name.
+    Elsewhere menus do not share anything, so every menu file is its own.
+    """
+    if not sys.platform.startswith('linux'):
+        return (prefix, path)
+    with open(path) as fi:
+        return json.load(fi).get('menu_name')
+
+
+def _job(args):
+    path, remove, prefix, root_prefix, context, menu, shortcuts = args
+    try:
+        _install(path, remove, prefix, mode=context.mode, root_prefix=root_prefix,
+                 context=context, menu=menu, shortcuts=shortcuts)
+    except Exception as e:
+        return Provisioned(prefix, path, 'error',
+                           '%s: %s\n%s' % (type(e).__name__, e, traceback.format_exc()))
+    return Provisioned(prefix, path, 'ok', None)
+
+
+def fleet(root_prefix=sys.prefix, remove=False, jobs=None, context=None, prefixes=None,
+          environments_txt=None):
+    """
+    Install (or remove) the menus of all prefixes of `root_prefix`, or of
+    `prefixes` ([(prefix, [menu file])], default: discover()), with `jobs`
+    processes (default: one per CPU; 1 to do everything in this process).
+    Returns a Provisioned result per menu file.
+    """
+    root_prefix = abspath(root_prefix)
+    if prefixes is None:
+        prefixes = discover(root_prefix, environments_txt)
+    if context is None:
+        context = default_context(root_prefix)
+
+    results = {}
+    owner = {}
+    keys = {}
+    shared = {}
+    for prefix, paths in prefixes:
+        for path in paths:
+            owner[path] = prefix
+            try:
+                keys[path] = _menu_key(path, prefix)
+            except (IOError, OSError, ValueError) as e:
+                results[path] = Provisioned(prefix, path, 'error',
+                                            '%s: %s' % (type(e).__name__, e))
+                continue
+            # one representative menu file per shared menu
+            shared.setdefault(keys[path], path)
+
+    def shared_step():
+        for key, rep in shared.items():
+            result = _job((rep, remove, owner[rep], root_prefix, context, True, False))
+            if result.status == 'error':
+                # ... is what went wrong for all the menu files of that menu
+                # (and its shortcuts are left alone)
+                for path in keys:
+                    if keys[path] == key and (path not in results or
+                                              results[path].status == 'ok'):
+                        results[path] = result._replace(prefix=owner[path], path=path)
+
+    # the menus have to exist before their shortcuts are created, and must
+    # stay until the shortcuts are gone
+    if not remove:
+        shared_step()
+    work = [(path, remove, owner[path], root_prefix, context, False, True)
+            for path in keys if path not in results]
+    if jobs == 1:
+        done = [_job(args) for args in work]
+    else:
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            done = list(executor.map(_job, work))
+    results.update((r.path, r) for r in done)
+    if remove:
+        shared_step()
+    return [results[path] for prefix, paths in prefixes for path in paths]
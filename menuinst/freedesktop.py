@@ -1,8 +1,26 @@
 # Copyright (c) 2008-2011 by Enthought, Inc.
 # All rights reserved.
 
+from .fs import os_fs
 
-def make_desktop_entry(d):
+
+def desktop_command(cmd, tp, webbrowser_cmd):
+    """
+    Handle the special placeholders in the specified command.  For a
+    filebrowser request, we simply use the filebrowser of the desktop `tp`.
+    But for a webbrowser request, we invoke `webbrowser_cmd` (the Python
+    standard lib's webbrowser script) so we can force the url(s) to open in
+    new tabs.
+    """
+    cmd = list(cmd)
+    if cmd[0] == '{{FILEBROWSER}}':
+        cmd[0] = {'gnome': 'gnome-open', 'kde': 'kfmclient openURL'}[tp]
+    elif cmd[0] == '{{WEBBROWSER}}':
+        cmd[0:1] = list(webbrowser_cmd)
+    return cmd
+
+
+def make_desktop_entry(d, fs=os_fs):
     """
     Create a desktop entry that conforms to the format of the Desktop Entry
     Specification by freedesktop.org.  See:
@@ -15,6 +33,13 @@ def make_desktop_entry(d):
     """
     assert d['path'].endswith('.desktop')
 
+    fs.write_bytes(d['path'], desktop_entry(d).encode('utf-8'))
+
+
+def desktop_entry(d):
+    """
+    Return the text of the desktop entry described by `d`.
+    """
     # default values
     d.setdefault('comment', '')
     d.setdefault('icon', '')
@@ -26,8 +51,7 @@ def make_desktop_entry(d):
     assert isinstance(d['terminal'], bool)
     d['terminal'] = {False: 'false', True: 'true'}[d['terminal']]
 
-    fo = open(d['path'], "w")
-    fo.write("""\
+    text = """\
 [Desktop Entry]
 Type=Application
 Encoding=UTF-8
@@ -37,17 +61,16 @@ Exec=%(cmd)s
 Terminal=%(terminal)s
 Icon=%(icon)s
 Categories=%(categories)s
-""" % d)
+""" % d
 
     if d['tp'] == 'kde':
-        fo.write('OnlyShowIn=KDE\n')
+        text += 'OnlyShowIn=KDE\n'
     else:
-        fo.write('NotShowIn=KDE\n')
+        text += 'NotShowIn=KDE\n'
+    return text
 
-    fo.close()
 
-
-def make_directory_entry(d):
+def make_directory_entry(d, fs=os_fs):
     """
     Create a directory entry that conforms to the format of the Desktop Entry
     Specification by freedesktop.org.  See:
@@ -61,17 +84,22 @@ def make_directory_entry(d):
     """
     assert d['path'].endswith('.directory')
 
+    fs.write_bytes(d['path'], directory_entry(d).encode('utf-8'))
+
+
+def directory_entry(d):
+    """
+    Return the text of the directory entry described by `d`.
+    """
     # default values
     d.setdefault('comment', '')
     d.setdefault('icon', '')
 
-    fo = open(d['path'], "w")
-    fo.write("""\
+    return """\
 [Desktop Entry]
 Type=Directory
 Encoding=UTF-8
 Name=%(name)s
 Comment=%(comment)s
 Icon=%(icon)s
-""" % d)
-    fo.close()
+""" % d
@@ -0,0 +1,673 @@
+# Copyright (c) 2013-2017 Continuum Analytics, Inc.
+# All rights reserved.
+"""
+The filesystem operations the backends use, behind one interface.
+
+OSFileSystem is the real thing.  MemoryFileSystem keeps a (POSIX style) tree
+in memory, so install and remove scenarios can run by the thousand without
+touching the disk, and counts every operation.  It can also charge a fixed
+latency per operation, to tell planning overhead from I/O or to mimic a slow
+NFS or roaming home: by default the latency is only added up in `elapsed`,
+which keeps runs deterministic; pass sleep=time.sleep to actually wait.
+
+StatCache wraps either of them, answering the metadata queries of one
+operation (an install or removal) from a single listing per directory, so a
+filesystem where every stat is a round trip (NFS, roaming homes) is not asked
+the same question twice.
+
+Recorder wraps a filesystem (usually a StatCache) and reports the changes
+made through it, as they are made, for progress reporting.
+
+Both can serve as the provider of a probe.Prober (access, isdir, makedirs).
+The filesystem of an install comes from its InstallContext.
+"""
+from __future__ import absolute_import
+
+import errno
+import os
+import posixpath
+import shutil
+import stat
+import threading
+import time
+from collections import Counter, namedtuple
+from os.path import dirname, isdir, isfile, islink, lexists, normpath
+
+
+class OSFileSystem(object):
+
+    # can the files be handed to things outside of this module, like the
+    # cloner or a subprocess?
+    native = True
+
+    def exists(self, path):
+        return os.path.exists(path)
+
+    def lexists(self, path):
+        return lexists(path)
+
+    def isfile(self, path):
+        return isfile(path)
+
+    def isdir(self, path):
+        return isdir(path)
+
+    def islink(self, path):
+        return islink(path)
+
+    def access(self, path, mode):
+        return os.access(path, mode)
+
+    def stat(self, path):
+        return os.lstat(path)
+
+    def listdir(self, path):
+        return os.listdir(path)
+
+    def scandir(self, path):
+        """
+        Return [(name, kind, lstat result or None)] of the entries of the
+        directory `path`, where kind is 'dir', 'link' or 'file'.  The lstat
+        result is only given when it came for free.
+        """
+        result = []
+        for entry in os.scandir(path):
+            if entry.is_symlink():
+                kind = 'link'
+            elif entry.is_dir(follow_symlinks=False):
+                kind = 'dir'
+            else:
+                kind = 'file'
+            # Windows lists the metadata with the names, POSIX needs a stat
+            st = entry.stat(follow_symlinks=False) if os.name == 'nt' else None
+            result.append((entry.name, kind, st))
+        return result
+
+    def walk(self, top):
+        return os.walk(top)
+
+    def mkdir(self, path):
+        os.mkdir(path)
+
+    def makedirs(self, path, exist_ok=False):
+        os.makedirs(path, exist_ok=exist_ok)
+
+    def rmdir(self, path):
+        os.rmdir(path)
+
+    def unlink(self, path):
+        os.unlink(path)
+
+    def rmtree(self, path):
+        shutil.rmtree(path)
+
+    def rename(self, src, dst):
+        os.replace(src, dst)
+
+    def chmod(self, path, mode):
+        os.chmod(path, mode)
+
+    def read_bytes(self, path):
+        with open(path, 'rb') as fi:
+            return fi.read()
+
+    def write_bytes(self, path, data, mode=None):
+        with open(path, 'wb') as fo:
+            fo.write(data)
+        if mode is not None:
+            os.chmod(path, mode)
+
+    def copyfile(self, src, dst):
+        shutil.copyfile(src, dst)
+
+    def forget(self, path):
+        """
+        Somebody else may have changed `path`: do not rely on what is
+        remembered about it.  Nothing is, here.
+        """
+
+    def changed(self, path, existed):
+        """
+        `path` was written on our behalf by something else than this
+        filesystem (the cloner, the Windows shell); `existed` tells whether
+        there was something there before.
+        """
+
+    def skipped(self, path):
+        """
+        `path` was found as it should be, and left alone.
+        """
+
+
+# what MemoryFileSystem.stat() returns, a subset of os.stat_result
+StatResult = namedtuple('StatResult', ['st_mode', 'st_size', 'st_mtime'])
+
+
+def _error(code, path):
+    return OSError(code, os.strerror(code), path)
+
+
+class MemoryFileSystem(object):
+
+    native = False
+
+    def __init__(self, latency=0.0, sleep=None):
+        self.latency = latency
+        self.sleep = sleep
+        self.ops = Counter()
+        self.elapsed = 0.0
+        # {path: [data, mode, mtime]} and the set of directories
+        self.files = {}
+        self.dirs = set(['/'])
+        self._lock = threading.RLock()
+
+    def _op(self, name, path):
+        with self._lock:
+            self.ops[name] += 1
+            self.elapsed += self.latency
+        if self.latency and self.sleep is not None:
+            self.sleep(self.latency)
+        return posixpath.normpath(posixpath.join('/', path))
+
+    def _parent_dir(self, path):
+        parent = posixpath.dirname(path)
+        if parent not in self.dirs:
+            raise _error(errno.ENOTDIR if parent in self.files else errno.ENOENT, path)
+
+    def exists(self, path):
+        path = self._op('stat', path)
+        return path in self.files or path in self.dirs
+
+    lexists = exists
+
+    def isfile(self, path):
+        return self._op('stat', path) in self.files
+
+    def isdir(self, path):
+        return self._op('stat', path) in self.dirs
+
+    def islink(self, path):
+        self._op('stat', path)
+        return False
+
+    def access(self, path, mode):
+        return self.exists(path)
+
+    def stat(self, path):
+        path = self._op('stat', path)
+        with self._lock:
+            if path in self.dirs:
+                return StatResult(stat.S_IFDIR | 0o755, 0, 0.0)
+            if path in self.files:
+                data, mode, mtime = self.files[path]
+                return StatResult(stat.S_IFREG | mode, len(data), mtime)
+        raise _error(errno.ENOENT, path)
+
+    def listdir(self, path):
+        path = self._op('listdir', path)
+        with self._lock:
+            if path not in self.dirs:
+                raise _error(errno.ENOTDIR if path in self.files else errno.ENOENT, path)
+            return sorted(posixpath.basename(p) for p in self.dirs | set(self.files)
+                          if p != path and posixpath.dirname(p) == path)
+
+    def scandir(self, path):
+        names = self.listdir(path)
+        path = posixpath.normpath(posixpath.join('/', path))
+        result = []
+        with self._lock:
+            for name in names:
+                child = posixpath.join(path, name)
+                if child in self.dirs:
+                    result.append((name, 'dir', StatResult(stat.S_IFDIR | 0o755, 0, 0.0)))
+                elif child in self.files:
+                    data, mode, mtime = self.files[child]
+                    result.append((name, 'file', StatResult(stat.S_IFREG | mode, len(data),
+                                                            mtime)))
+        return result
+
+    def walk(self, top):
+        if not self.isdir(top):
+            return
+        names = self.listdir(top)
+        path = posixpath.normpath(posixpath.join('/', top))
+        with self._lock:
+            dirnames = [n for n in names if posixpath.join(path, n) in self.dirs]
+            filenames = [n for n in names if posixpath.join(path, n) in self.files]
+        yield top, dirnames, filenames
+        for name in dirnames:
+            for item in self.walk(posixpath.join(top, name)):
+                yield item
+
+    def mkdir(self, path):
+        path = self._op('mkdir', path)
+        with self._lock:
+            if path in self.dirs or path in self.files:
+                raise _error(errno.EEXIST, path)
+            self._parent_dir(path)
+            self.dirs.add(path)
+
+    def makedirs(self, path, exist_ok=False):
+        path = posixpath.normpath(posixpath.join('/', path))
+        with self._lock:
+            if path in self.dirs:
+                if not exist_ok:
+                    raise _error(errno.EEXIST, path)
+                return
+            parent = posixpath.dirname(path)
+            if parent not in self.dirs:
+                self.makedirs(parent, exist_ok=True)
+            self.mkdir(path)
+
+    def rmdir(self, path):
+        path = self._op('rmdir', path)
+        with self._lock:
+            if path not in self.dirs:
+                raise _error(errno.ENOENT, path)
+            if any(posixpath.dirname(p) == path for p in self.dirs | set(self.files)
+                   if p != path):
+                raise _error(errno.ENOTEMPTY, path)
+            self.dirs.remove(path)
+
+    def unlink(self, path):
+        path = self._op('unlink', path)
+        with self._lock:
+            if path not in self.files:
+                raise _error(errno.EISDIR if path in self.dirs else errno.ENOENT, path)
+            del self.files[path]
+
+    def rmtree(self, path):
+        path = self._op('rmtree', path)
+        with self._lock:
+            if path not in self.dirs:
+                raise _error(errno.ENOENT, path)
+            prefix = path.rstrip('/') + '/'
+            for p in [p for p in self.files if p.startswith(prefix)]:
+                del self.files[p]
+            self.dirs -= set(p for p in self.dirs if p == path or p.startswith(prefix))
+
+    def rename(self, src, dst):
+        src = self._op('rename', src)
+        dst = posixpath.normpath(posixpath.join('/', dst))
+        with self._lock:
+            self._parent_dir(dst)
+            if src in self.files:
+                if dst in self.dirs:
+                    raise _error(errno.EISDIR, dst)
+                self.files[dst] = self.files.pop(src)
+            elif src in self.dirs:
+                if dst in self.files or dst == src or dst.startswith(src + '/'):
+                    raise _error(errno.EINVAL, dst)
+                if dst in self.dirs:
+                    self.rmdir(dst)
+                for p in sorted(p for p in self.dirs if p == src or p.startswith(src + '/')):
+                    self.dirs.remove(p)
+                    self.dirs.add(dst + p[len(src):])
+                for p in [p for p in self.files if p.startswith(src + '/')]:
+                    self.files[dst + p[len(src):]] = self.files.pop(p)
+            else:
+                raise _error(errno.ENOENT, src)
+
+    def chmod(self, path, mode):
+        path = self._op('chmod', path)
+        with self._lock:
+            if path in self.files:
+                self.files[path][1] = mode
+            elif path not in self.dirs:
+                raise _error(errno.ENOENT, path)
+
+    def read_bytes(self, path):
+        path = self._op('read', path)
+        with self._lock:
+            if path not in self.files:
+                raise _error(errno.EISDIR if path in self.dirs else errno.ENOENT, path)
+            return self.files[path][0]
+
+    def write_bytes(self, path, data, mode=None):
+        path = self._op('write', path)
+        with self._lock:
+            if path in self.dirs:
+                raise _error(errno.EISDIR, path)
+            self._parent_dir(path)
+            old_mode = self.files[path][1] if path in self.files else 0o644
+            self.files[path] = [bytes(data), old_mode if mode is None else mode, time.time()]
+
+    def copyfile(self, src, dst):
+        self.write_bytes(dst, self.read_bytes(src))
+
+    def forget(self, path):
+        pass
+
+    def changed(self, path, existed):
+        pass
+
+    def skipped(self, path):
+        pass
+
+
+# the queries which are round trips to the server on a network filesystem
+METADATA_OPS = ('scandir', 'listdir', 'stat', 'exists', 'lexists', 'isfile', 'isdir', 'islink',
+                'access')
+
+
+class _Entry(object):
+
+    __slots__ = ('kind', 'st')
+
+    def __init__(self, kind=None, st=None):
+        # kind None: something may be there, ask
+        self.kind = kind
+        self.st = st
+
+
+class StatCache(object):
+    """
+    Wraps the filesystem `fs` for one operation.  The first query about a
+    path lists its directory (one scandir), and the kinds of all entries
+    found answer the queries about its siblings.  Our own changes update
+    what is remembered; changes by others are only seen after forget().
+
+    Every call passed on to `fs` is counted in `ops` by its name.
+    """
+    def __init__(self, fs):
+        self.fs = fs
+        self.native = fs.native
+        self.ops = Counter()
+        # {dir: {name: _Entry}}, or {dir: None} for a missing directory
+        self._dirs = {}
+        self._lock = threading.RLock()
+
+    def metadata_ops(self):
+        return sum(self.ops[name] for name in METADATA_OPS)
+
+    def _call(self, name, *args):
+        with self._lock:
+            self.ops[name] += 1
+        return getattr(self.fs, name)(*args)
+
+    @staticmethod
+    def _split(path):
+        path = normpath(path)
+        parent = dirname(path)
+        return path, parent, path[len(parent):].lstrip('\\/')
+
+    def _listing(self, path):
+        """
+        Return {name: _Entry} of the directory `path`, None if there is no
+        such directory.
+        """
+        path = normpath(path)
+        with self._lock:
+            if path not in self._dirs:
+                try:
+                    self._dirs[path] = dict((name, _Entry(kind, st))
+                                            for name, kind, st in self._call('scandir', path))
+                except OSError as e:
+                    if e.errno not in (errno.ENOENT, errno.ENOTDIR):
+                        raise
+                    self._dirs[path] = None
+            return self._dirs[path]
+
+    def _entry(self, path):
+        """
+        Return the _Entry of `path`, None if there is nothing.
+        """
+        path, parent, name = self._split(path)
+        if parent == path:
+            # the root of the filesystem, of a drive or of a share
+            return _Entry('dir')
+        with self._lock:
+            try:
+                listing = self._listing(parent)
+            except OSError:
+                # not listable (e.g. no read permission), ask about the path itself
+                return self._resolve(path, _Entry())
+            if listing is None:
+                return None
+            entry = listing.get(name)
+            if entry is not None and entry.kind is None:
+                entry = self._resolve(path, entry)
+                if entry is None:
+                    del listing[name]
+            return entry
+
+    def _resolve(self, path, entry):
+        try:
+            entry.st = self._call('stat', path)
+        except OSError as e:
+            if e.errno not in (errno.ENOENT, errno.ENOTDIR):
+                raise
+            return None
+        if stat.S_ISLNK(entry.st.st_mode):
+            entry.kind = 'link'
+        elif stat.S_ISDIR(entry.st.st_mode):
+            entry.kind = 'dir'
+        else:
+            entry.kind = 'file'
+        return entry
+
+    def _set(self, path, entry):
+        """
+        Remember that `path` now has the _Entry `entry`, or that it is gone
+        (None).  Listings of `path` and below are dropped.
+        """
+        path, parent, name = self._split(path)
+        with self._lock:
+            below = path.rstrip('\\/') + os.sep
+            for d in [d for d in self._dirs if d == path or d.startswith(below)]:
+                del self._dirs[d]
+            listing = self._dirs.get(parent)
+            if listing is not None:
+                if entry is None:
+                    listing.pop(name, None)
+                else:
+                    listing[name] = entry
+
+    def forget(self, path):
+        self._set(path, _Entry())
+
+    def changed(self, path, existed):
+        self.forget(path)
+
+    def skipped(self, path):
+        pass
+
+    # queries
+
+    def lexists(self, path):
+        return self._entry(path) is not None
+
+    def islink(self, path):
+        entry = self._entry(path)
+        return entry is not None and entry.kind == 'link'
+
+    def _follow(self, op, path, kind):
+        entry = self._entry(path)
+        if entry is None:
+            return False
+        if entry.kind == 'link':
+            return self._call(op, path)
+        return kind is None or entry.kind == kind
+
+    def exists(self, path):
+        return self._follow('exists', path, None)
+
+    def isfile(self, path):
+        return self._follow('isfile', path, 'file')
+
+    def isdir(self, path):
+        return self._follow('isdir', path, 'dir')
+
+    def stat(self, path):
+        entry = self._entry(path)
+        if entry is None:
+            raise _error(errno.ENOENT, path)
+        if entry.st is None:
+            entry.st = self._call('stat', path)
+        return entry.st
+
+    def access(self, path, mode):
+        return self._call('access', path, mode)
+
+    def scandir(self, path):
+        listing = self._listing(path)
+        if listing is None:
+            raise _error(errno.ENOENT, path)
+        result = []
+        for name in sorted(listing):
+            entry = self._entry(os.path.join(path, name))
+            if entry is not None:
+                result.append((name, entry.kind, entry.st))
+        return result
+
+    def listdir(self, path):
+        return [name for name, kind, st in self.scandir(path)]
+
+    def walk(self, top):
+        if not self.isdir(top):
+            return
+        entries = self.scandir(top)
+        yield (top, [name for name, kind, st in entries if kind == 'dir'],
+               [name for name, kind, st in entries if kind != 'dir'])
+        for name, kind, st in entries:
+            if kind == 'dir':
+                for item in self.walk(os.path.join(top, name)):
+                    yield item
+
+    def read_bytes(self, path):
+        return self._call('read_bytes', path)
+
+    # changes
+
+    def _changing(self, path, func, entry):
+        """
+        Call func(), after which `path` has `entry`.
+        """
+        try:
+            func()
+        except EnvironmentError:
+            self.forget(path)
+            raise
+        self._set(path, entry)
+
+    def mkdir(self, path):
+        self._changing(path, lambda: self._call('mkdir', path), _Entry('dir'))
+        with self._lock:
+            self._dirs[normpath(path)] = {}
+
+    def makedirs(self, path, exist_ok=False):
+        self._call('makedirs', path, exist_ok)
+        # path and its parents, from the top: what was missing before holds
+        # exactly what we created now
+        chain = [self._split(path)]
+        while chain[-1][1] != chain[-1][0]:
+            chain.append(self._split(chain[-1][1]))
+        chain.reverse()
+        with self._lock:
+            created = False
+            for i, (p, parent, name) in enumerate(chain):
+                child = chain[i + 1][2] if i + 1 < len(chain) else None
+                listing = self._dirs.get(p)
+                if not created and p in self._dirs and listing is None:
+                    created = True
+                if created:
+                    self._dirs[p] = {child: _Entry('dir')} if child else {}
+                elif listing is not None and child is not None and child not in listing:
+                    listing[child] = _Entry('dir')
+                    created = True
+
+    def rmdir(self, path):
+        self._changing(path, lambda: self._call('rmdir', path), None)
+
+    def unlink(self, path):
+        self._changing(path, lambda: self._call('unlink', path), None)
+
+    def rmtree(self, path):
+        self._changing(path, lambda: self._call('rmtree', path), None)
+
+    def rename(self, src, dst):
+        self._changing(src, lambda: self._call('rename', src, dst), None)
+        self.forget(dst)
+
+    def chmod(self, path, mode):
+        self._call('chmod', path, mode)
+        entry = self._entry(path)
+        if entry is not None:
+            entry.st = None
+
+    def write_bytes(self, path, data, mode=None):
+        self._changing(path, lambda: self._call('write_bytes', path, data, mode), _Entry('file'))
+
+    def copyfile(self, src, dst):
+        self._changing(dst, lambda: self._call('copyfile', src, dst), _Entry('file'))
+
+
+class Recorder(object):
+    """
+    Passes everything on to `fs`, and reports the changes made to it:
+    listener(kind, path, size, duration), kind being 'mkdir', 'created' or
+    'updated' (with the size in bytes and the seconds the write took, if
+    known), 'removed' or 'skipped'.
+    """
+    def __init__(self, fs, listener):
+        self.fs = fs
+        self.native = fs.native
+        self._listener = listener
+
+    def __getattr__(self, name):
+        # the queries
+        return getattr(self.fs, name)
+
+    def _timed(self, path, size, func, *args):
+        kind = 'updated' if self.fs.lexists(path) else 'created'
+        start = time.time()
+        func(*args)
+        elapsed = time.time() - start
+        if size is None:
+            size = self.fs.stat(path).st_size
+        self._listener(kind, path, size, elapsed)
+
+    def mkdir(self, path):
+        self.fs.mkdir(path)
+        self._listener('mkdir', path, None, None)
+
+    def makedirs(self, path, exist_ok=False):
+        existed = self.fs.isdir(path)
+        self.fs.makedirs(path, exist_ok)
+        if not existed:
+            self._listener('mkdir', path, None, None)
+
+    def rmdir(self, path):
+        self.fs.rmdir(path)
+        self._listener('removed', path, None, None)
+
+    def unlink(self, path):
+        self.fs.unlink(path)
+        self._listener('removed', path, None, None)
+
+    def rmtree(self, path):
+        self.fs.rmtree(path)
+        self._listener('removed', path, None, None)
+
+    def rename(self, src, dst):
+        # (into the trash, see trash.py)
+        self.fs.rename(src, dst)
+        self._listener('removed', src, None, None)
+
+    def write_bytes(self, path, data, mode=None):
+        self._timed(path, len(data), self.fs.write_bytes, path, data, mode)
+
+    def copyfile(self, src, dst):
+        self._timed(dst, None, self.fs.copyfile, src, dst)
+
+    def changed(self, path, existed):
+        self.fs.changed(path, existed)
+        self._listener('updated' if existed else 'created', path,
+                       self.fs.stat(path).st_size, None)
+
+    def skipped(self, path):
+        self.fs.skipped(path)
+        self._listener('skipped', path, None, None)
+
+
+os_fs = OSFileSystem()
@@ -0,0 +1,169 @@
+# Copyright (c) 2013-2017 Continuum Analytics, Inc.
+# All rights reserved.
+"""
+Per-prefix launch profile used by the shortcut launchers.
+
+cwp.py wraps shortcuts so they run with the environment's PATH entries and
+CONDA_PREFIX set.  Working those out (and asking the shell for the Documents
+folder) on every click is slow, so they are computed once at install time
+and written to PREFIX/etc/menuinst/launch.json, which cwp.py reads with
+nothing but the standard library.  The profile also holds the activation
+snapshot (see activation.py), which on Linux and OS X is applied by the
+generated PREFIX/etc/menuinst/launch.sh instead.
+
+Both files are written for the launchers to read, so on the real filesystem;
+`fs` (see fs.py) is told about them, which is how they show up in the
+results of an install.  They are shared by the menus of the prefix, each of
+which leaves an empty file in PREFIX/etc/menuinst/menus while installed; the
+removal of the last one removes them.
+"""
+from __future__ import absolute_import
+
+import json
+import os
+import sys
+import threading
+from os.path import dirname, join
+from urllib.parse import quote
+
+from . import activation
+from .fs import os_fs
+from .utils import rm_empty_dir, rm_rf
+
+
+PROFILE_VERSION = 1
+# keep in sync with cwp.py
+PROFILE_PATH = join('etc', 'menuinst', 'launch.json')
+LAUNCHER_PATH = join('etc', 'menuinst', 'launch.sh')
+MENUS_PATH = join('etc', 'menuinst', 'menus')
+
+
+def profile_path(prefix):
+    return join(prefix, PROFILE_PATH)
+
+
+def launcher_path(prefix):
+    return join(prefix, LAUNCHER_PATH)
+
+
+def menu_marker_path(prefix, name):
+    return join(prefix, MENUS_PATH, quote(name, safe=''))
+
+
+def path_entries(prefix):
+    return [prefix,
+            join(prefix, "Library", "mingw-w64", "bin"),
+            join(prefix, "Library", "usr", "bin"),
+            join(prefix, "Library", "bin"),
+            join(prefix, "Scripts")]
+
+
+def make_profile(prefix, cwd=None, snapshot=None):
+    """
+    `cwd` may contain environment variables (e.g. %USERPROFILE%), which are
+    expanded by the launcher.
+    """
+    return {
+        'version': PROFILE_VERSION,
+        'prefix': prefix,
+        'path': path_entries(prefix),
+        'env': {'CONDA_PREFIX': prefix},
+        'cwd': cwd,
+        'activation': snapshot,
+    }
+
+
+def read_profile(prefix):
+    try:
+        with open(profile_path(prefix)) as fi:
+            profile = json.load(fi)
+    except (IOError, OSError, ValueError):
+        return None
+    if profile.get('version') != PROFILE_VERSION:
+        return None
+    return profile
+
+
+def write_profile(prefix, profile, fs=os_fs):
+    """
+    Write the launch profile of `prefix`, unless it already is up to date.
+    Returns True when the file was written.
+    """
+    if read_profile(prefix) == profile:
+        fs.skipped(profile_path(prefix))
+        return False
+    # the launcher may be reading it right now, hence the atomic replace
+    _write_file(profile_path(prefix), json.dumps(profile, indent=2, sort_keys=True), fs=fs)
+    return True
+
+
+def _write_file(path, data, mode=None, fs=os_fs):
+    if not fs.isdir(dirname(path)):
+        fs.makedirs(dirname(path), exist_ok=True)
+    existed = fs.lexists(path)
+    tmp_path = '%s.%d.%d.tmp' % (path, os.getpid(), threading.current_thread().ident)
+    with open(tmp_path, 'w') as fo:
+        fo.write(data)
+    if mode is not None:
+        os.chmod(tmp_path, mode)
+    os.replace(tmp_path, path)
+    fs.changed(path, existed)
+
+
+def update(prefix, root_prefix, cwd=None, snapshot=None, fs=os_fs):
+    """
+    Bring the launch profile of `prefix` up to date, capturing the activation
+    again if it changed since last time (unless the caller captured it: see
+    `snapshot`).  Returns the profile.
+    """
+    stored = read_profile(prefix)
+    if snapshot is None:
+        snapshot = activation.current_snapshot(prefix, root_prefix,
+                                               stored and stored.get('activation'))
+    profile = make_profile(prefix, cwd, snapshot)
+    written = write_profile(prefix, profile, fs)
+    if sys.platform == 'win32':
+        return profile
+    launcher = launcher_path(prefix)
+    if not written:
+        # the launcher is rendered from the profile
+        if fs.lexists(launcher):
+            fs.skipped(launcher)
+    elif snapshot:
+        _write_file(launcher, activation.render_posix_launcher(snapshot, prefix, root_prefix),
+                    0o755, fs)
+    elif fs.lexists(launcher):
+        fs.unlink(launcher)
+    return profile
+
+
+def add_menu(prefix, name, fs=os_fs):
+    """
+    Record that the menu `name` of `prefix` runs its shortcuts through the
+    launch profile (see remove_menu()).
+    """
+    path = menu_marker_path(prefix, name)
+    if fs.lexists(path):
+        fs.skipped(path)
+        return
+    if not fs.isdir(dirname(path)):
+        fs.makedirs(dirname(path), exist_ok=True)
+    fs.write_bytes(path, b'')
+
+
+def remove_menu(prefix, name, fs=os_fs):
+    """
+    Forget about the menu `name` of `prefix`; when it was the last menu of
+    the prefix, the launch profile and launcher go as well.  Returns True
+    when they did.
+    """
+    path = menu_marker_path(prefix, name)
+    rm_rf(path, fs)
+    menus_dir = dirname(path)
+    if fs.isdir(menus_dir) and fs.listdir(menus_dir):
+        return False
+    for path in profile_path(prefix), launcher_path(prefix):
+        rm_rf(path, fs)
+    rm_empty_dir(menus_dir, fs)
+    rm_empty_dir(dirname(menus_dir), fs)
+    return True
@@ -8,34 +8,19 @@ menus on systems that follow the format of the Desktop Entry Specification
 by freedesktop.org.  See:
     http://freedesktop.org/Standards/desktop-entry-spec
 """
+import io
 import re
-import os
-import shutil
 import sys
 import time
 import xml.etree.ElementTree as ET
-from os.path import abspath, dirname, exists, expanduser, isdir, isfile, join
+from os.path import basename, dirname, isfile, join
 
-from utils import rm_rf, get_executable
-from freedesktop import make_desktop_entry, make_directory_entry
-
-
-# datadir: contains the desktop and directory entries
-# confdir: contains the XML menu files
-sys_menu_file = '/etc/xdg/menus/applications.menu'
-if os.getuid() == 0:
-    mode = 'system'
-    datadir = '/usr/share'
-    confdir = '/etc/xdg'
-else:
-    mode = 'user'
-    datadir = os.environ.get('XDG_DATA_HOME',
-                             abspath(expanduser('~/.local/share')))
-    confdir = os.environ.get('XDG_CONFIG_HOME',
-                             abspath(expanduser('~/.config')))
-
-appdir = join(datadir, 'applications')
-menu_file = join(confdir, 'menus/applications.menu')
+from .utils import rm_rf, get_executable
+from .cache import cache_for, make_key
+from .context import InstallContext
+from .filetree import File
+from .freedesktop import desktop_command, desktop_entry, make_directory_entry
+from .launch import add_menu, launcher_path, remove_menu, update as update_launch_profile
 
 
 def indent(elem, level=0):
@@ -69,100 +54,128 @@ def add_child(parent, tag, text=None):
     return elem
 
 
-def is_valid_menu_file():
+def read_menu_file(context):
+    return ET.ElementTree(ET.fromstring(context.fs.read_bytes(context.menu_file)))
+
+
+def is_valid_menu_file(context):
     try:
-        root = ET.parse(menu_file).getroot()
+        root = read_menu_file(context).getroot()
         assert root is not None and root.tag == 'Menu'
         return True
     except:
         return False
 
 
-def write_menu_file(tree):
+def write_menu_file(context, tree):
     indent(tree.getroot())
-    fo = open(menu_file, 'w')
+    fo = io.StringIO()
     fo.write("""\
 <!DOCTYPE Menu PUBLIC '-//freedesktop//DTD Menu 1.0//EN'
   'http://standards.freedesktop.org/menu-spec/menu-1.0.dtd'>
 """)
-    tree.write(fo)
+    tree.write(fo, encoding='unicode')
     fo.write('\n')
-    fo.close()
+    context.fs.write_bytes(context.menu_file, fo.getvalue().encode('utf-8'))
 
 
-def ensure_menu_file():
+def ensure_menu_file(context):
+    fs = context.fs
+    menu_file = context.menu_file
     # ensure any existing version is a file
-    if exists(menu_file) and not isfile(menu_file):
-        rm_rf(menu_file)
+    if fs.exists(menu_file) and not fs.isfile(menu_file):
+        rm_rf(menu_file, fs)
 
     # ensure any existing file is actually a menu file
-    if isfile(menu_file):
+    if fs.isfile(menu_file):
         # make a backup of the menu file to be edited
         cur_time = time.strftime('%Y-%m-%d_%Hh%Mm%S')
         backup_menu_file = "%s.%s" % (menu_file, cur_time)
-        shutil.copyfile(menu_file, backup_menu_file)
+        fs.copyfile(menu_file, backup_menu_file)
 
-        if not is_valid_menu_file():
-            os.remove(menu_file)
+        if not is_valid_menu_file(context):
+            fs.unlink(menu_file)
 
     # create a new menu file if one doesn't yet exist
-    if not isfile(menu_file):
-        fo = open(menu_file, 'w')
-        if mode == 'user':
-            merge = '<MergeFile type="parent">%s</MergeFile>' % sys_menu_file
+    if not fs.isfile(menu_file):
+        if context.mode == 'user':
+            merge = '<MergeFile type="parent">%s</MergeFile>' % context.sys_menu_file
         else:
             merge = ''
-        fo.write("<Menu><Name>Applications</Name>%s</Menu>\n" % merge)
-        fo.close()
+        fs.write_bytes(menu_file,
+                       ("<Menu><Name>Applications</Name>%s</Menu>\n" % merge).encode('utf-8'))
 
 
 class Menu(object):
 
-    def __init__(self, name, prefix, env_name, mode=None):
+    def __init__(self, name, prefix, env_name, mode=None, root_prefix=sys.prefix,
+                 context=None):
+        self.context = context or InstallContext.current()
+        self.fs = self.context.fs
         self.name = name
         self.name_ = name + '_'
         self.entry_fn = '%s.directory' % self.name
-        self.entry_path = join(datadir, 'desktop-directories', self.entry_fn)
+        self.entry_path = join(self.context.directory_dir, self.entry_fn)
         self.prefix = prefix
         self.env_name = env_name
+        self.root_prefix = root_prefix
+        self.launcher = None
+        # the cache (and what is cloned from it) has to be on the real filesystem;
+        # a staged install gets files of its own, not clones from the cache of
+        # the host it is built on
+        if self.fs.native and not self.context.destdir:
+            self.cache = cache_for(root_prefix)
+        else:
+            self.cache = None
 
     def create(self):
         self._create_dirs()
         self._create_directory_entry()
-        if is_valid_menu_file() and self._has_this_menu():
-            return
-        ensure_menu_file()
-        self._add_this_menu()
+        self.prepare()
+        with self.context.lock:
+            # other installs may have changed the menu file
+            self.fs.forget(self.context.menu_file)
+            if is_valid_menu_file(self.context) and self._has_this_menu():
+                self.fs.skipped(self.context.menu_file)
+                return
+            ensure_menu_file(self.context)
+            self._add_this_menu()
 
     def remove(self):
-        rm_rf(self.entry_path)
-        for fn in os.listdir(appdir):
-            if fn.startswith(self.name_):
-                # found one shortcut, so don't remove the name from menu
-                return
-        self._remove_this_menu()
+        # (reconcile.py removes menus no prefix installs any more)
+        if self.prefix is not None and self._launches():
+            remove_menu(self.prefix, self.name, self.fs)
+        rm_rf(self.entry_path, self.fs)
+        with self.context.lock:
+            # other installs may have added shortcuts of this menu
+            self.fs.forget(self.context.appdir)
+            for fn in self.fs.listdir(self.context.appdir):
+                if fn.startswith(self.name_):
+                    # found one shortcut, so don't remove the name from menu
+                    return
+            self._remove_this_menu()
 
     def _remove_this_menu(self):
-        tree = ET.parse(menu_file)
+        tree = read_menu_file(self.context)
         root = tree.getroot()
         for elt in root.findall('Menu'):
             if elt.find('Name').text == self.name:
                 root.remove(elt)
-        write_menu_file(tree)
+        write_menu_file(self.context, tree)
 
     def _has_this_menu(self):
-        root = ET.parse(menu_file).getroot()
+        root = read_menu_file(self.context).getroot()
         return any(e.text == self.name for e in root.findall('Menu/Name'))
 
     def _add_this_menu(self):
-        tree = ET.parse(menu_file)
+        tree = read_menu_file(self.context)
         root = tree.getroot()
         menu_elt = add_child(root, 'Menu')
         add_child(menu_elt, 'Name', self.name)
         add_child(menu_elt, 'Directory', self.entry_fn)
         inc_elt = add_child(menu_elt, 'Include')
         add_child(inc_elt, 'Category', self.name)
-        write_menu_file(tree)
+        write_menu_file(self.context, tree)
 
     def _create_directory_entry(self):
         # Create the menu resources.  Note that the .directory files all go
@@ -175,27 +188,51 @@ class Menu(object):
                 d['icon'] = icon_path
         except ImportError:
             pass
-        make_directory_entry(d)
+        make_directory_entry(d, self.fs)
+
+    def prepare(self):
+        """
+        What the shortcuts of this prefix need when the menu itself was
+        already created (by another process).
+        """
+        self._update_launcher()
+
+    def _launches(self):
+        # a staged prefix (or one not on the real filesystem) cannot be
+        # activated, so its shortcuts run as is
+        return self.fs.native and not self.context.destdir
+
+    def _update_launcher(self):
+        # shortcuts run through the prefix's launcher, which applies the
+        # activation captured here instead of activating on every launch
+        if not self._launches():
+            return
+        add_menu(self.prefix, self.name, self.fs)
+        profile = update_launch_profile(self.prefix, self.root_prefix, fs=self.fs)
+        if profile['activation']:
+            self.launcher = launcher_path(self.prefix)
 
     def _create_dirs(self):
         # Ensure the three directories we're going to write menu and shortcut
         # resources to all exist.
-        for dir_path in [dirname(menu_file),
+        for dir_path in [dirname(self.context.menu_file),
                          dirname(self.entry_path),
-                         appdir]:
-            if not isdir(dir_path):
-                os.makedirs(dir_path)
+                         self.context.appdir]:
+            if not self.fs.isdir(dir_path):
+                # other threads may be creating them as well
+                self.fs.makedirs(dir_path, exist_ok=True)
 
 
 class ShortCut(object):
 
     fn_pat = re.compile(r'[\w.-]+$')
 
-    def __init__(self, menu, shortcut, env_setup_cmd):
+    def __init__(self, menu, shortcut, env_setup_cmd=None):
         # note that this is the path WITHOUT extension
         fn = menu.name_ + shortcut['id']
         assert self.fn_pat.match(fn)
-        self.path = join(appdir, fn)
+        self.appdir = menu.context.appdir
+        self.path = join(self.appdir, fn)
         shortcut['categories'] = menu.name
         self.shortcut = shortcut
         for var_name in ('name', 'cmd'):
@@ -205,50 +242,65 @@ class ShortCut(object):
         self.prefix = menu.prefix if menu.prefix is not None else sys.prefix
         self.env_name = menu.env_name
         self.env_setup_cmd = env_setup_cmd
-
-
-    def create(self):
+        self.launcher = menu.launcher
+        self.cache = menu.cache
+        self.fs = menu.fs
+
+    def create(self, deferred=None):
+        """
+        `deferred`, if given, is a list the (function, args) of what can be
+        done later are appended to (see progress.py): the KDE entry.
+        """
         self._install_desktop_entry('gnome')
-        self._install_desktop_entry('kde')
+        if deferred is None:
+            self._install_desktop_entry('kde')
+        else:
+            deferred.append((self._install_desktop_entry, ('kde',)))
 
     def remove(self):
         for ext in ('.desktop', 'KDE.desktop'):
             path = self.path + ext
-            rm_rf(path)
+            rm_rf(path, self.fs)
 
     def _install_desktop_entry(self, tp):
-        # Handle the special placeholders in the specified command.  For a
-        # filebrowser request, we simply used the passed filebrowser.  But
-        # for a webbrowser request, we invoke the Python standard lib's
-        # webbrowser script so we can force the url(s) to open in new tabs.
         spec = self.shortcut.copy()
         spec['tp'] = tp
 
         path = self.path
         if tp == 'gnome':
-            filebrowser = 'gnome-open'
             path += '.desktop'
         elif tp == 'kde':
-            filebrowser = 'kfmclient openURL'
             path += 'KDE.desktop'
 
-        cmd = self.cmd
-        if cmd[0] == '{{FILEBROWSER}}':
-            cmd[0] = filebrowser
-        elif cmd[0] == '{{WEBBROWSER}}':
-            import webbrowser
-            executable = get_executable(self.prefix)
-            cmd[0:1] = [executable, webbrowser.__file__, '-t']
+        import webbrowser
+        cmd = desktop_command(self.cmd, tp,
+                              [get_executable(self.prefix), webbrowser.__file__, '-t'])
+        if self.launcher:
+            cmd[0:0] = ['/bin/bash', self.launcher]
 
         spec['cmd'] = cmd
         spec['path'] = path
 
-        # create the shortcuts
-        make_desktop_entry(spec)
+        # create the shortcuts, cloned from the cache: the entries of
+        # environments with the same spec share one blob
+        fn = basename(path)
+
+        def render():
+            return {fn: File(desktop_entry(dict(spec)).encode('utf-8'))}
+
+        if self.cache is None:
+            data = render()[fn].read()
+            if self.fs.isfile(path) and self.fs.read_bytes(path) == data:
+                self.fs.skipped(path)
+            else:
+                self.fs.write_bytes(path, data)
+            return
+        self.cache.apply(make_key('linux', spec), render,
+                         lambda files: self.cache.install(files, self.appdir, self.fs))
 
 
 if __name__ == '__main__':
-    rm_rf(menu_file)
+    rm_rf(InstallContext.current().menu_file)
     Menu('Foo').create()
     Menu('Bar').create()
     Menu('Foo').remove()
@@ -0,0 +1,309 @@
+# Copyright (c) 2013-2017 Continuum Analytics, Inc.
+# All rights reserved.
+"""
+Pure Python reader and writer for Windows Shell Link (.lnk) files.  See:
+    https://docs.microsoft.com/en-us/openspecs/windows_protocols/ms-shllink
+
+Only the fields menuinst writes through winshortcut.create_shortcut() are
+handled (target, description, arguments, working directory and icon), which
+is enough to tell whether an existing shortcut already is what we would write,
+and to write one without the Windows shell (see render.py).  This module does
+not depend on any Windows API, so it can be used (and tested) on any platform.
+"""
+from __future__ import absolute_import, unicode_literals
+
+import os
+import struct
+import sys
+from os.path import join
+
+from .fs import os_fs
+
+
+HEADER_SIZE = 0x4C
+LINK_CLSID = b'\x01\x14\x02\x00\x00\x00\x00\x00\xc0\x00\x00\x00\x00\x00\x00\x46'
+
+# LinkFlags
+HAS_LINK_TARGET_ID_LIST = 0x00000001
+HAS_LINK_INFO = 0x00000002
+HAS_NAME = 0x00000004
+HAS_RELATIVE_PATH = 0x00000008
+HAS_WORKING_DIR = 0x00000010
+HAS_ARGUMENTS = 0x00000020
+HAS_ICON_LOCATION = 0x00000040
+IS_UNICODE = 0x00000080
+HAS_EXP_STRING = 0x00000200
+HAS_EXP_ICON = 0x00004000
+
+# LinkInfoFlags
+VOLUME_ID_AND_LOCAL_BASE_PATH = 0x1
+COMMON_NETWORK_RELATIVE_LINK_AND_PATH_SUFFIX = 0x2
+
+# ExtraData block signatures
+ENVIRONMENT_VARIABLE_DATA_BLOCK = 0xA0000001
+ICON_ENVIRONMENT_DATA_BLOCK = 0xA0000007
+ENVIRONMENT_DATA_BLOCK_SIZE = 0x314
+
+SW_SHOWNORMAL = 1
+DRIVE_FIXED = 3
+
+ANSI_CODEC = 'mbcs' if sys.platform == 'win32' else 'cp1252'
+
+
+class LnkError(ValueError):
+    pass
+
+
+class ShellLink(object):
+    """
+    The interesting bits of a parsed .lnk file.  `target` is the unexpanded
+    target when the link was created from a path containing environment
+    variables (e.g. %windir%\\system32\\cmd.exe), like Windows itself stores it.
+    """
+    def __init__(self, target='', description='', arguments='', workdir='',
+                 icon='', icon_index=0, relative_path=''):
+        self.target = target
+        self.description = description
+        self.arguments = arguments
+        self.workdir = workdir
+        self.icon = icon
+        self.icon_index = icon_index
+        self.relative_path = relative_path
+
+    def __repr__(self):
+        return ('ShellLink(target=%r, description=%r, arguments=%r, workdir=%r, icon=%r)'
+                % (self.target, self.description, self.arguments, self.workdir, self.icon))
+
+    def matches(self, target, description='', arguments='', workdir='', icon=''):
+        """
+        Does this link have the given fields?  Paths are compared the way
+        Windows would resolve them: case-insensitive, ignoring surrounding
+        quotes and slash direction.
+        """
+        return (_norm_path(self.target) == _norm_path(target) and
+                self.description == description and
+                self.arguments == arguments and
+                _norm_path(self.workdir) == _norm_path(workdir) and
+                _norm_path(self.icon) == _norm_path(icon))
+
+    def to_bytes(self):
+        """
+        Serialize the link like the shell does for a link created with
+        IShellLink: targets and icons containing environment variables are
+        stored unexpanded in an extra data block as well.
+        """
+        flags = HAS_LINK_INFO | IS_UNICODE
+        strings = b''
+        for flag, value in ((HAS_NAME, self.description),
+                            (HAS_RELATIVE_PATH, self.relative_path),
+                            (HAS_WORKING_DIR, self.workdir),
+                            (HAS_ARGUMENTS, self.arguments),
+                            (HAS_ICON_LOCATION, self.icon)):
+            if value:
+                flags |= flag
+                strings += _string_data(value)
+
+        extra = b''
+        if '%' in self.target:
+            flags |= HAS_EXP_STRING
+            extra += _environment_block(ENVIRONMENT_VARIABLE_DATA_BLOCK, self.target)
+        if '%' in self.icon:
+            flags |= HAS_EXP_ICON
+            extra += _environment_block(ICON_ENVIRONMENT_DATA_BLOCK, self.icon)
+        extra += struct.pack('<I', 0)  # TerminalBlock
+
+        header = struct.pack('<I16s2I24xIiI12x', HEADER_SIZE, LINK_CLSID, flags, 0, 0,
+                             self.icon_index, SW_SHOWNORMAL)
+        return header + _link_info(self.target) + strings + extra
+
+
+def _norm_path(path):
+    return (path or '').strip().strip('"').replace('/', '\\').lower()
+
+
+def _cstring(data, offset, unicode_):
+    if unicode_:
+        end = offset
+        while data[end:end + 2] not in (b'\x00\x00', b''):
+            end += 2
+        return data[offset:end].decode('utf-16-le')
+    end = data.find(b'\x00', offset)
+    if end < 0:
+        end = len(data)
+    return data[offset:end].decode(ANSI_CODEC, 'replace')
+
+
+def _string_data(value):
+    encoded = value.encode('utf-16-le')
+    return struct.pack('<H', len(encoded) // 2) + encoded
+
+
+def _environment_block(signature, value):
+    return (struct.pack('<2I', ENVIRONMENT_DATA_BLOCK_SIZE, signature) +
+            value.encode(ANSI_CODEC, 'replace')[:259].ljust(260, b'\x00') +
+            value.encode('utf-16-le')[:518].ljust(520, b'\x00'))
+
+
+def _link_info(target):
+    # a LinkInfo with a (dummy) fixed volume and the target as local base path
+    header_size = 0x24
+    volume_id = struct.pack('<4I', 17, DRIVE_FIXED, 0, 16) + b'\x00'
+    base = target.encode(ANSI_CODEC, 'replace') + b'\x00'
+    base_uni = target.encode('utf-16-le') + b'\x00\x00'
+    base_off = header_size + len(volume_id)
+    suffix_off = base_off + len(base)
+    base_uni_off = suffix_off + 1
+    suffix_uni_off = base_uni_off + len(base_uni)
+    size = suffix_uni_off + 2
+    return (struct.pack('<9I', size, header_size, VOLUME_ID_AND_LOCAL_BASE_PATH, header_size,
+                        base_off, 0, suffix_off, base_uni_off, suffix_uni_off) +
+            volume_id + base + b'\x00' + base_uni + b'\x00\x00')
+
+
+def _parse_link_info(data, pos):
+    (size, header_size, flags, _, base_off, network_off,
+     suffix_off) = struct.unpack_from('<7I', data, pos)
+    base_uni_off = suffix_uni_off = 0
+    if header_size >= 0x24:
+        base_uni_off, suffix_uni_off = struct.unpack_from('<2I', data, pos + 28)
+
+    if suffix_uni_off:
+        suffix = _cstring(data, pos + suffix_uni_off, True)
+    else:
+        suffix = _cstring(data, pos + suffix_off, False)
+
+    target = ''
+    if flags & VOLUME_ID_AND_LOCAL_BASE_PATH:
+        if base_uni_off:
+            target = _cstring(data, pos + base_uni_off, True)
+        else:
+            target = _cstring(data, pos + base_off, False)
+    elif flags & COMMON_NETWORK_RELATIVE_LINK_AND_PATH_SUFFIX:
+        net = pos + network_off
+        net_name_off, = struct.unpack_from('<I', data, net + 8)
+        if net_name_off > 0x14:
+            net_name_uni_off, = struct.unpack_from('<I', data, net + 20)
+            target = _cstring(data, net + net_name_uni_off, True)
+        else:
+            target = _cstring(data, net + net_name_off, False)
+        if suffix:
+            target += '\\'
+    return size, target + suffix
+
+
+def _parse_string_data(data, pos, unicode_):
+    count, = struct.unpack_from('<H', data, pos)
+    pos += 2
+    if unicode_:
+        end = pos + 2 * count
+        value = data[pos:end].decode('utf-16-le')
+    else:
+        end = pos + count
+        value = data[pos:end].decode(ANSI_CODEC, 'replace')
+    if end > len(data):
+        raise LnkError("truncated StringData")
+    return value, end
+
+
+def _parse_extra_data(data, pos):
+    blocks = {}
+    while pos + 8 <= len(data):
+        size, signature = struct.unpack_from('<2I', data, pos)
+        if size < 4:
+            break
+        if signature in (ENVIRONMENT_VARIABLE_DATA_BLOCK, ICON_ENVIRONMENT_DATA_BLOCK):
+            value = _cstring(data, pos + 268, True) or _cstring(data, pos + 8, False)
+            blocks[signature] = value
+        pos += size
+    return blocks
+
+
+def parse_lnk(data):
+    """
+    Parse the bytes of a .lnk file and return a ShellLink, or raise LnkError.
+    """
+    if len(data) < HEADER_SIZE:
+        raise LnkError("too short for a shell link header")
+    header_size, = struct.unpack_from('<I', data, 0)
+    if header_size != HEADER_SIZE or data[4:20] != LINK_CLSID:
+        raise LnkError("not a shell link")
+    flags, = struct.unpack_from('<I', data, 20)
+    icon_index, = struct.unpack_from('<i', data, 56)
+    unicode_ = bool(flags & IS_UNICODE)
+    try:
+        pos = HEADER_SIZE
+        if flags & HAS_LINK_TARGET_ID_LIST:
+            id_list_size, = struct.unpack_from('<H', data, pos)
+            pos += 2 + id_list_size
+
+        target = ''
+        if flags & HAS_LINK_INFO:
+            size, target = _parse_link_info(data, pos)
+            pos += size
+
+        strings = {}
+        for flag in (HAS_NAME, HAS_RELATIVE_PATH, HAS_WORKING_DIR,
+                     HAS_ARGUMENTS, HAS_ICON_LOCATION):
+            if flags & flag:
+                strings[flag], pos = _parse_string_data(data, pos, unicode_)
+
+        blocks = _parse_extra_data(data, pos)
+    except struct.error as e:
+        raise LnkError("truncated shell link: %s" % e)
+    except (UnicodeDecodeError, IndexError) as e:
+        # a string cut short, or offsets pointing nowhere
+        raise LnkError("corrupt shell link: %s" % e)
+
+    return ShellLink(
+        target=blocks.get(ENVIRONMENT_VARIABLE_DATA_BLOCK) or target,
+        description=strings.get(HAS_NAME, ''),
+        arguments=strings.get(HAS_ARGUMENTS, ''),
+        workdir=strings.get(HAS_WORKING_DIR, ''),
+        icon=blocks.get(ICON_ENVIRONMENT_DATA_BLOCK) or strings.get(HAS_ICON_LOCATION, ''),
+        icon_index=icon_index,
+        relative_path=strings.get(HAS_RELATIVE_PATH, ''),
+    )
+
+
+def read_lnk(path, fs=os_fs):
+    return parse_lnk(fs.read_bytes(path))
+
+
+def write_lnk(path, link, fs=os_fs):
+    fs.write_bytes(path, link.to_bytes())
+
+
+def link_matches(path, target, description='', arguments='', workdir='', icon='',
+                 fs=os_fs):
+    """
+    Return True if `path` is an existing shell link with exactly these fields,
+    in which case there is no need to write it again.  Anything unreadable is
+    treated as different.
+    """
+    try:
+        link = read_lnk(path, fs)
+    except (IOError, OSError, LnkError):
+        return False
+    return link.matches(target, description, arguments, workdir, icon)
+
+
+def audit(folder):
+    """
+    Walk `folder` (e.g. a Start Menu directory) and yield (path, ShellLink)
+    for every .lnk file found.  Links that cannot be parsed are yielded with
+    the LnkError instead of a ShellLink.
+    """
+    try:
+        entries = list(os.scandir(folder))
+    except OSError:
+        return
+    for entry in entries:
+        path = join(folder, entry.name)
+        if entry.is_dir(follow_symlinks=False):
+            for item in audit(path):
+                yield item
+        elif entry.name.lower().endswith('.lnk'):
+            try:
+                yield path, read_lnk(path)
+            except (IOError, OSError, LnkError) as e:
+                yield path, e
@@ -1,14 +1,272 @@
+import json
+import os
 import sys
 from os.path import join
 
 import menuinst
 
 
-def main():
+def render_main(argv):
     from optparse import OptionParser
+    from menuinst.render import TARGETS, render
 
     p = OptionParser(
-        usage="usage: %prog [options] MENU_FILE",
+        usage="usage: %prog render [options] MENU_FILE",
+        description="render the files a menu installs on TARGET, with "
+                    "placeholders for the prefixes")
+
+    p.add_option('--target',
+                 type="choice",
+                 choices=list(TARGETS))
+
+    p.add_option('--prefix-placeholder',
+                 action="store",
+                 help="default: /opt/anaconda1anaconda2anaconda3, or "
+                      "C:\\anaconda1anaconda2anaconda3 for win")
+
+    p.add_option('--root-prefix-placeholder',
+                 action="store")
+
+    p.add_option('--env-name',
+                 action="store")
+
+    p.add_option('--source-prefix',
+                 action="store",
+                 help="where the menu's icons are read from "
+                      "(default: the prefix MENU_FILE is in)")
+
+    p.add_option('-o', '--output',
+                 action="store",
+                 default='.')
+
+    opts, args = p.parse_args(argv)
+    if not opts.target or len(args) != 1:
+        p.error("--target and exactly one MENU_FILE are required")
+
+    for relpath in render(args[0], opts.target, opts.output, opts.prefix_placeholder,
+                          opts.root_prefix_placeholder, opts.env_name, opts.source_prefix):
+        sys.stdout.write("%s\n" % relpath)
+
+
+def gc_main(argv):
+    from optparse import OptionParser
+    from menuinst.cache import cache_for
+
+    p = OptionParser(
+        usage="usage: %prog gc [options]",
+        description="evict least recently used shortcuts from the cache "
+                    "of the root prefix")
+
+    p.add_option('--root-prefix',
+                 action="store",
+                 default=sys.prefix)
+
+    p.add_option('--max-size',
+                 action="store",
+                 type="int",
+                 help="in bytes, 0 to empty the cache")
+
+    opts, args = p.parse_args(argv)
+
+    cache = cache_for(opts.root_prefix)
+    evicted = cache.gc(opts.max_size)
+    sys.stdout.write("%s: evicted %d entries, %d bytes left\n"
+                     % (cache.root, len(evicted), cache.size()))
+
+
+def relocate_main(argv):
+    from optparse import OptionParser
+    from menuinst.relocate import DEFAULT_JOBS, relocate
+
+    p = OptionParser(
+        usage="usage: %prog relocate [options] OLD_PREFIX NEW_PREFIX",
+        description="patch the installed shortcuts of a prefix which was "
+                    "moved from OLD_PREFIX to NEW_PREFIX")
+
+    p.add_option('--root',
+                 action="append",
+                 dest="roots",
+                 help="folder to look for shortcuts in (repeatable, default: "
+                      "where this platform installs them)")
+
+    p.add_option('-j', '--jobs',
+                 action="store",
+                 type="int",
+                 default=DEFAULT_JOBS)
+
+    opts, args = p.parse_args(argv)
+    if len(args) != 2:
+        p.error("OLD_PREFIX and NEW_PREFIX are required")
+
+    results = relocate(args[0], args[1], opts.roots, opts.jobs)
+    for r in results:
+        if r.status == 'error':
+            sys.stdout.write("%s: error: %s\n" % (r.path, r.detail))
+        else:
+            sys.stdout.write("%s: %s\n" % (r.path, r.status))
+    if any(r.status == 'error' for r in results):
+        return 1
+
+
+def fleet_main(argv):
+    from optparse import OptionParser
+    from menuinst.fleet import fleet
+
+    p = OptionParser(
+        usage="usage: %prog fleet [options]",
+        description="install (or remove) the menus of all environments of "
+                    "the root prefix, and of those in ~/.conda/environments.txt")
+
+    p.add_option('--root-prefix',
+                 action="store",
+                 default=sys.prefix)
+
+    p.add_option('--remove',
+                 action="store_true")
+
+    p.add_option('--environments-txt',
+                 action="store",
+                 help="the list of other environments "
+                      "(default: ~/.conda/environments.txt)")
+
+    p.add_option('-j', '--jobs',
+                 action="store",
+                 type="int",
+                 help="number of processes (default: one per CPU)")
+
+    opts, args = p.parse_args(argv)
+
+    results = fleet(opts.root_prefix, opts.remove, opts.jobs,
+                    environments_txt=opts.environments_txt)
+    for r in results:
+        if r.status == 'error':
+            sys.stdout.write("%s: error: %s\n" % (r.path, r.detail.splitlines()[0]))
+        else:
+            sys.stdout.write("%s: %s\n" % (r.path, r.status))
+    errors = sum(r.status == 'error' for r in results)
+    sys.stdout.write("%d menus in %d environments, %d errors\n"
+                     % (len(results), len(set(r.prefix for r in results)), errors))
+    if errors:
+        return 1
+
+
+def sync_main(argv):
+    from optparse import OptionParser
+    from menuinst.reconcile import DEFAULT_JOBS, reconcile
+
+    p = OptionParser(
+        usage="usage: %prog sync [options]",
+        description="install the missing or outdated shortcuts of all "
+                    "environments, and remove those of environments which "
+                    "are gone")
+
+    p.add_option('--root-prefix',
+                 action="store",
+                 default=sys.prefix)
+
+    p.add_option('--environments-txt',
+                 action="store",
+                 help="the list of other environments "
+                      "(default: ~/.conda/environments.txt)")
+
+    p.add_option('-n', '--dry-run',
+                 action="store_true",
+                 help="only report what would be done")
+
+    p.add_option('-j', '--jobs',
+                 action="store",
+                 type="int",
+                 default=DEFAULT_JOBS)
+
+    opts, args = p.parse_args(argv)
+
+    changes = reconcile(opts.root_prefix, dry_run=opts.dry_run,
+                        environments_txt=opts.environments_txt, jobs=opts.jobs)
+    for c in changes:
+        if c.action == 'error':
+            sys.stdout.write("%s: error: %s\n" % (c.path, c.menu.splitlines()[0]))
+        else:
+            sys.stdout.write("%s: %s\n" % (c.path, c.action))
+    if any(c.action == 'error' for c in changes):
+        return 1
+
+
+def watch_main(argv):
+    from optparse import OptionParser
+    from menuinst.watch import DEBOUNCE, POLL_INTERVAL, Poller, Watch
+
+    p = OptionParser(
+        usage="usage: %prog watch [options] PREFIX...",
+        description="install the menus of the PREFIXes, and keep installing "
+                    "(and removing) them as their Menu/*.json files change")
+
+    p.add_option('--root-prefix',
+                 action="store",
+                 default=sys.prefix)
+
+    p.add_option('--debounce',
+                 action="store",
+                 type="float",
+                 default=DEBOUNCE,
+                 help="seconds without changes before they are applied "
+                      "(default: %default)")
+
+    p.add_option('--poll',
+                 action="store",
+                 type="float",
+                 metavar="INTERVAL",
+                 help="look for changes every INTERVAL seconds instead of "
+                      "using inotify (default where inotify is not "
+                      "available, every %g seconds)" % POLL_INTERVAL)
+
+    opts, args = p.parse_args(argv)
+    if not args:
+        p.error("at least one PREFIX is required")
+
+    def report(results):
+        for r in results:
+            if r.action == 'error':
+                sys.stdout.write("%s: error: %s\n" % (r.path, r.detail))
+            else:
+                sys.stdout.write("%s: %s\n" % (r.path, r.action))
+        sys.stdout.flush()
+
+    backend = None
+    if opts.poll:
+        backend = Poller([os.path.abspath(prefix) for prefix in args], opts.poll)
+    watch = Watch(args, opts.root_prefix, debounce=opts.debounce, backend=backend)
+    try:
+        watch.run(report)
+    except KeyboardInterrupt:
+        pass
+
+
+def main(argv=None):
+    from optparse import OptionParser
+
+    if argv is None:
+        argv = sys.argv[1:]
+    if argv[:1] == ['render']:
+        return render_main(argv[1:])
+    if argv[:1] == ['gc']:
+        return gc_main(argv[1:])
+    if argv[:1] == ['relocate']:
+        return relocate_main(argv[1:])
+    if argv[:1] == ['fleet']:
+        return fleet_main(argv[1:])
+    if argv[:1] == ['sync']:
+        return sync_main(argv[1:])
+    if argv[:1] == ['watch']:
+        return watch_main(argv[1:])
+
+    p = OptionParser(
+        usage="usage: %prog [options] MENU_FILE\n"
+              "       %prog render [options] MENU_FILE\n"
+              "       %prog gc [options]\n"
+              "       %prog relocate [options] OLD_PREFIX NEW_PREFIX\n"
+              "       %prog fleet [options]\n"
+              "       %prog sync [options]\n"
+              "       %prog watch [options] PREFIX...",
         description="install a menu item")
 
     p.add_option('-p', '--prefix',
@@ -21,15 +279,46 @@ def main():
     p.add_option('--version',
                  action="store_true")
 
-    opts, args = p.parse_args()
+    p.add_option('--destdir',
+                 action="store",
+                 help="stage a system-wide install below DESTDIR; paths within "
+                      "the files are those of the running system")
+
+    p.add_option('--manifest',
+                 action="store",
+                 help="with --destdir, write the list of the files produced "
+                      "(JSON) to MANIFEST")
+
+    p.add_option('--json',
+                 action="store_true",
+                 help="print what was done (one result per MENU_FILE) as JSON")
+
+    opts, args = p.parse_args(argv)
 
     if opts.version:
         sys.stdout.write("menuinst: %s\n" % menuinst.__version__)
         return
+    if opts.manifest and not opts.destdir:
+        p.error("--manifest requires --destdir")
+
+    results = []
+    if opts.destdir:
+        from menuinst.manifest import make_manifest, write_manifest
+        context = menuinst.InstallContext.system(os.path.abspath(opts.destdir))
+        for arg in args:
+            # the prefix (and so the menu file) is staged as well
+            results.append(menuinst.install(context.staged(join(opts.prefix, arg)),
+                                            opts.remove, opts.prefix, context=context))
+        if opts.manifest:
+            write_manifest(opts.manifest, make_manifest(context.destdir, results))
+    else:
+        for arg in args:
+            results.append(menuinst.install(join(opts.prefix, arg), opts.remove, opts.prefix))
 
-    for arg in args:
-        menuinst.install(join(opts.prefix, arg), opts.remove, opts.prefix)
+    if opts.json:
+        json.dump([r.to_json() for r in results], sys.stdout, indent=2, sort_keys=True)
+        sys.stdout.write("\n")
 
 
 if __name__ == '__main__':
-    main()
+    sys.exit(main())
@@ -0,0 +1,68 @@
+# Copyright (c) 2013-2017 Continuum Analytics, Inc.
+# All rights reserved.
+"""
+Manifests of the files a staged install (see InstallContext.destdir) produced.
+
+The files are those the InstallResults of the install (see result.py) report
+as written, found up to date (so a repeated install lists the same files) or
+removed; nothing else below the staging root is looked at.
+They are listed with their size and sha256, under the paths they will have
+on the running system, so image layers can be cached and diffed without
+reading the whole root again.
+"""
+from __future__ import absolute_import
+
+import hashlib
+import json
+import os
+from os.path import isfile, relpath
+
+
+def sha256(path):
+    h = hashlib.sha256()
+    with open(path, 'rb') as fi:
+        for chunk in iter(lambda: fi.read(1 << 16), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def _relpath(path, root):
+    rel = relpath(path, root).replace(os.sep, '/')
+    return None if rel == '..' or rel.startswith('../') else rel
+
+
+def make_manifest(root, results):
+    """
+    Describe what the installs of `results` (InstallResults, in the order
+    they were made) left below `root`.
+    """
+    # (skipped artifacts were present, and as they should be)
+    written, removed = set(), set()
+    for result in results:
+        for artifact in result.artifacts:
+            rel = _relpath(artifact.path, root)
+            if rel is None:
+                continue
+            if artifact.action in ('created', 'updated', 'skipped'):
+                written.add(rel)
+                removed.discard(rel)
+            elif artifact.action == 'removed':
+                removed.add(rel)
+                written.discard(rel)
+    files = []
+    for rel in sorted(written):
+        path = os.path.join(root, *rel.split('/'))
+        if isfile(path):
+            files.append({'path': '/' + rel, 'size': os.stat(path).st_size,
+                          'sha256': sha256(path)})
+    return {
+        'destdir': root,
+        'files': files,
+        'removed': ['/' + rel for rel in sorted(removed)],
+    }
+
+
+def write_manifest(path, manifest):
+    with open(path, 'w') as fo:
+        json.dump(manifest, fo, indent=2, sort_keys=True)
+        fo.write('\n')
@@ -0,0 +1,134 @@
+# Copyright (c) 2013-2017 Continuum Analytics, Inc.
+# All rights reserved.
+"""
+Filesystem probes with a deadline.
+
+Known folders can point at network shares which no longer exist (we have seen
+Documents set to '\\\\vmware-host\\Shared Folders\\Documents' with no such
+server).  A plain os.access() or os.makedirs() on such a path can block for
+tens of seconds, so the probes used while resolving folders and creating
+working directories run in a worker thread and are given up on after
+`timeout` seconds.  A timed out probe returns a fixed fallback value and
+emits a ProbeTimeoutWarning.  Once a UNC share (\\\\server\\share) timed out,
+further probes below it fail immediately instead of waiting again; a drive
+or POSIX path which timed out is probed again next time, as one slow path
+says nothing about the others there.
+"""
+from __future__ import absolute_import
+
+import logging
+import ntpath
+import os
+import threading
+import warnings
+from collections import deque
+from os.path import isdir
+
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TIMEOUT = 5.0
+# how many of the last timeouts a Prober keeps, for the caller to report
+MAX_TIMEOUTS = 32
+
+
+class ProbeTimeoutWarning(UserWarning):
+    def __init__(self, op, path, timeout):
+        UserWarning.__init__(self, "menuinst: %s(%r) did not finish within %gs"
+                             % (op, path, timeout))
+        self.op = op
+        self.path = path
+        self.timeout = timeout
+
+
+class OSProvider(object):
+    """
+    The real filesystem.  Anything with the same three methods can be passed
+    to Prober instead (the tests use a deliberately slow one).
+    """
+    def access(self, path, mode):
+        return os.access(path, mode)
+
+    def isdir(self, path):
+        return isdir(path)
+
+    def makedirs(self, path):
+        os.makedirs(path)
+
+
+def share_root(path):
+    """
+    The server and share of the UNC path `path`, which decide whether it
+    is reachable at all; None for any other path.
+    """
+    drive = ntpath.splitdrive(path)[0].replace('/', '\\').lower()
+    return drive if drive.startswith('\\\\') else None
+
+
+class Prober(object):
+
+    def __init__(self, provider=None, timeout=DEFAULT_TIMEOUT):
+        self.provider = provider or OSProvider()
+        self.timeout = timeout
+        self.timeouts = deque(maxlen=MAX_TIMEOUTS)
+        self._dead_roots = set()
+
+    def call(self, op, path, func, fallback, remember=True):
+        """
+        Return func() if it finishes within the deadline, otherwise
+        `fallback`.  Exceptions raised by func() are propagated.  With
+        `remember`, a timeout marks the share of `path` as dead, if it is
+        below one.
+        """
+        root = share_root(path) if remember else None
+        if root in self._dead_roots:
+            logger.debug("not probing %s(%r), %s timed out before", op, path, root)
+            return fallback
+
+        outcome = []
+
+        def target():
+            try:
+                outcome.append((True, func()))
+            except BaseException as e:
+                outcome.append((False, e))
+
+        t = threading.Thread(target=target, name='menuinst-probe')
+        # a thread stuck in the kernel cannot be cancelled, but it must not
+        # keep the process alive either
+        t.daemon = True
+        t.start()
+        t.join(self.timeout)
+        if not outcome:
+            if root is not None:
+                self._dead_roots.add(root)
+            warning = ProbeTimeoutWarning(op, path, self.timeout)
+            self.timeouts.append(warning)
+            logger.warning(str(warning))
+            warnings.warn(warning, stacklevel=3)
+            return fallback
+        ok, value = outcome[0]
+        if not ok:
+            raise value
+        return value
+
+    def access(self, path, mode):
+        return self.call('access', path, lambda: self.provider.access(path, mode), False)
+
+    def isdir(self, path):
+        return self.call('isdir', path, lambda: self.provider.isdir(path), False)
+
+    def ensure_dir(self, path):
+        """
+        Make sure `path` is a directory.  Returns False if it could not be
+        created, or if that did not finish in time.
+        """
+        def make():
+            if not self.provider.isdir(path):
+                self.provider.makedirs(path)
+            return True
+        try:
+            return self.call('makedirs', path, make, False)
+        except OSError as e:
+            logger.warning("menuinst: could not create %r: %s", path, e)
+            return False
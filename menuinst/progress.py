@@ -0,0 +1,106 @@
+# Copyright (c) 2013-2017 Continuum Analytics, Inc.
+# All rights reserved.
+"""
+The part of an install which can wait.
+
+An install with progressive=True (see install()) writes what shows up in
+the menus first: the menu itself and the main entry of every shortcut (the
+Start Menu link on Windows, the .desktop file on Linux).  What else the
+backends write (the desktop and Quick Launch links on Windows, the KDE
+entries on Linux) is handed to a background thread, in order, and install()
+returns right away, with a Handle to it as the `pending` of its result.  A
+removal waits for what is left, so that it is not written after.
+
+The thread is not a daemon: whatever is left when the interpreter exits is
+finished first, unless cancelled.
+"""
+from __future__ import absolute_import
+
+import atexit
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait as wait_futures
+
+
+logger = logging.getLogger(__name__)
+
+
+class Handle(object):
+    """
+    The deferred steps of an install.
+    """
+    def __init__(self, futures=()):
+        self._futures = list(futures)
+
+    def done(self):
+        return all(f.done() for f in self._futures)
+
+    def wait(self, timeout=None):
+        """
+        Block until the steps are done, or `timeout` seconds passed; returns
+        whether they are.  The first step which failed raises its error.
+        """
+        done, pending = wait_futures(self._futures, timeout)
+        for f in self._futures:
+            if f in done and not f.cancelled() and f.exception() is not None:
+                raise f.exception()
+        return not pending
+
+    def cancel(self):
+        """
+        Drop the steps which have not started; returns False if one is
+        running (it is finished nonetheless).
+        """
+        return all([f.cancel() for f in self._futures if not f.done()])
+
+
+def _log_error(future):
+    if not future.cancelled() and future.exception() is not None:
+        logger.warning("Deferred install step failed: %s" % future.exception())
+
+
+class Scheduler(object):
+    """
+    Runs the deferred steps of all installs, one at a time.
+    """
+    def __init__(self):
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def submit(self, steps):
+        """
+        Schedule `steps`, a list of (function, args), and return their Handle.
+        """
+        if not steps:
+            return Handle()
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=1,
+                                                    thread_name_prefix='menuinst-deferred')
+            futures = [self._executor.submit(func, *args) for func, args in steps]
+        for f in futures:
+            # nobody may be waiting for them
+            f.add_done_callback(_log_error)
+        return Handle(futures)
+
+    def wait(self):
+        """
+        Wait for everything scheduled so far (the steps run in order).
+        """
+        with self._lock:
+            executor = self._executor
+        if executor is not None:
+            executor.submit(lambda: None).result()
+
+    def shutdown(self):
+        """
+        Wait for everything scheduled so far.
+        """
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True)
+
+
+scheduler = Scheduler()
+atexit.register(scheduler.shutdown)
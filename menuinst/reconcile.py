@@ -0,0 +1,302 @@
+# Copyright (c) 2013-2017 Continuum Analytics, Inc.
+# All rights reserved.
+"""
+Bring the installed shortcuts in line with the prefixes which exist.
+
+Prefixes deleted with `rm -rf` leave their shortcuts (and, on Linux, their
+<Menu> in applications.menu) behind.  plan() compares what the menu files of
+the live prefixes (see fleet.discover()) install with what is installed, and
+returns the changes needed:
+
+    ('create', path)        a shortcut of a live prefix is missing
+    ('update', path)        it is older than its menu file
+    ('delete', path)        the prefix it belongs to is gone
+    ('remove-menu', name)   a Linux menu which nothing uses any more
+
+Installed files count as menuinst shortcuts by their names (Linux: in a
+menu of applications.menu which menuinst created) or content (OS X: bundles
+run through a prefix's python.app, Windows: links to a prefix's python).
+The prefix one belongs to is worked out from the paths it references, and
+only shortcuts of a prefix which is gone are deleted; those of prefixes the
+discovery does not know about are left alone.  The existence of the
+referenced prefixes is checked in parallel, as that is a round trip per
+prefix on a network filesystem.
+
+apply() carries the changes out: menu files of the created or updated
+shortcuts are installed again (see fleet.fleet()), which only rewrites what
+differs.  The shortcuts are touched afterwards, so one which was already as
+its newer menu file says is not planned for an update again.
+"""
+from __future__ import absolute_import
+
+import ntpath
+import os
+import re
+import sys
+import time
+import xml.etree.ElementTree as ET
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from os.path import abspath, basename, isdir, join
+
+from .fleet import default_context, discover, fleet
+from .lnk import LnkError, parse_lnk
+from .render import render_files
+from .trash import discard
+
+
+DEFAULT_JOBS = 8
+
+# action is one of the above; prefix is who the shortcut belongs to (None
+# if unknown), menu the menu file installing it or the name of the menu
+Change = namedtuple('Change', ['action', 'path', 'prefix', 'menu'])
+
+# how a prefix is referenced: its launcher, python or bin/ (POSIX), its
+# python or cwp.py (Windows); the prefix is the longest of them
+PREFIX_PATTERNS = [
+    re.compile(r'''(/[^\s"']+?)/(?:etc/menuinst/launch\.sh|python\.app/|bin/)'''),
+    # (spaces are allowed in Windows paths, the start of the next one is not)
+    re.compile(r'''([A-Za-z]:\\(?:(?![A-Za-z]:\\)[^"])+?)\\(?:cwp\.py|pythonw?\.exe|Scripts\\)''',
+               re.IGNORECASE),
+]
+
+
+def target():
+    if sys.platform == 'darwin':
+        return 'osx'
+    elif sys.platform == 'win32':
+        return 'win'
+    return 'linux'
+
+
+def referenced_prefix(text):
+    """
+    Return the prefix `text` (a command line, a script) runs things from,
+    or None.
+    """
+    found = [m.group(1) for pattern in PREFIX_PATTERNS for m in pattern.finditer(text)]
+    return max(found, key=len) if found else None
+
+
+def installed_path(relpath, context):
+    """
+    Where the file rendered (see render.py) to `relpath` is installed, for
+    OS X the bundle.
+    """
+    parts = relpath.split('/')
+    if parts[0] == 'share':
+        return join(context.appdir if parts[1] == 'applications' else context.directory_dir,
+                    *parts[2:])
+    elif parts[0] == 'Applications':
+        return join(context.staged(context.applications_dir), parts[1])
+    dirs = context.dirs or {}
+    folder = dirs.get({'Start Menu': 'start', 'Desktop': 'desktop',
+                       'Quick Launch': 'quicklaunch'}[parts[0]])
+    return folder and context.staged(ntpath.join(folder, *parts[1:]))
+
+
+def desired(prefixes, root_prefix, context):
+    """
+    Return {path: (prefix, menu file)} of what the menu files of
+    `prefixes` ([(prefix, [menu file])]) install, and the names of their
+    menus.
+    """
+    files, menus = {}, set()
+    for prefix, paths in prefixes:
+        env_name = None if abspath(prefix) == abspath(root_prefix) else basename(prefix)
+        for menu_path in paths:
+            for relpath in render_files(menu_path, target(), prefix, root_prefix, env_name):
+                path = installed_path(relpath, context)
+                if path is None:
+                    continue
+                files[path] = (prefix, menu_path)
+                if relpath.startswith('share/desktop-directories/'):
+                    menus.add(basename(relpath)[:-len('.directory')])
+    return files, menus
+
+
+def menuinst_menus(context):
+    """
+    Return the names of the menus in the Linux menu file which look like
+    menuinst's: <Menu><Name>X</Name><Directory>X.directory</Directory>...
+    """
+    try:
+        root = ET.fromstring(context.fs.read_bytes(context.menu_file))
+    except (IOError, OSError, ET.ParseError):
+        return []
+    return [elt.findtext('Name') for elt in root.findall('Menu')
+            if elt.findtext('Directory') == '%s.directory' % elt.findtext('Name')]
+
+
+def _read(fs, path):
+    try:
+        return fs.read_bytes(path)
+    except (IOError, OSError):
+        return b''
+
+
+def installed(context):
+    """
+    Return {path: referenced prefix or None} of the menuinst shortcuts
+    installed in `context`.
+    """
+    fs = context.fs
+    result = {}
+    if target() == 'linux':
+        names = tuple('%s_' % name for name in menuinst_menus(context))
+        if names and fs.isdir(context.appdir):
+            for fn in fs.listdir(context.appdir):
+                if fn.startswith(names) and fn.endswith('.desktop'):
+                    path = join(context.appdir, fn)
+                    result[path] = referenced_prefix(
+                        _read(fs, path).decode('utf-8', 'replace'))
+    elif target() == 'osx':
+        apps = context.staged(context.applications_dir)
+        for fn in (fs.listdir(apps) if fs.isdir(apps) else []):
+            macos = join(apps, fn, 'Contents', 'MacOS')
+            if not fn.endswith('.app') or not fs.isdir(macos):
+                continue
+            for exe in fs.listdir(macos):
+                script = _read(fs, join(macos, exe)).decode('utf-8', 'replace')
+                if 'python.app/Contents/MacOS/python' in script:
+                    result[join(apps, fn)] = referenced_prefix(script)
+    else:
+        for key in ('start', 'desktop', 'quicklaunch'):
+            folder = (context.dirs or {}).get(key)
+            if not folder or not fs.isdir(context.staged(folder)):
+                continue
+            for dirpath, dirnames, filenames in fs.walk(context.staged(folder)):
+                for fn in filenames:
+                    if not fn.lower().endswith('.lnk'):
+                        continue
+                    try:
+                        link = parse_lnk(_read(fs, join(dirpath, fn)))
+                    except LnkError:
+                        continue
+                    if re.search(r'pythonw?\.exe"?$', link.target, re.IGNORECASE):
+                        result[join(dirpath, fn)] = referenced_prefix(
+                            '%s %s' % (link.target, link.arguments))
+    return result
+
+
+def _stamp_path(path):
+    # what tells when a shortcut was installed
+    if target() == 'osx':
+        return join(path, 'Contents', 'Info.plist')
+    return path
+
+
+def _mtime(fs, path):
+    try:
+        return fs.stat(_stamp_path(path)).st_mtime
+    except OSError:
+        return None
+
+
+def _touch(fs, path, menu_path):
+    # not older than the menu file, whatever the clocks say
+    if fs.native:
+        mtime = max(time.time(), os.stat(menu_path).st_mtime)
+        os.utime(_stamp_path(path), (mtime, mtime))
+        fs.forget(_stamp_path(path))
+
+
+def plan(root_prefix=sys.prefix, context=None, prefixes=None, environments_txt=None,
+         jobs=DEFAULT_JOBS):
+    """
+    Return the list of Changes which bring the shortcuts installed in
+    `context` in line with `prefixes` (default: all the live prefixes of
+    `root_prefix`, see fleet.discover()).
+    """
+    root_prefix = abspath(root_prefix)
+    if context is None:
+        context = default_context(root_prefix)
+    if prefixes is None:
+        prefixes = discover(root_prefix, environments_txt)
+    fs = context.fs
+    wanted, wanted_menus = desired(prefixes, root_prefix, context)
+    present = installed(context)
+
+    changes = []
+    for path in sorted(wanted):
+        prefix, menu_path = wanted[path]
+        mtime = _mtime(fs, path)
+        if mtime is None:
+            changes.append(Change('create', path, prefix, menu_path))
+        elif mtime < os.stat(menu_path).st_mtime:
+            changes.append(Change('update', path, prefix, menu_path))
+
+    # the shortcuts nobody wants, of prefixes which are gone
+    unwanted = dict((path, prefix) for path, prefix in present.items()
+                    if path not in wanted and prefix is not None)
+    candidates = sorted(set(unwanted.values()))
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        alive = dict(zip(candidates, executor.map(isdir, candidates)))
+    deleted = set()
+    for path in sorted(unwanted):
+        if not alive[unwanted[path]]:
+            changes.append(Change('delete', path, unwanted[path], None))
+            deleted.add(path)
+
+    if target() == 'linux':
+        left = set(present) - deleted
+        for name in menuinst_menus(context):
+            if name not in wanted_menus and not any(basename(path).startswith(name + '_')
+                                                    for path in left):
+                changes.append(Change('remove-menu', name, None, name))
+    return changes
+
+
+def apply(changes, root_prefix=sys.prefix, context=None, jobs=None):
+    """
+    Carry out `changes`, and return them, with the action of those which
+    failed replaced by 'error' (and the menu by what went wrong).
+    """
+    root_prefix = abspath(root_prefix)
+    if context is None:
+        context = default_context(root_prefix)
+    fs = context.fs
+    result = []
+
+    menus = {}
+    for c in changes:
+        if c.action in ('create', 'update'):
+            menus.setdefault(c.prefix, [])
+            if c.menu not in menus[c.prefix]:
+                menus[c.prefix].append(c.menu)
+    errors = {}
+    if menus:
+        for r in fleet(root_prefix, jobs=jobs, context=context, prefixes=sorted(menus.items())):
+            if r.status == 'error':
+                errors[r.path] = r.detail
+
+    # in the order of plan(): the deletions before the menus they empty
+    for c in changes:
+        if c.action in ('create', 'update') and c.menu in errors:
+            c = c._replace(action='error', menu=errors[c.menu])
+        try:
+            if c.action in ('create', 'update'):
+                # an install which found nothing to write leaves the mtime
+                _touch(fs, c.path, c.menu)
+            elif c.action == 'delete':
+                discard(c.path, fs)
+            elif c.action == 'remove-menu':
+                from .linux import Menu
+                Menu(c.path, None, None, root_prefix=root_prefix, context=context).remove()
+        except (IOError, OSError) as e:
+            c = c._replace(action='error', menu='%s: %s' % (type(e).__name__, e))
+        result.append(c)
+    return result
+
+
+def reconcile(root_prefix=sys.prefix, context=None, dry_run=False, prefixes=None,
+              environments_txt=None, jobs=DEFAULT_JOBS):
+    """
+    Plan the changes (see plan()) and, unless `dry_run`, apply them.
+    """
+    if context is None:
+        context = default_context(abspath(root_prefix))
+    changes = plan(root_prefix, context, prefixes, environments_txt, jobs)
+    if dry_run:
+        return changes
+    return apply(changes, root_prefix, context, jobs)
@@ -0,0 +1,267 @@
+# Copyright (c) 2013-2017 Continuum Analytics, Inc.
+# All rights reserved.
+"""
+Patch existing shortcuts after a prefix was moved, instead of removing and
+reinstalling them.
+
+relocate() scans the folders shortcuts are installed to (and the prefix's own
+etc/menuinst) for the files menuinst put there (see find_files()) which
+reference the old prefix, and rewrites them in place:
+
+    .lnk                the string fields of the link (see lnk.py)
+    Info.plist, .json   every string value, keeping the format
+    anything textual    the raw text (.desktop entries, launcher scripts)
+
+The old prefix is only matched as a whole: where a path separator, a quote,
+whitespace or the end of the string follows it, so relocating /opt/envs/py3
+leaves /opt/envs/py38 alone.
+
+Files are rewritten atomically (write and rename), which also keeps files
+hard linked from the skeleton of a prefix (see darwin.py) from being modified
+for every application.
+Files are processed in parallel, and a Relocated result is returned for each
+file that referenced the old prefix or could not be read.
+"""
+from __future__ import absolute_import
+
+import json
+import logging
+import os
+import plistlib
+import re
+import sys
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from os.path import basename, dirname, isdir, join, normpath
+
+from .context import InstallContext
+from .lnk import LnkError, parse_lnk
+
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_JOBS = 8
+
+# what may follow a prefix in a path: anything else (e.g. the '8' of
+# /opt/envs/py38, when relocating /opt/envs/py3) makes it another path
+BOUNDARY = '/\\\'" \t\r\n:;\0'
+
+# the files menuinst installs in the folders of the desktop, which may hold
+# plenty of others (see find_files())
+ARTIFACT_EXTENSIONS = ('.desktop', '.directory', '.lnk')
+LAUNCH_DIR = join('etc', 'menuinst')
+
+# status is 'patched', 'unchanged' or 'error' (with the error as detail)
+Relocated = namedtuple('Relocated', ['path', 'status', 'detail'])
+
+
+def default_roots(new_prefix, context=None):
+    """
+    Where the shortcuts of this platform are installed: in `context`, or
+    for the current user and for everybody.
+    """
+    roots = [join(new_prefix, LAUNCH_DIR)]
+    if context is not None:
+        if context.dirs is not None:
+            return roots + [context.dirs[key] for key in ('start', 'desktop', 'quicklaunch')
+                            if context.dirs.get(key)]
+        elif sys.platform == 'darwin':
+            return roots + [context.applications_dir]
+        return roots + [context.appdir, context.directory_dir]
+    if sys.platform.startswith('linux'):
+        for context in (InstallContext.current(), InstallContext.system()):
+            roots += [context.appdir, context.directory_dir]
+    elif sys.platform == 'darwin':
+        roots += ['/Applications', os.path.expanduser('~/Applications')]
+    elif sys.platform == 'win32':
+        from .win32 import dirs_src
+        for dirs in dirs_src.values():
+            for key in ('start', 'desktop', 'quicklaunch'):
+                path, exception = dirs.get(key, (None, True))
+                if not exception:
+                    roots.append(path)
+    return roots
+
+
+def _bounded(needle, encoding):
+    """
+    A pattern matching the encoded `needle` where it ends a path.
+    """
+    chars = [re.escape(c.encode(encoding)) for c in BOUNDARY]
+    return re.escape(needle.encode(encoding)) + b'(?=' + b'|'.join(chars) + b'|\\Z)'
+
+
+class Replacer(object):
+    """
+    Replaces the old prefix by the new one in strings, where it is followed
+    by one of BOUNDARY or ends the string.  Windows paths are matched
+    case-insensitively and whatever their slashes.
+    """
+    def __init__(self, old, new):
+        self.old = old
+        self.new = new
+        variants = set([old, old.replace('\\', '/'), old.replace('/', '\\')])
+        needles = set()
+        for variant in variants:
+            for encoding in ('utf-8', 'utf-16-le', 'utf-16-be'):
+                needles.add(_bounded(variant, encoding))
+            needles.add(_bounded(json.dumps(variant)[1:-1], 'utf-8'))
+        self.needles = re.compile(b'|'.join(sorted(needles)))
+        end = '(?=[%s]|\\Z)' % re.escape(BOUNDARY)
+        self.pattern = re.compile(re.escape(old) + end)
+        self.win_pattern = re.compile(
+            r'[\\/]'.join(re.escape(part) for part in re.split(r'[\\/]', old)) + end,
+            re.IGNORECASE)
+
+    def references(self, data):
+        if data.startswith(b'bplist'):
+            # its strings are not delimited in the bytes: look at the values
+            try:
+                value = plistlib.loads(data)
+            except Exception:  # plistlib raises all sorts of errors for garbage
+                # for patch_plist() to report
+                return True
+            return self.value(value) != value
+        return self.needles.search(data) is not None
+
+    def text(self, s):
+        return self.pattern.sub(lambda m: self.new, s)
+
+    def win_path(self, s):
+        return self.win_pattern.sub(lambda m: self.new.replace('/', '\\'), s)
+
+    def value(self, obj):
+        """
+        Replace in all strings of a plist or JSON value.
+        """
+        if isinstance(obj, str):
+            return self.text(obj)
+        elif isinstance(obj, list):
+            return [self.value(item) for item in obj]
+        elif isinstance(obj, dict):
+            return dict((k, self.value(v)) for k, v in obj.items())
+        return obj
+
+
+def patch_lnk(data, replacer):
+    link = parse_lnk(data)
+    for field in ('target', 'arguments', 'workdir', 'icon', 'relative_path', 'description'):
+        setattr(link, field, replacer.win_path(getattr(link, field)))
+    return link.to_bytes()
+
+
+def patch_plist(data, replacer):
+    fmt = plistlib.FMT_BINARY if data.startswith(b'bplist') else plistlib.FMT_XML
+    return plistlib.dumps(replacer.value(plistlib.loads(data)), fmt=fmt)
+
+
+def patch_json(data, replacer):
+    # written by launch.py, hence the formatting
+    value = replacer.value(json.loads(data.decode('utf-8')))
+    return json.dumps(value, indent=2, sort_keys=True).encode('utf-8')
+
+
+def patch_text(data, replacer):
+    if b'\x00' in data:
+        raise ValueError("binary file")
+    return replacer.text(data.decode('utf-8')).encode('utf-8')
+
+
+def patcher(path, data):
+    name = path.lower()
+    if name.endswith('.lnk'):
+        return patch_lnk
+    elif name.endswith('.plist') or data.startswith(b'bplist'):
+        return patch_plist
+    elif name.endswith('.json'):
+        return patch_json
+    return patch_text
+
+
+def relocate_file(path, replacer):
+    """
+    Patch the file at `path`; returns a Relocated, or None when the file
+    does not reference the old prefix.
+    """
+    tmp_path = None
+    try:
+        with open(path, 'rb') as fi:
+            data = fi.read()
+        if not replacer.references(data):
+            return None
+        new_data = patcher(path, data)(data, replacer)
+        if new_data == data:
+            return Relocated(path, 'unchanged', None)
+        tmp_path = '%s.%d.tmp' % (path, os.getpid())
+        with open(tmp_path, 'wb') as fo:
+            fo.write(new_data)
+        os.chmod(tmp_path, os.stat(path).st_mode & 0o7777)
+        os.replace(tmp_path, path)
+    except (IOError, OSError, ValueError, LnkError) as e:
+        logger.warning("Could not relocate %s: %s" % (path, e))
+        if tmp_path is not None and os.path.lexists(tmp_path):
+            os.unlink(tmp_path)
+        return Relocated(path, 'error', e)
+    return Relocated(path, 'patched', None)
+
+
+def _is_bundle(path):
+    return path.lower().endswith('.app')
+
+
+def _is_script(path):
+    try:
+        with open(path, 'rb') as fi:
+            return fi.read(2) == b'#!'
+    except (IOError, OSError):
+        return False
+
+
+def find_files(roots):
+    """
+    Yield the files menuinst installs under `roots`: desktop and menu
+    directory entries, shell links, the Info.plist of application bundles
+    and the scripts they run (where a bundle's executable is a script, it
+    is one of ours), and what is in PREFIX/etc/menuinst but the skeletons,
+    which only hold icons.  Nothing else is read, nor are bundles walked
+    through.
+    """
+    seen = set()
+    for root in roots:
+        if not isdir(root) or os.path.realpath(root) in seen:
+            continue
+        seen.add(os.path.realpath(root))
+        launch_dir = normpath(root).endswith(LAUNCH_DIR)
+        for dirpath, dirnames, filenames in os.walk(root):
+            name = basename(dirpath)
+            if launch_dir:
+                if dirpath == root:
+                    dirnames[:] = [d for d in dirnames if d != 'skeletons']
+                paths = filenames
+            elif _is_bundle(name):
+                dirnames[:] = [d for d in dirnames if d == 'Contents']
+                paths = []
+            elif name == 'Contents' and _is_bundle(dirname(dirpath)):
+                dirnames[:] = [d for d in dirnames if d == 'MacOS']
+                paths = [fn for fn in filenames if fn == 'Info.plist']
+            elif name == 'MacOS' and _is_bundle(dirname(dirname(dirpath))):
+                del dirnames[:]
+                paths = [fn for fn in filenames if _is_script(join(dirpath, fn))]
+            else:
+                paths = [fn for fn in filenames if fn.lower().endswith(ARTIFACT_EXTENSIONS)]
+            for fn in paths:
+                yield join(dirpath, fn)
+
+
+def relocate(old_prefix, new_prefix, roots=None, jobs=DEFAULT_JOBS, context=None):
+    """
+    Patch all files under `roots` (default: default_roots(new_prefix,
+    context)) which reference `old_prefix`, and return their Relocated
+    results.
+    """
+    if roots is None:
+        roots = default_roots(new_prefix, context)
+    replacer = Replacer(old_prefix, new_prefix)
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        results = executor.map(lambda path: relocate_file(path, replacer), find_files(roots))
+        return [r for r in results if r is not None]
@@ -0,0 +1,157 @@
+# Copyright (c) 2013-2017 Continuum Analytics, Inc.
+# All rights reserved.
+"""
+Render the files a menu would install, for any of the supported platforms,
+on any host: .desktop/.directory entries for Linux, .app bundles for OS X and
+.lnk files for Windows.  Prefixes are written as placeholders, so installers
+can ship the rendered files and only have to copy them in place and replace
+the placeholder with the actual prefix.
+
+Paths of the rendered files are relative to the location the platform
+installs them to:
+
+    linux   share/applications/<menu>_<id>.desktop, <menu>_<id>KDE.desktop
+            share/desktop-directories/<menu>.directory
+    osx     Applications/<name>.app/...
+    win     Start Menu/<menu>/<name>.lnk, Desktop/<name>.lnk,
+            Quick Launch/<name>.lnk
+
+What depends on the target machine is not rendered: the Linux menu file
+(applications.menu, which merges the menus of all environments) and the
+activation launcher of a prefix (see launch.py), which needs the installed
+environment.
+"""
+from __future__ import absolute_import
+
+import json
+import os
+import sys
+from os.path import dirname, isdir, join, lexists
+
+from .clone import cloner
+from .darwin import Application
+from .filetree import File
+from .freedesktop import desktop_command, desktop_entry, directory_entry
+from .lnk import ShellLink
+from .win_command import (shortcut_args, shortcut_dirs, shortcut_name, shortcut_workdir_icon,
+                          substitute_env_variables)
+
+
+TARGETS = ('linux', 'osx', 'win')
+
+# what conda uses for prefixes of packages built without a real one; on
+# Windows, a path with a drive so it is quoted and joined like the real one
+DEFAULT_PLACEHOLDER = '/opt/anaconda1anaconda2anaconda3'
+WIN_PLACEHOLDER = 'C:\\anaconda1anaconda2anaconda3'
+
+
+def default_placeholder(target):
+    return WIN_PLACEHOLDER if target == 'win' else DEFAULT_PLACEHOLDER
+
+
+def load_menu(menu_path):
+    with open(menu_path) as fi:
+        data = json.load(fi)
+    menu_name = data.get('menu_name', 'Python-%d.%d' % sys.version_info[:2])
+    return menu_name, data['menu_items']
+
+
+def linux_files(menu_name, shortcuts, prefix):
+    files = {
+        'share/desktop-directories/%s.directory' % menu_name:
+            File(directory_entry(dict(name=menu_name)).encode('utf-8')),
+    }
+    webbrowser_cmd = ['%s/bin/python' % prefix, '-m', 'webbrowser', '-t']
+    for sc in shortcuts:
+        base = 'share/applications/%s_%s' % (menu_name, sc['id'])
+        for tp, ext in (('gnome', '.desktop'), ('kde', 'KDE.desktop')):
+            spec = dict(sc, tp=tp, categories=menu_name)
+            spec['cmd'] = desktop_command(sc['cmd'], tp, webbrowser_cmd)
+            files[base + ext] = File(desktop_entry(spec).encode('utf-8'))
+    return files
+
+
+def osx_files(shortcuts, prefix, env_name, source_prefix):
+    files = {}
+    for sc in shortcuts:
+        app_dir = 'Applications/%s.app' % sc['name']
+        app = Application('/' + app_dir, sc, prefix, env_name)
+        for relpath, f in app.bundle_files().items():
+            if f.source is not None:
+                # the icon is read from where the package was built
+                f = File(source=source_prefix + f.source[len(prefix):], mode=f.mode)
+            files[app_dir + '/' + relpath] = f
+    return files
+
+
+def win_files(menu_name, shortcuts, prefix, root_prefix, env_name):
+    dirs = {
+        'prefix': prefix,
+        'root_prefix': root_prefix,
+        'env_name': env_name,
+        'documents': u'%USERPROFILE%\\Documents',
+        'profile': u'%USERPROFILE%',
+        'desktop': u'Desktop',
+        'start': u'Start Menu',
+        'quicklaunch': u'Quick Launch',
+    }
+    menu_dir = u'Start Menu/' + substitute_env_variables(menu_name, dirs)
+    files = {}
+    for sc in shortcuts:
+        args = shortcut_args(sc, dirs)
+        workdir, icon = shortcut_workdir_icon(sc, dirs)
+        name = shortcut_name(sc, dirs)
+        link = ShellLink(args[0], name, u' '.join(args[1:]), workdir or u'%HOMEPATH%', icon)
+        for dst_dir in shortcut_dirs(sc, dirs, menu_dir):
+            files[u'%s/%s.lnk' % (dst_dir, name)] = File(link.to_bytes())
+    return files
+
+
+def render_files(menu_path, target, prefix_placeholder=None,
+                 root_prefix_placeholder=None, env_name=None, source_prefix=None):
+    """
+    Return {relative path: File} of what installing the menu at `menu_path`
+    on `target` would write.  `source_prefix` is the prefix the menu's
+    resources (icons) are read from, by default the one `menu_path` is in
+    (PREFIX/Menu/menu.json).
+    """
+    menu_name, shortcuts = load_menu(menu_path)
+    prefix_placeholder = prefix_placeholder or default_placeholder(target)
+    if target == 'linux':
+        return linux_files(menu_name, shortcuts, prefix_placeholder)
+    elif target == 'osx':
+        if source_prefix is None:
+            source_prefix = dirname(dirname(os.path.abspath(menu_path)))
+        return osx_files(shortcuts, prefix_placeholder, env_name, source_prefix)
+    elif target == 'win':
+        return win_files(menu_name, shortcuts, prefix_placeholder,
+                         root_prefix_placeholder or prefix_placeholder, env_name)
+    raise ValueError("unknown target %r, expected one of %s" % (target, ', '.join(TARGETS)))
+
+
+def write_files(outdir, files):
+    for relpath in sorted(files):
+        f = files[relpath]
+        path = join(outdir, *relpath.split('/'))
+        if not isdir(dirname(path)):
+            os.makedirs(dirname(path))
+        if lexists(path):
+            os.unlink(path)
+        if f.source is not None:
+            cloner.clone_file(f.source, path)
+        else:
+            with open(path, 'wb') as fo:
+                fo.write(f.read())
+        os.chmod(path, f.mode)
+
+
+def render(menu_path, target, outdir, prefix_placeholder=None,
+           root_prefix_placeholder=None, env_name=None, source_prefix=None):
+    """
+    Render the menu at `menu_path` for `target` into `outdir`, and return
+    the sorted relative paths of the files written.
+    """
+    files = render_files(menu_path, target, prefix_placeholder, root_prefix_placeholder,
+                         env_name, source_prefix)
+    write_files(outdir, files)
+    return sorted(files)
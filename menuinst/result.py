@@ -0,0 +1,121 @@
+# Copyright (c) 2013-2017 Continuum Analytics, Inc.
+# All rights reserved.
+"""
+What an install or removal did, as install() returns it.
+
+The changes are recorded as the backends make them (see fs.Recorder), one
+Artifact per file, with what happened to it in the end:
+
+    created     it was not there before
+    updated     it was, and was written (or replaced)
+    skipped     it was already as it should be
+    removed     it was there, and is gone
+
+Directories are not artifacts, nor is what the trash does in the background
+(see trash.py).  The time spent in each phase of the install is in
+`timings`.  to_json() gives plain data for json.dumps(); from_json() reads
+it back (that is how the results of the elevated worker come back).
+"""
+from __future__ import absolute_import
+
+import threading
+import time
+from collections import OrderedDict, namedtuple
+from contextlib import contextmanager
+from os.path import basename, dirname
+
+from .trash import TRASH_DIR
+
+
+# size in bytes, of what was written (None for the other actions)
+Artifact = namedtuple('Artifact', ['path', 'action', 'size'])
+
+
+class InstallResult(object):
+
+    def __init__(self, menu_file, prefix, remove=False):
+        self.menu_file = menu_file
+        self.prefix = prefix
+        self.remove = bool(remove)
+        # phase -> seconds
+        self.timings = OrderedDict()
+        # the progress.Handle of the deferred steps of a progressive install,
+        # whose artifacts are added as they are written
+        self.pending = None
+        self._artifacts = OrderedDict()
+        self._lock = threading.Lock()
+
+    def record(self, kind, path, size=None, duration=None):
+        """
+        A change, as fs.Recorder reports them.
+        """
+        if kind == 'mkdir' or basename(dirname(path)) == TRASH_DIR:
+            return
+        with self._lock:
+            before = self._artifacts.get(path)
+            before = before and before.action
+            if kind == 'removed' and before == 'created':
+                # something temporary
+                del self._artifacts[path]
+                return
+            if kind == 'skipped' and before is not None:
+                return
+            if kind == 'created' and before == 'removed':
+                kind = 'updated'
+            elif kind == 'updated' and before == 'created':
+                kind = 'created'
+            if kind not in ('created', 'updated'):
+                size = None
+            self._artifacts[path] = Artifact(path, kind, size)
+
+    @contextmanager
+    def phase(self, name):
+        """
+        Add the time spent in the with block to the timing of phase `name`.
+        """
+        start = time.time()
+        try:
+            yield
+        finally:
+            self.timings[name] = self.timings.get(name, 0.0) + time.time() - start
+
+    @property
+    def artifacts(self):
+        with self._lock:
+            return list(self._artifacts.values())
+
+    def paths(self, action=None):
+        """
+        The paths of the artifacts, of those with `action` if given.
+        """
+        return [a.path for a in self.artifacts if action is None or a.action == action]
+
+    @property
+    def bytes_written(self):
+        return sum(a.size or 0 for a in self.artifacts)
+
+    def to_json(self):
+        return {
+            'menu_file': self.menu_file,
+            'prefix': self.prefix,
+            'remove': self.remove,
+            'artifacts': [{'path': a.path, 'action': a.action, 'bytes': a.size}
+                          for a in self.artifacts],
+            'bytes_written': self.bytes_written,
+            'timings': dict(self.timings),
+        }
+
+    @classmethod
+    def from_json(cls, data):
+        result = cls(data['menu_file'], data['prefix'], data['remove'])
+        for a in data['artifacts']:
+            result._artifacts[a['path']] = Artifact(a['path'], a['action'], a['bytes'])
+        result.timings.update(data['timings'])
+        return result
+
+    def __repr__(self):
+        counts = OrderedDict()
+        for a in self.artifacts:
+            counts[a.action] = counts.get(a.action, 0) + 1
+        return '<InstallResult %s: %s>' % (self.menu_file, ', '.join(
+            '%d %s' % (n, action) for action, n in counts.items()) or 'nothing done')
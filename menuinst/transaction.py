@@ -0,0 +1,230 @@
+# Copyright (c) 2013-2017 Continuum Analytics, Inc.
+# All rights reserved.
+"""
+The menus of a conda transaction, from its conda-meta records.
+
+conda records the files of every package in $PREFIX/conda-meta/*.json:
+"files" (the paths relative to the prefix) and, in newer records,
+"paths_data" with the sha256 of every file.  diff() tells from the records
+of the packages a transaction unlinked and linked which Menu/*.json files it
+installs, removes or changes; nothing else in the prefix is looked at, and
+a menu file which a package upgrade left the same (as per the hashes) is
+left alone.
+
+A menu is removed with what its file says, so the changes are carried out
+in two steps, around conda's: unlink() before the files of the unlinked
+packages are gone, link() once those of the linked ones are there.
+
+A caller which removes and installs menu files one by one (an upgrade is
+the old version's removed and the new one's installed) can collect them in
+a Transaction instead: a shortcut removed and installed again is updated
+where it is, rather than deleted and created (which desktop shells show),
+and a menu which still has shortcuts is not removed and added back.
+"""
+from __future__ import absolute_import
+
+import copy
+import json
+import sys
+from collections import OrderedDict, namedtuple
+from os.path import abspath, join
+
+from . import _menu, _menu_name
+from .fleet import _job, default_context
+from .fs import StatCache
+
+
+# action is 'install', 'remove' or 'update'; relpath is the menu file,
+# relative to the prefix
+MenuChange = namedtuple('MenuChange', ['action', 'relpath'])
+
+# action is 'create', 'update' or 'remove'; shortcut is its id (or name)
+ShortcutChange = namedtuple('ShortcutChange', ['action', 'prefix', 'menu', 'shortcut'])
+
+# what the paths of a shortcut depend on, but on Linux (its menu and id)
+LOCATION_KEYS = ('name', 'desktop', 'quicklaunch')
+
+
+def load_record(record):
+    """
+    `record` as a dict: a conda-meta record already is one, else it is the
+    path to its file.
+    """
+    if isinstance(record, dict):
+        return record
+    with open(record) as fi:
+        return json.load(fi)
+
+
+def menu_entries(record):
+    """
+    Return {relpath: sha256 or None} of the menu files in `record`.
+    """
+    record = load_record(record)
+    paths = (record.get('paths_data') or {}).get('paths')
+    if paths is not None:
+        entries = [(p['_path'], p.get('sha256')) for p in paths]
+    else:
+        entries = [(path, None) for path in record.get('files', [])]
+    result = {}
+    for relpath, sha256 in entries:
+        relpath = relpath.replace('\\', '/')
+        if relpath.startswith('Menu/') and relpath.endswith('.json') and \
+                relpath.count('/') == 1:
+            result[relpath] = sha256
+    return result
+
+
+def diff(linked=(), unlinked=()):
+    """
+    Return the sorted MenuChanges of a transaction which unlinked the
+    packages of the records `unlinked` and linked those of `linked`.
+    """
+    before, after = {}, {}
+    for records, entries in ((unlinked, before), (linked, after)):
+        for record in records:
+            entries.update(menu_entries(record))
+    changes = []
+    for relpath in sorted(set(before) | set(after)):
+        if relpath not in after:
+            changes.append(MenuChange('remove', relpath))
+        elif relpath not in before:
+            changes.append(MenuChange('install', relpath))
+        elif before[relpath] is None or before[relpath] != after[relpath]:
+            changes.append(MenuChange('update', relpath))
+    return changes
+
+
+def _process(prefix, changes, actions, remove, root_prefix, context):
+    if context is None:
+        context = default_context(root_prefix)
+    return [_job((join(prefix, change.relpath), remove, prefix, abspath(root_prefix), context,
+                  True, True))
+            for change in changes if change.action in actions]
+
+
+def unlink(prefix, linked=(), unlinked=(), root_prefix=sys.prefix, context=None):
+    """
+    Remove the menus the transaction removes or changes, before the files
+    of `unlinked` are.  Returns a fleet.Provisioned result per menu file.
+    """
+    return _process(prefix, diff(linked, unlinked), ('remove', 'update'), True,
+                    root_prefix, context)
+
+
+def link(prefix, linked=(), unlinked=(), root_prefix=sys.prefix, context=None):
+    """
+    Install the menus the transaction installs or changes, once the files
+    of `linked` are there.  Returns a fleet.Provisioned result per menu file.
+    """
+    return _process(prefix, diff(linked, unlinked), ('install', 'update'), False,
+                    root_prefix, context)
+
+
+def _moves(before, after):
+    """
+    Whether the shortcut `before` is installed to other paths as `after`.
+    """
+    if sys.platform.startswith('linux'):
+        return False
+    return any(before.get(key) != after.get(key) for key in LOCATION_KEYS)
+
+
+class Transaction(object):
+    """
+    Removals and installs of menu files, carried out together by commit()
+    (or at the end of a with block):
+
+        with Transaction(root_prefix) as t:
+            t.remove(join(prefix, 'Menu', 'spyder.json'), prefix)
+            ... # conda replaces the package
+            t.install(join(prefix, 'Menu', 'spyder.json'), prefix)
+
+    Shortcuts are matched by prefix, menu name and id.
+    """
+    def __init__(self, root_prefix=sys.prefix, context=None):
+        self.root_prefix = abspath(root_prefix)
+        if context is None:
+            context = default_context(self.root_prefix)
+        self.context = context
+        # (prefix, menu name) -> {shortcut id: shortcut}
+        self._removed = OrderedDict()
+        self._installed = OrderedDict()
+        # (prefix, menu name) -> the content of one of its menu files
+        self._data = {}
+
+    def _add(self, groups, path, prefix, data):
+        if data is None:
+            with open(path) as fi:
+                data = json.load(fi)
+        group = (abspath(prefix), _menu_name(data))
+        self._data.setdefault(group, data)
+        shortcuts = groups.setdefault(group, OrderedDict())
+        for item in data['menu_items']:
+            # the backends add to it
+            shortcuts[item.get('id') or item['name']] = copy.deepcopy(item)
+
+    def remove(self, path, prefix=sys.prefix, data=None):
+        """
+        Remove the menu of the menu file `path`, which is read right away
+        (it is usually about to be deleted).
+        """
+        self._add(self._removed, path, prefix, data)
+
+    def install(self, path, prefix=sys.prefix, data=None):
+        """
+        Install the menu of the menu file `path`.
+        """
+        self._add(self._installed, path, prefix, data)
+
+    def commit(self):
+        """
+        Carry out what was collected, and return the ShortcutChanges.
+        Shortcuts removed and installed the same are left alone.
+        """
+        from . import ShortCut
+
+        context = self.context.with_fs(StatCache(self.context.fs))
+        menus = {}
+
+        def menu(group):
+            if group not in menus:
+                menus[group] = _menu(self._data[group], group[0], context.mode,
+                                     self.root_prefix, context)
+            return menus[group]
+
+        changes = []
+        for group, shortcuts in self._removed.items():
+            installed = self._installed.get(group, {})
+            for key, item in shortcuts.items():
+                if key not in installed:
+                    ShortCut(menu(group), copy.deepcopy(item)).remove()
+                    changes.append(ShortcutChange('remove', group[0], group[1], key))
+                elif _moves(item, installed[key]):
+                    ShortCut(menu(group), copy.deepcopy(item)).remove()
+        for group, shortcuts in self._installed.items():
+            removed = self._removed.get(group, {})
+            # adds the menu if it is not there, and keeps it otherwise
+            menu(group).create()
+            for key, item in shortcuts.items():
+                if removed.get(key) == item:
+                    continue
+                # rewrites only what differs from what is installed
+                ShortCut(menu(group), copy.deepcopy(item)).create()
+                changes.append(ShortcutChange('update' if key in removed else 'create',
+                                              group[0], group[1], key))
+        for group in self._removed:
+            if group not in self._installed:
+                menu(group).remove()
+
+        self._removed.clear()
+        self._installed.clear()
+        self._data.clear()
+        return changes
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        if exc_type is None:
+            self.commit()
@@ -0,0 +1,133 @@
+# Copyright (c) 2013-2017 Continuum Analytics, Inc.
+# All rights reserved.
+"""
+Deferred removal of directory trees (e.g. .app bundles).
+
+discard() renames a tree into a trash directory next to it (so on the same
+filesystem, where a rename is atomic and takes no time whatever the size of
+the tree) and returns; the shortcut is gone from the menus right away.  The
+trash is emptied by a background thread.  Trash left behind by a process
+which exited or crashed before that finished is emptied by the next one
+which looks there (see resume()): the entries of a trash directory are
+nothing but garbage, whatever state their deletion was interrupted in.
+
+The entries have no extension, so neither LaunchServices nor a desktop
+environment mistakes them for applications in the meantime.
+"""
+from __future__ import absolute_import
+
+import logging
+import queue
+import threading
+import uuid
+from os.path import dirname, join
+
+from .fs import os_fs
+from .utils import rm_empty_dir, rm_rf
+
+
+logger = logging.getLogger(__name__)
+
+TRASH_DIR = '.menuinst-trash'
+
+
+def trash_dir(path):
+    """
+    The trash directory for `path`.
+    """
+    return join(dirname(path), TRASH_DIR)
+
+
+class Reaper(object):
+    """
+    Empties trash directories in a (daemon) thread of its own.
+    """
+    def __init__(self):
+        self._queue = queue.Queue()
+        self._pending = set()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def schedule(self, path, fs=os_fs):
+        """
+        Empty the trash directory `path` soon.
+        """
+        with self._lock:
+            if (id(fs), path) in self._pending:
+                return
+            self._pending.add((id(fs), path))
+            self._queue.put((path, fs))
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='menuinst-reaper')
+                # whatever is left when the process exits is emptied next time
+                self._thread.daemon = True
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            path, fs = self._queue.get()
+            with self._lock:
+                self._pending.discard((id(fs), path))
+            try:
+                empty(path, fs)
+            except Exception as e:
+                logger.warning("Could not empty %s: %s" % (path, e))
+            finally:
+                self._queue.task_done()
+
+    def wait(self):
+        """
+        Block until everything scheduled so far is deleted.
+        """
+        self._queue.join()
+
+
+def empty(path, fs=os_fs):
+    """
+    Delete the entries of the trash directory `path`, and the directory.
+    """
+    try:
+        names = fs.listdir(path)
+    except OSError:
+        return
+    for name in names:
+        try:
+            rm_rf(join(path, name), fs)
+        except OSError as e:
+            # maybe another process is emptying the same trash
+            logger.debug("Could not delete %s: %s" % (join(path, name), e))
+    rm_empty_dir(path, fs)
+
+
+reaper = Reaper()
+
+
+def discard(path, fs=os_fs):
+    """
+    Remove `path` without waiting for a tree to be deleted.  Files (and
+    links) are simply unlinked, which does not take any longer than moving
+    them.
+    """
+    if fs.islink(path) or not fs.isdir(path):
+        rm_rf(path, fs)
+        return
+    trash = trash_dir(path)
+    try:
+        fs.makedirs(trash, exist_ok=True)
+        fs.rename(path, join(trash, uuid.uuid4().hex))
+    except OSError as e:
+        # e.g. the trash was emptied (and removed) concurrently, or the
+        # tree is in use on Windows
+        logger.debug("Could not move %s to the trash: %s" % (path, e))
+        rm_rf(path, fs)
+        return
+    reaper.schedule(trash, fs)
+
+
+def resume(folder, fs=os_fs):
+    """
+    Empty the trash in `folder` left behind by earlier processes, if any.
+    """
+    trash = join(folder, TRASH_DIR)
+    if fs.isdir(trash):
+        reaper.schedule(trash, fs)
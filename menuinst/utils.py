@@ -1,22 +1,28 @@
-import os
-import shutil
-from os.path import isdir, isfile, islink
+import sys
+from os.path import join
 
+from .fs import os_fs
 
 
-def rm_empty_dir(path):
+def rm_empty_dir(path, fs=os_fs):
     try:
-        os.rmdir(path)
+        fs.rmdir(path)
     except OSError: # directory might not exist or not be empty
         pass
 
 
-def rm_rf(path):
-    if islink(path) or isfile(path):
+def rm_rf(path, fs=os_fs):
+    if fs.islink(path) or fs.isfile(path):
         # Note that we have to check if the destination is a link because
         # exists('/path/to/dead-link') will return False, although
         # islink('/path/to/dead-link') is True.
-        os.unlink(path)
+        fs.unlink(path)
 
-    elif isdir(path):
-        shutil.rmtree(path)
+    elif fs.isdir(path):
+        fs.rmtree(path)
+
+
+def get_executable(prefix):
+    if sys.platform == 'win32':
+        return join(prefix, 'python.exe')
+    return join(prefix, 'bin', 'python')
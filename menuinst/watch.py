@@ -0,0 +1,286 @@
+# Copyright (c) 2013-2017 Continuum Analytics, Inc.
+# All rights reserved.
+"""
+Keep the menus of prefixes installed as their Menu/*.json files come and go.
+
+A backend tells which prefixes may have changed: Inotify (Linux, through
+ctypes) watches every prefix and its Menu/ directory, Poller (elsewhere, or
+when inotify is not available) compares listings of the Menu/ directories
+every `interval` seconds.  Watch waits for a change, then until nothing
+changed for `debounce` seconds (package managers write several files at
+once, and may write a file more than once), and then rescans the Menu/
+directories of those prefixes:
+
+  - a new menu file is installed
+  - a changed one is removed as it was, and installed as it is now
+  - a deleted one is removed, with the content it had
+
+The install context is resolved once, and the menu files are kept in
+memory (that is how the menus of deleted files can be removed), so an
+event costs the files it changes and little else.
+"""
+from __future__ import absolute_import
+
+import ctypes
+import ctypes.util
+import errno
+import json
+import logging
+import os
+import select
+import struct
+import sys
+import time
+from collections import namedtuple
+from os.path import abspath, isdir, join
+
+from . import _install
+from .fleet import default_context, menu_files
+from .fs import StatCache
+
+
+logger = logging.getLogger(__name__)
+
+DEBOUNCE = 0.25
+POLL_INTERVAL = 1.0
+
+# from sys/inotify.h
+IN_CLOSE_WRITE = 0x8
+IN_MOVED_FROM = 0x40
+IN_MOVED_TO = 0x80
+IN_CREATE = 0x100
+IN_DELETE = 0x200
+IN_DELETE_SELF = 0x400
+IN_IGNORED = 0x8000
+IN_ONLYDIR = 0x1000000
+IN_CLOEXEC = 0o2000000
+IN_NONBLOCK = 0o4000
+
+# the prefix: Menu/ appearing or going; Menu/: its files being written,
+# renamed or deleted (created files are reported once written)
+PREFIX_MASK = IN_CREATE | IN_DELETE | IN_MOVED_FROM | IN_MOVED_TO | IN_ONLYDIR
+MENU_MASK = (IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_DELETE | IN_DELETE_SELF |
+             IN_ONLYDIR)
+
+EVENT = struct.Struct('iIII')
+
+# action is 'create', 'update', 'remove' or 'error' (with the error as
+# detail); path is the menu file
+Applied = namedtuple('Applied', ['action', 'path', 'prefix', 'detail'])
+
+
+class Inotify(object):
+    """
+    Reports the prefixes whose Menu/ directory changed, from inotify events.
+    """
+    def __init__(self, prefixes):
+        self._libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        self._fd = self._libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self._fd < 0:
+            e = ctypes.get_errno()
+            raise OSError(e, os.strerror(e))
+        # watch descriptor -> (prefix, whether it is the Menu/ directory)
+        self._watches = {}
+        for prefix in prefixes:
+            self._add(prefix, PREFIX_MASK, False)
+            self._add(join(prefix, 'Menu'), MENU_MASK, True, prefix)
+
+    def _add(self, path, mask, menu, prefix=None):
+        if not isdir(path):
+            return
+        wd = self._libc.inotify_add_watch(self._fd, path.encode(sys.getfilesystemencoding()),
+                                          mask)
+        if wd < 0:
+            e = ctypes.get_errno()
+            logger.warning("Could not watch %s: %s" % (path, os.strerror(e)))
+            return
+        self._watches[wd] = (prefix or path, menu)
+
+    def wait(self, timeout=None):
+        """
+        Return the set of prefixes which changed within `timeout` seconds
+        (forever if None), empty if none did.
+        """
+        if not select.select([self._fd], [], [], timeout)[0]:
+            return set()
+        try:
+            data = os.read(self._fd, 65536)
+        except OSError as e:
+            if e.errno == errno.EAGAIN:
+                return set()
+            raise
+        changed = set()
+        offset = 0
+        while offset < len(data):
+            wd, mask, cookie, length = EVENT.unpack_from(data, offset)
+            name = data[offset + EVENT.size:offset + EVENT.size + length].rstrip(b'\0')
+            offset += EVENT.size + length
+            if wd not in self._watches:
+                continue
+            prefix, menu = self._watches[wd]
+            if mask & IN_IGNORED:
+                # the directory is gone
+                del self._watches[wd]
+            if not menu and name != b'Menu':
+                continue
+            if not menu and mask & (IN_CREATE | IN_MOVED_TO):
+                self._add(join(prefix, 'Menu'), MENU_MASK, True, prefix)
+            changed.add(prefix)
+        return changed
+
+    def close(self):
+        if self._fd >= 0:
+            os.close(self._fd)
+            self._fd = -1
+
+
+class Poller(object):
+    """
+    Reports the prefixes whose Menu/*.json files changed, by listing them.
+    """
+    def __init__(self, prefixes, interval=POLL_INTERVAL):
+        self.interval = interval
+        self._listings = dict((prefix, self._listing(prefix)) for prefix in prefixes)
+
+    @staticmethod
+    def _listing(prefix):
+        result = set()
+        for path in menu_files(prefix):
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            result.add((path, st.st_mtime_ns, st.st_size))
+        return result
+
+    def wait(self, timeout=None):
+        """
+        Return the set of prefixes which changed within `timeout` seconds
+        (forever if None), empty if none did.
+        """
+        deadline = None if timeout is None else time.time() + timeout
+        while True:
+            changed = set()
+            for prefix in self._listings:
+                listing = self._listing(prefix)
+                if listing != self._listings[prefix]:
+                    self._listings[prefix] = listing
+                    changed.add(prefix)
+            if changed:
+                return changed
+            if deadline is None:
+                time.sleep(self.interval)
+            elif time.time() < deadline:
+                time.sleep(max(0, min(self.interval, deadline - time.time())))
+            else:
+                return changed
+
+    def close(self):
+        pass
+
+
+def watcher(prefixes, interval=POLL_INTERVAL):
+    """
+    An Inotify backend for `prefixes` where that works, else a Poller.
+    """
+    if sys.platform.startswith('linux'):
+        try:
+            return Inotify(prefixes)
+        except (OSError, AttributeError) as e:
+            # e.g. out of inotify instances, or no inotify in this libc
+            logger.info("inotify is not available (%s), polling instead" % e)
+    return Poller(prefixes, interval)
+
+
+class Watch(object):
+
+    def __init__(self, prefixes, root_prefix=sys.prefix, context=None, debounce=DEBOUNCE,
+                 backend=None):
+        self.prefixes = [abspath(prefix) for prefix in prefixes]
+        self.root_prefix = abspath(root_prefix)
+        if context is None:
+            context = default_context(self.root_prefix)
+        self.context = context
+        self.debounce = debounce
+        # before the first sync, so nothing written meanwhile is missed
+        self.backend = backend or watcher(self.prefixes)
+        # prefix -> {menu file: ((mtime, size), the content installed)}
+        self.known = dict((prefix, {}) for prefix in self.prefixes)
+
+    def _run(self, path, prefix, remove, data, context):
+        _install(path, remove, prefix, mode=context.mode, root_prefix=self.root_prefix,
+                 context=context, data=data)
+
+    def sync(self, prefixes=None):
+        """
+        Bring the menus of `prefixes` (default: all) in line with their
+        menu files, and return what was done, an Applied per menu file.
+        """
+        # the metadata fetched is shared by all the changes of one batch
+        context = self.context.with_fs(StatCache(self.context.fs))
+        results = []
+        for prefix in sorted(prefixes or self.prefixes):
+            known = self.known[prefix]
+            current = {}
+            for path in menu_files(prefix):
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                current[path] = (st.st_mtime_ns, st.st_size)
+            for path in sorted(set(known) | set(current)):
+                signature, installed = known.pop(path, (None, None))
+                if signature == current.get(path):
+                    known[path] = (signature, installed)
+                    continue
+                try:
+                    data = None
+                    if path in current:
+                        # may fail while being written: the next write is seen
+                        with open(path) as fi:
+                            data = json.load(fi)
+                    if data != installed:
+                        action = 'remove' if data is None else 'update' if installed else 'create'
+                        if installed is not None:
+                            self._run(path, prefix, True, installed, context)
+                            installed = None
+                        if data is not None:
+                            installed = data
+                            self._run(path, prefix, False, data, context)
+                        results.append(Applied(action, path, prefix, None))
+                except Exception as e:
+                    results.append(Applied('error', path, prefix,
+                                           '%s: %s' % (type(e).__name__, e)))
+                if path in current:
+                    known[path] = (current[path], installed)
+        return results
+
+    def step(self, timeout=None):
+        """
+        Wait (up to `timeout` seconds) for changes, then for them to settle,
+        and sync the prefixes which changed.
+        """
+        changed = self.backend.wait(timeout)
+        while changed:
+            more = self.backend.wait(self.debounce)
+            if not more:
+                break
+            changed |= more
+        return self.sync(changed) if changed else []
+
+    def run(self, callback=None, stop=None, timeout=1.0):
+        """
+        Sync all the prefixes, then the prefixes which change until `stop`
+        (a threading.Event) is set, checked every `timeout` seconds.  The
+        results of every batch are passed to `callback`.
+        """
+        try:
+            results = self.sync()
+            while True:
+                if results and callback is not None:
+                    callback(results)
+                if stop is not None and stop.is_set():
+                    break
+                results = self.step(timeout)
+        finally:
+            self.backend.close()
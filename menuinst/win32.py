@@ -7,14 +7,22 @@ from __future__ import absolute_import, unicode_literals
 import ctypes
 import logging
 import os
-from os.path import isdir, join, exists, split
+from os.path import dirname, join, exists, split
 import pywintypes
 import sys
-import locale
 
 
+from .context import InstallContext
+from .fs import os_fs
 from .utils import rm_empty_dir, rm_rf
 from .knownfolders import get_folder_path, FOLDERID
+from .launch import add_menu, remove_menu, update as update_launch_profile
+from .lnk import ShellLink, link_matches, write_lnk
+from .probe import Prober
+# quote_args() and friends used to live here
+from .win_command import (ensure_pad, extend_script_args, quote_args, quoted,  # noqa
+                          shortcut_args, shortcut_dirs, shortcut_name, shortcut_workdir_icon,
+                          substitute_env_variables, to_bytes, to_unicode)
 # KNOWNFOLDERID does provide a direct path to Quick Launch.  No additional path necessary.
 from .winshortcut import create_shortcut
 
@@ -47,16 +55,34 @@ logger.addHandler(stream_handler)
 # exist, in which case, the 2nd entry of the value tuple is a sub-class of
 # Exception.
 
-dirs_src = {"system": {  "desktop": get_folder_path(FOLDERID.PublicDesktop),
-                           "start": get_folder_path(FOLDERID.CommonPrograms),
-                       "documents": get_folder_path(FOLDERID.PublicDocuments),
-                         "profile": get_folder_path(FOLDERID.Profile)},
+# Known folders may live on network shares which are gone, and probing those
+# can block for a long time. All probes go through this, see probe.py.
+probe = Prober()
 
-            "user": {    "desktop": get_folder_path(FOLDERID.Desktop),
-                           "start": get_folder_path(FOLDERID.Programs),
-                     "quicklaunch": get_folder_path(FOLDERID.QuickLaunch),
-                       "documents": get_folder_path(FOLDERID.Documents),
-                         "profile": get_folder_path(FOLDERID.Profile)}}
+
+class ProbeTimeout(Exception):
+    pass
+
+
+def known_folder_path(folder_id):
+    # SHGetKnownFolderPath verifies the folder exists, which is a probe too.
+    result = probe.call('SHGetKnownFolderPath', str(folder_id),
+                        lambda: get_folder_path(folder_id), None, remember=False)
+    if result is None:
+        return None, ProbeTimeout()
+    return result
+
+
+dirs_src = {"system": {  "desktop": known_folder_path(FOLDERID.PublicDesktop),
+                           "start": known_folder_path(FOLDERID.CommonPrograms),
+                       "documents": known_folder_path(FOLDERID.PublicDocuments),
+                         "profile": known_folder_path(FOLDERID.Profile)},
+
+            "user": {    "desktop": known_folder_path(FOLDERID.Desktop),
+                           "start": known_folder_path(FOLDERID.Programs),
+                     "quicklaunch": known_folder_path(FOLDERID.QuickLaunch),
+                       "documents": known_folder_path(FOLDERID.Documents),
+                         "profile": known_folder_path(FOLDERID.Profile)}}
 
 
 def folder_path(preferred_mode, check_other_mode, key):
@@ -80,7 +106,7 @@ def folder_path(preferred_mode, check_other_mode, key):
         user_profile, exception = dirs_src['user']['profile']
         if not exception:
             path = join(user_profile, 'Documents')
-            if os.access(path, os.W_OK):
+            if probe.access(path, os.W_OK):
                 logger.info("  .. worked-around to: '%s'" % (path))
                 return path
     path, exception = dirs_src[other_mode][key]
@@ -103,53 +129,13 @@ def folder_path(preferred_mode, check_other_mode, key):
     return path
 
 
-def quoted(s):
-    """
-    quotes a string if necessary.
-    """
-    # strip any existing quotes
-    s = s.strip(u'"')
-    # don't add quotes for minus or leading space
-    if s[0] in (u'-', u' '):
-        return s
-    if u' ' in s or u'/' in s:
-        return u'"%s"' % s
-    else:
-        return s
-
-
-def ensure_pad(name, pad="_"):
+def resolved_context(mode):
     """
-
-    Examples:
-        >>> ensure_pad('conda')
-        '_conda_'
-
+    An InstallContext with the folders of `mode` resolved like Menu does,
+    so other processes do not have to resolve them again.
     """
-    if not name or name[0] == name[-1] == pad:
-        return name
-    else:
-        return "%s%s%s" % (pad, name, pad)
-
-
-def to_unicode(var, codec=locale.getpreferredencoding()):
-    if sys.version_info[0] < 3 and isinstance(var, unicode):
-        return var
-    if not codec:
-        codec = "utf-8"
-    if hasattr(var, "decode"):
-        var = var.decode(codec)
-    return var
-
-
-def to_bytes(var, codec=locale.getpreferredencoding()):
-    if isinstance(var, bytes):
-        return var
-    if not codec:
-        codec="utf-8"
-    if hasattr(var, "encode"):
-        var = var.encode(codec)
-    return var
+    return InstallContext(mode, dirs=dict((key, folder_path(mode, False, key))
+                                          for key in dirs_src[mode]))
 
 
 unicode_root_prefix = to_unicode(sys.prefix)
@@ -157,46 +143,29 @@ if u'\\envs\\' in unicode_root_prefix:
     logger.warn('menuinst called from non-root env %s', unicode_root_prefix)
 
 
-def substitute_env_variables(text, dir):
-    # When conda is using Menuinst, only the root conda installation ever
-    # calls menuinst.  Thus, these calls to sys refer to the root conda
-    # installation, NOT the child environment
-    py_major_ver = sys.version_info[0]
-    py_bitness = 8 * tuple.__itemsize__
-
-    env_prefix = to_unicode(dir['prefix'])
-    root_prefix = to_unicode(dir['root_prefix'])
-    text = to_unicode(text)
-    env_name = to_unicode(dir['env_name'])
-
-    for a, b in (
-        (u'${PREFIX}', env_prefix),
-        (u'${ROOT_PREFIX}', root_prefix),
-        (u'${DISTRIBUTION_NAME}', os.path.split(root_prefix)[-1].capitalize()),
-        (u'${PYTHON_SCRIPTS}',
-          os.path.normpath(join(env_prefix, u'Scripts')).replace(u"\\", u"/")),
-        (u'${MENU_DIR}', join(env_prefix, u'Menu')),
-        (u'${PERSONALDIR}', dir['documents']),
-        (u'${USERPROFILE}', dir['profile']),
-        (u'${ENV_NAME}', env_name),
-        (u'${PY_VER}', u'%d' % (py_major_ver)),
-        (u'${PLATFORM}', u"(%s-bit)" % py_bitness),
-        ):
-        if b:
-            text = text.replace(a, b)
-    return text
-
-
 class Menu(object):
-    def __init__(self, name, prefix=unicode_root_prefix, env_name=u"", mode=None, root_prefix=unicode_root_prefix):
+    def __init__(self, name, prefix=unicode_root_prefix, env_name=u"", mode=None, root_prefix=unicode_root_prefix,
+                 context=None):
         """
         Prefix is the system prefix to be used -- this is needed since
         there is the possibility of a different Python's packages being managed.
+
+        A `context` with explicit folders (see InstallContext.windows_user)
+        installs for another user than the current one.
         """
 
         # bytestrings passed in need to become unicode
+        self.name = name
+        self.env_name = env_name
         self.prefix = to_unicode(prefix)
         self.root_prefix = to_unicode(root_prefix)
+        self.context = context
+        self.staged = context.staged if context is not None else (lambda path: path)
+        self.fs = context.fs if context is not None else os_fs
+        # {working dir: usable?}, as the shortcuts of a menu tend to share one
+        self._workdirs = {}
+        if context is not None and context.dirs is not None:
+            mode = context.mode
         used_mode = mode if mode else ('user' if exists(join(self.prefix, u'.nonadmin')) else 'system')
         logger.debug("Menu: name: '%s', prefix: '%s', env_name: '%s', mode: '%s', used_mode: '%s', root_prefix: '%s'"
                     % (name, self.prefix, env_name, mode, used_mode, root_prefix))
@@ -211,7 +180,7 @@ class Menu(object):
                 logger.warn("Insufficient permissions to write menu folder.  "
                             "Falling back to user location")
                 try:
-                    self.set_dir(name, self.prefix, env_name, 'user')
+                    self.set_dir(name, self.prefix, env_name, 'user', self.root_prefix)
                 except:
                     pass
             else:
@@ -227,52 +196,74 @@ class Menu(object):
         # non-priv-user doing user-only install
         # (priv-user only exists in an AllUsers installation).
         check_other_mode = False
-        for k, v in dirs_src[mode].items():
-            # We may want to cache self.dir to some files, one for AllUsers
-            # (system) installs and one for each subsequent user install?
-            self.dir[k] = folder_path(mode, check_other_mode, k)
+        if self.context is not None and self.context.dirs is not None:
+            self.dir.update(self.context.dirs)
+        else:
+            for k, v in dirs_src[mode].items():
+                # We may want to cache self.dir to some files, one for AllUsers
+                # (system) installs and one for each subsequent user install?
+                self.dir[k] = folder_path(mode, check_other_mode, k)
         self.dir['prefix'] = prefix
         self.dir['root_prefix'] = root_prefix
         self.dir['env_name'] = env_name
         folder_name = substitute_env_variables(name, self.dir)
         self.path = join(self.dir["start"], folder_name)
-        self.create()
 
     def create(self):
-        if not isdir(self.path):
-            os.mkdir(self.path)
+        try:
+            self._create_dir()
+        except (WindowsError, pywintypes.error):
+            # not elevated, as in __init__
+            if 'user' not in dirs_src or self.mode != 'system':
+                raise
+            logger.warn("Insufficient permissions to write menu folder.  "
+                        "Falling back to user location")
+            self.set_dir(self.name, self.prefix, self.env_name, 'user', self.root_prefix)
+            self._create_dir()
+        if self._launches():
+            self._write_launch_profile()
+
+    # nothing is shared with the menus of other prefixes
+    prepare = create
+
+    def _create_dir(self):
+        path = self.staged(self.path)
+        if not self.fs.isdir(path):
+            # other processes may be creating it as well
+            self.fs.makedirs(path, exist_ok=True)
+
+    def _launches(self):
+        # whether the shortcuts run through the launch profile: a staged
+        # prefix (or one not on the real filesystem) cannot be launched here
+        return self.fs.native and (self.context is None or not self.context.destdir)
+
+    def _write_launch_profile(self):
+        # Precompute what cwp.py needs, so launching a shortcut does not have
+        # to. System installs are shared by all users, so their working dir
+        # is only resolved by the launcher.
+        if self.mode == 'user' and self.dir['documents']:
+            cwd = self.dir['documents']
+        else:
+            cwd = u'%USERPROFILE%\\Documents'
+        try:
+            add_menu(self.prefix, self.name, self.fs)
+            update_launch_profile(self.prefix, self.root_prefix, cwd, fs=self.fs)
+        except (IOError, OSError) as e:
+            logger.warn("Could not write launch profile for %s: %s" % (self.prefix, e))
 
     def remove(self):
-        rm_empty_dir(self.path)
-
-
-def extend_script_args(args, shortcut):
-    try:
-        args.append(shortcut['scriptargument'])
-    except KeyError:
-        pass
-    try:
-        args.extend(shortcut['scriptarguments'])
-    except KeyError:
-        pass
-
-
-def quote_args(args):
-    # cmd.exe /K or /C expects a single string argument and requires
-    # doubled-up quotes when any sub-arguments have spaces:
-    # https://stackoverflow.com/a/6378038/3257826
-    if (len(args) > 2 and ("CMD.EXE" in args[0].upper() or "%COMSPEC%" in args[0].upper())
-            and (args[1].upper() == '/K' or args[1].upper() == '/C')
-            and any(' ' in arg for arg in args[2:])
-    ):
-        args = [
-            ensure_pad(args[0], '"'),  # cmd.exe
-            args[1],  # /K or /C
-            '"%s"' % (' '.join(ensure_pad(arg, '"') for arg in args[2:])),  # double-quoted
-        ]
-    else:
-        args = [quoted(arg) for arg in args]
-    return args
+        rm_empty_dir(self.staged(self.path), self.fs)
+        if self._launches():
+            remove_menu(self.prefix, self.name, self.fs)
+
+    def ensure_workdir(self, path):
+        """
+        Create the working directory `path` if it does not exist; returns
+        False if it cannot be created (in time).
+        """
+        if path not in self._workdirs:
+            self._workdirs[path] = probe.ensure_dir(path)
+        return self._workdirs[path]
 
 
 class ShortCut(object):
@@ -283,93 +274,66 @@ class ShortCut(object):
     def remove(self):
         self.create(remove=True)
 
-    def create(self, remove=False):
-        # Substitute env variables early because we may need to escape spaces in the value.
-        args = []
-        fix_win_slashes = [0]
-        prefix = self.menu.prefix.replace('/', '\\')
-        unicode_root_prefix = self.menu.root_prefix.replace('/', '\\')
-        root_py  = join(unicode_root_prefix, u"python.exe")
-        root_pyw = join(unicode_root_prefix, u"pythonw.exe")
-        env_py  = join(prefix, u"python.exe")
-        env_pyw = join(prefix, u"pythonw.exe")
-        cwp_py  = [root_py,  join(unicode_root_prefix, u'cwp.py'), prefix, env_py]
-        cwp_pyw = [root_pyw, join(unicode_root_prefix, u'cwp.py'), prefix, env_pyw]
-        if "pywscript" in self.shortcut:
-            args = cwp_pyw
-            fix_win_slashes = [len(args)]
-            args += self.shortcut["pywscript"].split()
-        elif "pyscript" in self.shortcut:
-            args = cwp_py
-            fix_win_slashes = [len(args)]
-            args += self.shortcut["pyscript"].split()
-        elif "webbrowser" in self.shortcut:
-            args = [root_pyw, '-m', 'webbrowser', '-t', self.shortcut['webbrowser']]
-        elif "script" in self.shortcut:
-            # It is unclear whether running through cwp.py is what we want here. In
-            # the long term I would rather this was made an explicit choice.
-            args = [root_py,  join(unicode_root_prefix, u'cwp.py'), prefix]
-            fix_win_slashes = [len(args)]
-            args += self.shortcut["script"].split()
-            extend_script_args(args, self.shortcut)
-        elif "system" in self.shortcut:
-            args = self.shortcut["system"].split()
-            extend_script_args(args, self.shortcut)
-        else:
-            raise Exception("Nothing to do: %r" % self.shortcut)
-        args = [substitute_env_variables(arg, self.menu.dir) for arg in args]
-        for fws in fix_win_slashes:
-            args[fws] = args[fws].replace('/', '\\')
-
-        args = quote_args(args)
-
+    def create(self, remove=False, deferred=None):
+        """
+        `deferred`, if given, is a list the (function, args) of what can be
+        done later are appended to (see progress.py): the links on the
+        desktop and in Quick Launch.
+        """
+        args = shortcut_args(self.shortcut, self.menu.dir)
         cmd = args[0]
         args = args[1:]
         logger.debug('Shortcut cmd is %s, args are %s' % (cmd, args))
-        workdir = self.shortcut.get('workdir', '')
-        icon = self.shortcut.get('icon', '')
-
-        workdir = substitute_env_variables(workdir, self.menu.dir)
-        icon = substitute_env_variables(icon, self.menu.dir)
-
-        # Fix up the '/' to '\'
-        workdir = workdir.replace('/', '\\')
-        icon = icon.replace('/', '\\')
-
-        # Create the working directory if it doesn't exist
-        if workdir:
-            if not isdir(workdir):
-                os.makedirs(workdir)
-        else:
+        workdir, icon = shortcut_workdir_icon(self.shortcut, self.menu.dir)
+
+        # Create the working directory if it doesn't exist; if it cannot be
+        # created (in time), fall back to the default one.  Staged installs
+        # leave it to the running system.
+        fs = self.menu.fs
+        staging = (self.menu.context is not None and self.menu.context.destdir) or not fs.native
+        if not workdir or (not remove and not staging and not self.menu.ensure_workdir(workdir)):
             workdir = '%HOMEPATH%'
 
-        # Menu link
-        dst_dirs = [self.menu.path]
-
-        # Desktop link
-        if self.shortcut.get('desktop'):
-            dst_dirs.append(self.menu.dir['desktop'])
-
-        # Quicklaunch link
-        if self.shortcut.get('quicklaunch') and 'quicklaunch' in self.menu.dir:
-            dst_dirs.append(self.menu.dir['quicklaunch'])
-
-        name_suffix = " ({})".format(self.menu.dir['env_name']) if self.menu.dir['env_name'] else ""
-        for dst_dir in dst_dirs:
-            name = substitute_env_variables(self.shortcut['name'], self.menu.dir)
-            dst = join(dst_dir, name + name_suffix + '.lnk')
+        name = shortcut_name(self.shortcut, self.menu.dir)
+        for i, dst_dir in enumerate(shortcut_dirs(self.shortcut, self.menu.dir,
+                                                  self.menu.path)):
+            dst = self.menu.staged(join(dst_dir, name + '.lnk'))
             if remove:
-                rm_rf(dst)
+                rm_rf(dst, fs)
+                continue
+            link_args = (dst, cmd, u'' + name, u' '.join(arg for arg in args), workdir, icon,
+                         staging)
+            # the first one is the menu's
+            if i > 0 and deferred is not None:
+                deferred.append((self._write_link, link_args))
             else:
-                # The API for the call to 'create_shortcut' has 3
-                # required arguments (path, description and filename)
-                # and 4 optional ones (args, working_dir, icon_path and
-                # icon_index).
-                create_shortcut(
-                    u'' + cmd,
-                    u'' + name + name_suffix,
-                    u'' + dst,
-                    u' '.join(arg for arg in args),
-                    u'' + workdir,
-                    u'' + icon,
-                )
+                self._write_link(*link_args)
+
+    def _write_link(self, dst, cmd, description, arguments, workdir, icon, staging):
+        fs = self.menu.fs
+        if staging and not fs.isdir(dirname(dst)):
+            fs.makedirs(dirname(dst))
+        # Rewriting an identical link is not free on roaming profiles,
+        # where every write gets synced over the network.
+        if link_matches(dst, cmd, description, arguments, workdir, icon, fs=fs):
+            logger.debug('Shortcut %s is up to date, not rewriting it' % dst)
+            fs.skipped(dst)
+            return
+        existed = fs.lexists(dst)
+        if not fs.native:
+            # the shell can only write to the real filesystem
+            write_lnk(dst, ShellLink(cmd, description, arguments, workdir, icon), fs)
+            return
+        # The API for the call to 'create_shortcut' has 3
+        # required arguments (path, description and filename)
+        # and 4 optional ones (args, working_dir, icon_path and
+        # icon_index).
+        create_shortcut(
+            u'' + cmd,
+            description,
+            u'' + dst,
+            arguments,
+            u'' + workdir,
+            u'' + icon,
+        )
+        fs.changed(dst, existed)
@@ -0,0 +1,206 @@
+# Copyright (c) 2008-2011 by Enthought, Inc.
+# Copyright (c) 2013-2017 Continuum Analytics, Inc.
+# All rights reserved.
+"""
+How Windows shortcuts are spelled: variable substitution, quoting, and the
+command line, working directory and icon of each kind of shortcut.
+
+Nothing here talks to Windows (paths are handled with ntpath), so these can
+be used to render shortcuts for Windows on any platform.
+"""
+from __future__ import absolute_import, unicode_literals
+
+import locale
+import sys
+from ntpath import join, normpath, split
+
+
+def quoted(s):
+    """
+    quotes a string if necessary.
+    """
+    # strip any existing quotes
+    s = s.strip(u'"')
+    # don't add quotes for minus or leading space
+    if s[0] in (u'-', u' '):
+        return s
+    if u' ' in s or u'/' in s:
+        return u'"%s"' % s
+    else:
+        return s
+
+
+def ensure_pad(name, pad="_"):
+    """
+
+    Examples:
+        >>> ensure_pad('conda')
+        '_conda_'
+
+    """
+    if not name or name[0] == name[-1] == pad:
+        return name
+    else:
+        return "%s%s%s" % (pad, name, pad)
+
+
+def to_unicode(var, codec=locale.getpreferredencoding()):
+    if sys.version_info[0] < 3 and isinstance(var, unicode):
+        return var
+    if not codec:
+        codec = "utf-8"
+    if hasattr(var, "decode"):
+        var = var.decode(codec)
+    return var
+
+
+def to_bytes(var, codec=locale.getpreferredencoding()):
+    if isinstance(var, bytes):
+        return var
+    if not codec:
+        codec="utf-8"
+    if hasattr(var, "encode"):
+        var = var.encode(codec)
+    return var
+
+
+def substitute_env_variables(text, dir):
+    # When conda is using Menuinst, only the root conda installation ever
+    # calls menuinst.  Thus, these calls to sys refer to the root conda
+    # installation, NOT the child environment
+    py_major_ver = sys.version_info[0]
+    py_bitness = 8 * tuple.__itemsize__
+
+    env_prefix = to_unicode(dir['prefix'])
+    root_prefix = to_unicode(dir['root_prefix'])
+    text = to_unicode(text)
+    env_name = to_unicode(dir['env_name'])
+
+    for a, b in (
+        (u'${PREFIX}', env_prefix),
+        (u'${ROOT_PREFIX}', root_prefix),
+        (u'${DISTRIBUTION_NAME}', split(root_prefix)[-1].capitalize()),
+        (u'${PYTHON_SCRIPTS}',
+          normpath(join(env_prefix, u'Scripts')).replace(u"\\", u"/")),
+        (u'${MENU_DIR}', join(env_prefix, u'Menu')),
+        (u'${PERSONALDIR}', dir['documents']),
+        (u'${USERPROFILE}', dir['profile']),
+        (u'${ENV_NAME}', env_name),
+        (u'${PY_VER}', u'%d' % (py_major_ver)),
+        (u'${PLATFORM}', u"(%s-bit)" % py_bitness),
+        ):
+        if b:
+            text = text.replace(a, b)
+    return text
+
+
+def extend_script_args(args, shortcut):
+    try:
+        args.append(shortcut['scriptargument'])
+    except KeyError:
+        pass
+    try:
+        args.extend(shortcut['scriptarguments'])
+    except KeyError:
+        pass
+
+
+def quote_args(args):
+    # cmd.exe /K or /C expects a single string argument and requires
+    # doubled-up quotes when any sub-arguments have spaces:
+    # https://stackoverflow.com/a/6378038/3257826
+    if (len(args) > 2 and ("CMD.EXE" in args[0].upper() or "%COMSPEC%" in args[0].upper())
+            and (args[1].upper() == '/K' or args[1].upper() == '/C')
+            and any(' ' in arg for arg in args[2:])
+    ):
+        args = [
+            ensure_pad(args[0], '"'),  # cmd.exe
+            args[1],  # /K or /C
+            '"%s"' % (' '.join(ensure_pad(arg, '"') for arg in args[2:])),  # double-quoted
+        ]
+    else:
+        args = [quoted(arg) for arg in args]
+    return args
+
+
+def shortcut_args(shortcut, dir):
+    """
+    Return the quoted command line of `shortcut` as [cmd, arg, ...].  `dir`
+    holds the folders and prefixes to substitute (see win32.Menu.set_dir).
+    """
+    # Substitute env variables early because we may need to escape spaces in the value.
+    args = []
+    fix_win_slashes = [0]
+    prefix = dir['prefix'].replace('/', '\\')
+    unicode_root_prefix = dir['root_prefix'].replace('/', '\\')
+    root_py  = join(unicode_root_prefix, u"python.exe")
+    root_pyw = join(unicode_root_prefix, u"pythonw.exe")
+    env_py  = join(prefix, u"python.exe")
+    env_pyw = join(prefix, u"pythonw.exe")
+    # cwp.py only needs the standard library, so spare it the site imports
+    cwp_py  = [root_py,  u'-I', u'-S', join(unicode_root_prefix, u'cwp.py'), prefix, env_py]
+    cwp_pyw = [root_pyw, u'-I', u'-S', join(unicode_root_prefix, u'cwp.py'), prefix, env_pyw]
+    if "pywscript" in shortcut:
+        args = cwp_pyw
+        fix_win_slashes = [len(args)]
+        args += shortcut["pywscript"].split()
+    elif "pyscript" in shortcut:
+        args = cwp_py
+        fix_win_slashes = [len(args)]
+        args += shortcut["pyscript"].split()
+    elif "webbrowser" in shortcut:
+        args = [root_pyw, '-m', 'webbrowser', '-t', shortcut['webbrowser']]
+    elif "script" in shortcut:
+        # It is unclear whether running through cwp.py is what we want here. In
+        # the long term I would rather this was made an explicit choice.
+        args = [root_py, u'-I', u'-S', join(unicode_root_prefix, u'cwp.py'), prefix]
+        fix_win_slashes = [len(args)]
+        args += shortcut["script"].split()
+        extend_script_args(args, shortcut)
+    elif "system" in shortcut:
+        args = shortcut["system"].split()
+        extend_script_args(args, shortcut)
+    else:
+        raise Exception("Nothing to do: %r" % shortcut)
+    args = [substitute_env_variables(arg, dir) for arg in args]
+    for fws in fix_win_slashes:
+        args[fws] = args[fws].replace('/', '\\')
+
+    return quote_args(args)
+
+
+def shortcut_workdir_icon(shortcut, dir):
+    """
+    Return the substituted (workdir, icon) of `shortcut`; either may be ''.
+    """
+    workdir = substitute_env_variables(shortcut.get('workdir', ''), dir)
+    icon = substitute_env_variables(shortcut.get('icon', ''), dir)
+    # Fix up the '/' to '\'
+    return workdir.replace('/', '\\'), icon.replace('/', '\\')
+
+
+def shortcut_name(shortcut, dir):
+    """
+    The name of the .lnk files (without extension), which is also used as
+    their description.
+    """
+    name_suffix = " ({})".format(dir['env_name']) if dir['env_name'] else ""
+    return substitute_env_variables(shortcut['name'], dir) + name_suffix
+
+
+def shortcut_dirs(shortcut, dir, menu_path):
+    """
+    The folders `shortcut` gets a link in: the menu, and optionally the
+    desktop and Quick Launch.
+    """
+    # Menu link
+    dst_dirs = [menu_path]
+
+    # Desktop link
+    if shortcut.get('desktop'):
+        dst_dirs.append(dir['desktop'])
+
+    # Quicklaunch link
+    if shortcut.get('quicklaunch') and 'quicklaunch' in dir:
+        dst_dirs.append(dir['quicklaunch'])
+    return dst_dirs
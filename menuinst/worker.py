@@ -0,0 +1,275 @@
+# Copyright (c) 2013-2017 Continuum Analytics, Inc.
+# All rights reserved.
+"""
+Long-lived helper process which runs install/remove jobs on behalf of
+menuinst.install().
+
+Rather than starting one elevated `python -c "import menuinst; ..."` (and
+getting one UAC prompt) per menu file, a single elevated worker is started
+the first time it is needed and then fed every job of the process over a
+connection.  Each message is a JSON object; a job looks like
+
+    {"id": 1, "op": "install", "path": ..., "prefix": ..., "root_prefix": ...}
+
+and is answered by {"id": 1, "ok": true, "result": ...} (see result.py) or
+{"id": 1, "ok": false, "error": ...}.
+The worker stops on {"op": "shutdown"} or when the connection is closed.
+
+The elevated worker authenticates to the pipe with a key it reads from a
+temporary file (and deletes as soon as it read it), not from its command
+line, which any process can see.  See write_authkey() for who else can read
+that file.
+
+The protocol only needs an object with send(obj)/recv() methods, so the same
+worker logic runs over a named pipe (the elevated case on Windows) or over
+stdin/stdout of a plain subprocess.
+"""
+from __future__ import absolute_import
+
+import atexit
+import binascii
+import json
+import logging
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+from os.path import join
+
+
+logger = logging.getLogger(__name__)
+
+# seconds to wait for the elevated worker to connect back
+CONNECT_TIMEOUT = 120
+
+
+class StreamConnection(object):
+    """
+    JSON lines over a pair of text streams, e.g. the stdin/stdout of a
+    subprocess.
+    """
+    def __init__(self, rfile, wfile):
+        self.rfile = rfile
+        self.wfile = wfile
+
+    def send(self, obj):
+        self.wfile.write(json.dumps(obj) + '\n')
+        self.wfile.flush()
+
+    def recv(self):
+        line = self.rfile.readline()
+        if not line:
+            raise EOFError
+        return json.loads(line)
+
+    def close(self):
+        for f in (self.wfile, self.rfile):
+            try:
+                f.close()
+            except (IOError, OSError):
+                pass
+
+
+class MessageConnection(object):
+    """
+    JSON messages over a multiprocessing.connection.Connection.  We do not
+    use its send()/recv() as those unpickle data across the elevation
+    boundary.
+    """
+    def __init__(self, conn):
+        self.conn = conn
+
+    def send(self, obj):
+        self.conn.send_bytes(json.dumps(obj).encode('utf-8'))
+
+    def recv(self):
+        return json.loads(self.conn.recv_bytes().decode('utf-8'))
+
+    def close(self):
+        self.conn.close()
+
+
+def run_job(job):
+    op = job.get('op')
+    if op == 'ping':
+        return {'pid': os.getpid()}
+    if op not in ('install', 'remove'):
+        raise ValueError("unknown job operation: %r" % op)
+    from . import _install
+    result = _install(job['path'], remove=(op == 'remove'), prefix=job['prefix'],
+                      mode=job.get('mode', 'system'), root_prefix=job['root_prefix'])
+    return {'result': result.to_json()}
+
+
+def serve(conn, handler=run_job):
+    """
+    Answer jobs read from `conn` until it is closed or asked to shut down.
+    A failing job is reported back and does not stop the worker.
+    """
+    while True:
+        try:
+            job = conn.recv()
+        except EOFError:
+            break
+        if job.get('op') == 'shutdown':
+            break
+        result = {'id': job.get('id')}
+        try:
+            result.update(handler(job))
+            result['ok'] = True
+        except Exception as e:
+            logger.debug("job %r failed", job, exc_info=True)
+            result['ok'] = False
+            result['error'] = '%s: %s' % (type(e).__name__, e)
+        conn.send(result)
+
+
+class Session(object):
+    """
+    Client side of a worker: submit() sends one job and waits for its result.
+    """
+    def __init__(self, conn, process=None):
+        self.conn = conn
+        self.process = process
+        self._next_id = 0
+        self._lock = threading.Lock()
+
+    def submit(self, op, **kwargs):
+        with self._lock:
+            self._next_id += 1
+            job = dict(kwargs, id=self._next_id, op=op)
+            try:
+                self.conn.send(job)
+                return self.conn.recv()
+            except (EOFError, IOError, OSError) as e:
+                # the worker went away; report it like a failed job
+                return {'id': job['id'], 'ok': False, 'error': 'worker died: %s' % e}
+
+    def install(self, path, remove=False, prefix=sys.prefix, root_prefix=sys.prefix):
+        return self.submit('remove' if remove else 'install', path=path,
+                           prefix=prefix, root_prefix=root_prefix)
+
+    def close(self):
+        try:
+            self.conn.send({'op': 'shutdown'})
+        except (IOError, OSError, EOFError):
+            pass
+        self.conn.close()
+        if self.process is not None:
+            self.process.wait()
+
+
+def spawn_stdio(python=None, env=None):
+    """
+    Start a (non-elevated) worker talking over its stdin/stdout.
+    """
+    process = subprocess.Popen([python or sys.executable, '-m', 'menuinst.worker', '--stdio'],
+                               stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                               env=env, universal_newlines=True)
+    return Session(StreamConnection(process.stdout, process.stdin), process)
+
+
+def write_authkey(authkey):
+    """
+    Write `authkey` to a new temporary file, and return its path.
+
+    On POSIX mkstemp() makes the file readable by the user only.  On
+    Windows its mode is not enforced: the file gets the ACL of %TEMP%, which
+    by default (below the user's profile) lets the user, SYSTEM and the
+    Administrators read it; a %TEMP% shared with others exposes the key
+    until the worker deleted the file.
+    """
+    fd, path = tempfile.mkstemp(prefix='menuinst-worker-', suffix='.key')
+    try:
+        os.write(fd, binascii.hexlify(authkey))
+    finally:
+        os.close(fd)
+    return path
+
+
+def read_authkey(path):
+    """
+    Read the key written by write_authkey(), and delete its file.
+    """
+    try:
+        with open(path, 'rb') as fi:
+            return binascii.unhexlify(fi.read().strip())
+    finally:
+        os.remove(path)
+
+
+def spawn_elevated(root_prefix):
+    """
+    Start the root prefix's python as an elevated worker (one UAC prompt) and
+    wait for it to connect back over a named pipe.
+    """
+    from multiprocessing.connection import Listener
+    from .win_elevate import runAsAdmin
+
+    authkey = os.urandom(16)
+    listener = Listener(family='AF_PIPE', authkey=authkey)
+    keyfile = write_authkey(authkey)
+    try:
+        runAsAdmin([join(root_prefix, 'python'), '-m', 'menuinst.worker', '--connect',
+                    listener.address, keyfile], wait=False)
+        accepted = []
+        t = threading.Thread(target=lambda: accepted.append(listener.accept()))
+        t.daemon = True
+        t.start()
+        t.join(CONNECT_TIMEOUT)
+        if not accepted:
+            raise RuntimeError("elevated worker did not connect")
+        return Session(MessageConnection(accepted[0]))
+    finally:
+        listener.close()
+        if os.path.exists(keyfile):
+            # the worker did not start
+            os.remove(keyfile)
+
+
+_sessions = {}
+
+
+def elevated_session(root_prefix):
+    """
+    Return the elevated worker for `root_prefix`, starting it on first use.
+    Returns None if elevation was refused or failed; this is remembered so
+    the user is not prompted again by the same process.
+    """
+    if root_prefix not in _sessions:
+        try:
+            _sessions[root_prefix] = spawn_elevated(root_prefix)
+        except Exception as e:
+            logger.debug("could not start elevated worker: %s", e)
+            _sessions[root_prefix] = None
+    return _sessions[root_prefix]
+
+
+@atexit.register
+def close_sessions():
+    while _sessions:
+        _, session = _sessions.popitem()
+        if session is not None:
+            session.close()
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if argv[:1] == ['--stdio']:
+        conn = StreamConnection(sys.stdin, sys.stdout)
+        # anything printed by the jobs themselves must not corrupt the stream
+        sys.stdout = sys.stderr
+    elif argv[:1] == ['--connect'] and len(argv) == 3:
+        from multiprocessing.connection import Client
+        conn = MessageConnection(Client(argv[1], authkey=read_authkey(argv[2])))
+    else:
+        sys.exit("usage: python -m menuinst.worker --stdio | --connect ADDRESS KEYFILE")
+    try:
+        serve(conn)
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    main()
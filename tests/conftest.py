@@ -0,0 +1,25 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import, division, print_function, unicode_literals
+import json
+
+import pytest
+
+
+@pytest.fixture
+def make_env():
+    """
+    make_env(prefix, name='spyder', menu_name='Anaconda') makes the
+    py.path `prefix` a conda environment with a menu file holding the
+    shortcut `name` (running PREFIX/bin/NAME) in the menu `menu_name`, and
+    returns the menu file's path.
+    """
+    def make_env(prefix, name='spyder', menu_name='Anaconda'):
+        prefix.ensure('conda-meta', dir=True)
+        path = prefix.ensure('Menu', dir=True).join('%s.json' % name)
+        path.write(json.dumps({
+            'menu_name': menu_name,
+            'menu_items': [{'id': name, 'name': name.title(), 'terminal': False,
+                            'cmd': ['%s/bin/%s' % (prefix, name)]}],
+        }))
+        return str(path)
+    return make_env
@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import, division, print_function, unicode_literals
+import json
+import os
+import subprocess
+import sys
+import time
+
+import pytest
+
+from menuinst import activation
+from menuinst.launch import launcher_path, update
+
+posix_only = pytest.mark.skipif(sys.platform == 'win32', reason="bash launcher")
+
+
+def test_diff_env():
+    before = {'PATH': '/usr/bin:/bin', 'HOME': '/home/me', 'CONDA_PREFIX_1': '/base',
+              'SHLVL': '1'}
+    after = {'PATH': '/env/bin:/usr/bin:/bin', 'HOME': '/home/me', 'CONDA_PREFIX': '/env',
+             'SHLVL': '2'}
+    snapshot = activation.diff_env(before, after)
+    assert snapshot == {'path': ['/env/bin'], 'env': {'CONDA_PREFIX': '/env'},
+                        'unset': ['CONDA_PREFIX_1']}
+
+
+@posix_only
+def test_base_environ():
+    environ = {'PATH': '/opt/env/bin:/opt/other/bin:/opt/env2/bin:/usr/bin',
+               'CONDA_PREFIX': '/opt/other', 'CONDA_PREFIX_1': '/opt/base', 'CONDA_SHLVL': '2',
+               'CONDA_PKGS_DIRS': '/pkgs', 'CC': '/opt/other/bin/gcc', 'CONDA_BACKUP_CC': 'cc',
+               'LD': '/opt/other/bin/ld', 'CONDA_BACKUP_LD': '', 'HOME': '/home/me'}
+    assert activation.base_environ('/opt/env', environ) == {
+        'PATH': '/opt/env2/bin:/usr/bin', 'CONDA_PKGS_DIRS': '/pkgs', 'CC': 'cc',
+        'HOME': '/home/me'}
+
+
+@pytest.fixture
+def prefixes(tmpdir):
+    root = tmpdir.mkdir('root')
+    root.mkdir('bin').join('activate').write(
+        'export MENUINST_TEST_PREFIX="$1"\n'
+        'export CONDA_PREFIX="$1"\n'
+        'export PATH="$1/bin:$PATH"\n'
+        'echo activated >> "$1/activations.log"\n')
+    prefix = root.mkdir('envs').mkdir('test')
+    prefix.mkdir('conda-meta').join('state').write('{}')
+    return str(root), prefix
+
+
+def run_launcher(prefix):
+    out = subprocess.check_output(
+        ['/bin/bash', launcher_path(str(prefix)), sys.executable, '-c',
+         'import json, os; print(json.dumps(dict(os.environ)))'],
+        universal_newlines=True)
+    return json.loads(out)
+
+
+@posix_only
+def test_snapshot_launcher(prefixes):
+    root, prefix = prefixes
+    profile = update(str(prefix), root)
+    snapshot = profile['activation']
+    assert snapshot['env']['MENUINST_TEST_PREFIX'] == str(prefix)
+    assert snapshot['path'] == [str(prefix.join('bin'))]
+    assert prefix.join('activations.log').read().count('activated') == 1
+
+    # the launcher applies the snapshot without activating
+    env = run_launcher(prefix)
+    assert env['MENUINST_TEST_PREFIX'] == str(prefix)
+    assert env['PATH'].split(os.pathsep)[0] == str(prefix.join('bin'))
+    assert prefix.join('activations.log').read().count('activated') == 1
+
+    # an unchanged prefix is not activated again at install time
+    assert update(str(prefix), root) == profile
+    assert prefix.join('activations.log').read().count('activated') == 1
+
+    # a new activate.d hook makes the snapshot stale
+    hook = prefix.join('etc', 'conda', 'activate.d', 'hook.sh')
+    hook.ensure()
+    hook.write('export HOOKED=1\n')
+    later = time.time() + 10
+    os.utime(str(hook.dirpath()), (later, later))
+    assert not activation.is_current(snapshot, str(prefix))
+    env = run_launcher(prefix)
+    assert env['MENUINST_TEST_PREFIX'] == str(prefix)
+    assert prefix.join('activations.log').read().count('activated') == 2
+
+    profile = update(str(prefix), root)
+    assert activation.is_current(profile['activation'], str(prefix))
+
+
+@posix_only
+def test_capture_from_activated_environment(prefixes, monkeypatch):
+    root, prefix = prefixes
+    # conda running in the environment its menus are installed for
+    monkeypatch.setenv('PATH', os.pathsep.join([str(prefix.join('bin')), os.environ['PATH']]))
+    monkeypatch.setenv('CONDA_PREFIX', str(prefix))
+    snapshot = activation.capture(str(prefix), root)
+    assert snapshot['path'] == [str(prefix.join('bin'))]
+    assert snapshot['env']['CONDA_PREFIX'] == str(prefix)
+    assert snapshot['env']['MENUINST_TEST_PREFIX'] == str(prefix)
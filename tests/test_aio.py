@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import, division, print_function, unicode_literals
+import asyncio
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from menuinst import activation, aio
+from menuinst.aio import install_async, remove_async
+from menuinst.context import InstallContext
+from menuinst.launch import read_profile
+from menuinst.result import InstallResult
+
+linux_only = pytest.mark.skipif(not sys.platform.startswith('linux'), reason="Linux only")
+
+
+@linux_only
+def test_install_async(tmpdir, monkeypatch, make_env):
+    root = tmpdir.mkdir('conda')
+    root.mkdir('bin').join('activate').write('export MENUINST_TEST_PREFIX="$1"\n')
+    envs = [root.join('envs', 'env%d' % i) for i in range(20)]
+    paths = [make_env(env, 'app%d' % i) for i, env in enumerate(envs)]
+    context = InstallContext.user(str(tmpdir.mkdir('home')))
+    appdir = tmpdir.join('home', '.local', 'share', 'applications')
+
+    def blocking_capture(*args):
+        raise AssertionError("the activation was run in a thread")
+    monkeypatch.setattr(activation, 'capture', blocking_capture)
+
+    async def install_all(remove=False):
+        func = remove_async if remove else install_async
+        return await asyncio.gather(*[func(path, str(env), str(root), context)
+                                      for path, env in zip(paths, envs)])
+
+    results = asyncio.run(install_all())
+    assert all(isinstance(result, InstallResult) for result in results)
+    assert sorted(p for result in results for p in result.paths('created')
+                  if p.startswith(str(appdir))) == sorted(str(p) for p in appdir.listdir())
+    assert list(results[0].timings) == ['read', 'menu', 'shortcuts', 'total']
+    assert len(appdir.listdir()) == 2 * 20
+    # the activation was captured with asyncio subprocesses
+    snapshot = read_profile(str(envs[3]))['activation']
+    assert snapshot['env']['MENUINST_TEST_PREFIX'] == str(envs[3])
+
+    asyncio.run(install_all(remove=True))
+    assert appdir.listdir() == []
+
+
+@linux_only
+def test_cancel(tmpdir, make_env):
+    prefix = tmpdir.mkdir('conda')
+    path = make_env(prefix, 'spyder')
+    context = InstallContext.user(str(tmpdir.mkdir('home')))
+    executor = ThreadPoolExecutor(max_workers=1)
+    release = threading.Event()
+    executor.submit(release.wait)
+
+    async def main():
+        task = asyncio.ensure_future(install_async(path, str(prefix), str(prefix), context,
+                                                   executor))
+        await asyncio.sleep(0.05)
+        task.cancel()
+        release.set()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(main())
+    executor.shutdown(wait=True)
+    assert not tmpdir.join('home', '.local', 'share', 'applications').check()
+
+
+@linux_only
+def test_without_context(tmpdir, monkeypatch, make_env):
+    prefix = tmpdir.mkdir('conda')
+    path = make_env(prefix, 'spyder')
+    context = InstallContext.user(str(tmpdir.mkdir('home')))
+    monkeypatch.setattr(InstallContext, 'current', classmethod(lambda cls: context))
+
+    result = asyncio.run(install_async(path, str(prefix), str(prefix), progressive=True))
+    assert result.pending.wait(5)
+    appdir = tmpdir.join('home', '.local', 'share', 'applications')
+    entries = [str(p) for p in appdir.listdir()]
+    assert len(entries) == 2
+    result = asyncio.run(remove_async(path, str(prefix), str(prefix)))
+    assert set(entries) <= set(result.paths('removed'))
+    assert appdir.listdir() == []
+
+
+def test_without_context_on_windows(monkeypatch):
+    calls = []
+
+    def install(path, remove, prefix, root_prefix, progressive):
+        calls.append((path, remove, prefix, root_prefix, progressive))
+        return InstallResult(path, prefix, remove)
+    monkeypatch.setattr(aio, 'install', install)
+    monkeypatch.setattr(aio.sys, 'platform', 'win32')
+
+    result = asyncio.run(install_async('C:\\conda\\Menu\\spyder.json', 'C:\\conda',
+                                       'C:\\conda', progressive=True))
+    assert isinstance(result, InstallResult)
+    assert calls == [('C:\\conda\\Menu\\spyder.json', False, 'C:\\conda', 'C:\\conda', True)]
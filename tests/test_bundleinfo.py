@@ -0,0 +1,33 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import, division, print_function, unicode_literals
+import plistlib
+
+from menuinst.bundleinfo import BundleInfo
+
+
+def test_from_shortcut():
+    shortcut = {
+        'name': 'Spyder IDE',
+        'version': '4.2.5',
+        'document_types': [{'name': 'Python script', 'extensions': ['py'], 'role': 'Editor'}],
+        'url_schemes': [{'name': 'Spyder', 'schemes': ['spyder']}],
+        'environment': {'SPYDER_DEBUG': '0'},
+    }
+    d = BundleInfo.from_shortcut(shortcut, 'Spyder IDE', 'spyder.icns').to_dict()
+    assert d['CFBundleIdentifier'] == 'com.Spyder-IDE'
+    assert d['CFBundleVersion'] == d['CFBundleShortVersionString'] == '4.2.5'
+    assert d['CFBundleIconFile'] == 'spyder.icns'
+    assert d['CFBundleDocumentTypes'] == [{'CFBundleTypeName': 'Python script',
+                                           'CFBundleTypeRole': 'Editor',
+                                           'CFBundleTypeExtensions': ['py']}]
+    assert d['CFBundleURLTypes'][0]['CFBundleURLSchemes'] == ['spyder']
+    assert d['LSEnvironment'] == {'SPYDER_DEBUG': '0'}
+
+
+def test_dumps_formats():
+    info = BundleInfo('Launcher', 'Launcher')
+    xml = info.dumps()
+    binary = info.dumps(plistlib.FMT_BINARY)
+    assert xml.startswith(b'<?xml')
+    assert binary.startswith(b'bplist00')
+    assert plistlib.loads(xml) == plistlib.loads(binary) == info.to_dict()
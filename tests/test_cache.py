@@ -0,0 +1,120 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import, division, print_function, unicode_literals
+import os
+
+from menuinst.cache import Cache, make_key
+from menuinst.darwin import Application
+from menuinst.filetree import File
+from menuinst.fs import Recorder, os_fs
+from menuinst.main import main
+
+
+def test_rendered_is_cached(tmpdir):
+    cache = Cache(str(tmpdir.join('cache')))
+    calls = []
+
+    def render():
+        calls.append(1)
+        return {'a.desktop': File(b'[Desktop Entry]\n'), 'run': File(b'#!/bin/sh\n', mode=0o755)}
+
+    key = make_key('linux', {'name': 'Spyder'})
+    first = cache.rendered(key, render)
+    second = cache.rendered(key, render)
+    assert len(calls) == 1
+    assert sorted(first) == sorted(second) == ['a.desktop', 'run']
+    assert first['run'].mode == 0o755 and not first['run'].shared
+
+    # identical content under another key is stored once
+    cache.rendered(make_key('linux', {'name': 'Spyder (py38)'}), render)
+    assert len(calls) == 2
+    assert len(cache.entries()) == 2
+    assert cache.size() == len(b'[Desktop Entry]\n') + len(b'#!/bin/sh\n')
+
+
+def test_install_clones_from_cache(tmpdir):
+    cache = Cache(str(tmpdir.join('cache')))
+    files = cache.rendered(make_key('x'), lambda: {'apps/a.desktop': File(b'entry')})
+    for env in ('one', 'two'):
+        cache.install(files, str(tmpdir.join(env)))
+        assert tmpdir.join(env, 'apps', 'a.desktop').read() == 'entry'
+    # reflinks or copies: editing one in place leaves the others alone
+    entry = tmpdir.join('one', 'apps', 'a.desktop')
+    assert entry.stat().nlink == 1
+    with open(str(entry), 'r+') as fo:
+        fo.write('ENTRY')
+    assert tmpdir.join('two', 'apps', 'a.desktop').read() == 'entry'
+    assert cache.rendered(make_key('x'), None)['apps/a.desktop'].read() == b'entry'
+
+
+def test_apply_renders_again_when_a_blob_is_gone(tmpdir):
+    cache = Cache(str(tmpdir.join('cache')))
+    key = make_key('x')
+    calls = []
+
+    def render():
+        calls.append(1)
+        return {'a.desktop': File(b'entry')}
+
+    def install(files):
+        # another process collects the garbage first
+        if len(calls) == 1:
+            for f in files.values():
+                os.unlink(f.source)
+        cache.install(files, str(tmpdir.join('apps')))
+
+    cache.apply(key, render, install)
+    assert len(calls) == 2
+    assert tmpdir.join('apps', 'a.desktop').read() == 'entry'
+
+
+def test_install_skips_identical_files(tmpdir):
+    cache = Cache(str(tmpdir.join('cache')))
+    files = cache.rendered(make_key('x'), lambda: {'a.desktop': File(b'entry')})
+    events = []
+    fs = Recorder(os_fs, lambda kind, path, size, duration: events.append(kind))
+    cache.install(files, str(tmpdir.join('apps')), fs)
+    assert events == ['mkdir', 'created']
+    del events[:]
+    cache.install(files, str(tmpdir.join('apps')), fs)
+    assert events == ['skipped']
+
+    # something else is replaced, not removed and then written
+    entry = tmpdir.join('apps', 'a.desktop')
+    entry.remove()
+    entry.write('changed')
+    del events[:]
+    cache.install(files, str(tmpdir.join('apps')), fs)
+    assert events == ['updated']
+    assert entry.read() == 'entry'
+    assert tmpdir.join('apps').listdir() == [entry]
+
+
+def test_gc_evicts_least_recently_used(tmpdir):
+    cache = Cache(str(tmpdir.join('cache')))
+    for i, name in enumerate(('old', 'new')):
+        key = make_key(name)
+        cache.rendered(key, lambda: {'f': File(name.encode('utf-8') * 10)})
+        os.utime(os.path.join(cache.root, 'entries', key + '.json'), (i, i))
+    assert cache.gc(max_size=35) == [make_key('old')]
+    assert cache.lookup(make_key('old')) is None
+    assert cache.lookup(make_key('new')) is not None
+    assert cache.size() == 30
+    assert cache.gc(max_size=0) == [make_key('new')]
+    assert cache.size() == 0
+
+
+def test_application_uses_cache(tmpdir, monkeypatch, capsys):
+    icon = tmpdir.join('launcher.icns')
+    icon.write_binary(b'icns')
+    cache = Cache(str(tmpdir.join('cache')))
+    shortcut = {'name': 'Launcher', 'cmd': 'launcher', 'icns': str(icon)}
+    for env in ('one', 'two'):
+        app_path = str(tmpdir.mkdir(env).join('Launcher.app'))
+        Application(app_path, shortcut, str(tmpdir.join('env')), cache=cache).create()
+        assert tmpdir.join(env, 'Launcher.app', 'Contents', 'Resources',
+                           'launcher.icns').read() == 'icns'
+    assert len(cache.entries()) == 1
+
+    monkeypatch.setenv('MENUINST_CACHE_DIR', cache.root)
+    main(['gc', '--max-size', '0'])
+    assert 'evicted 1 entries, 0 bytes left' in capsys.readouterr().out
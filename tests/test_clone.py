@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import, division, print_function, unicode_literals
+import errno
+import os
+
+import pytest
+
+from menuinst.clone import STRATEGIES, Cloner
+
+
+def test_clone_file_real_filesystem(tmpdir):
+    src = tmpdir.join('src')
+    src.write_binary(b'x' * 100000)
+    os.chmod(str(src), 0o755)
+    cloner = Cloner()
+    strategy = cloner.clone_file(str(src), str(tmpdir.join('dst')))
+    assert strategy in ('reflink', 'copy_file_range', 'copy')
+    assert tmpdir.join('dst').read_binary() == src.read_binary()
+    assert os.stat(str(tmpdir.join('dst'))).st_mode == os.stat(str(src)).st_mode
+
+    assert cloner.clone_file(str(src), str(tmpdir.join('link')), allow_hardlink=True) in \
+        (strategy, 'hardlink')
+
+
+def unsupported(src, dst):
+    open(dst, 'w').close()  # leave a partial file behind
+    raise OSError(errno.EOPNOTSUPP, "not here")
+
+
+def test_fallback_is_remembered(tmpdir):
+    calls = []
+
+    def track(name, func):
+        def wrapper(src, dst):
+            calls.append(name)
+            return func(src, dst)
+        return name, wrapper
+
+    strategies = dict(STRATEGIES)
+    cloner = Cloner([track('reflink', unsupported),
+                     track('copy_file_range', unsupported),
+                     track('hardlink', strategies['hardlink']),
+                     track('copy', strategies['copy'])])
+    src = tmpdir.join('src')
+    src.write('data')
+    assert cloner.clone_file(str(src), str(tmpdir.join('a'))) == 'copy'
+    assert calls == ['reflink', 'copy_file_range', 'copy']
+    assert cloner.clone_file(str(src), str(tmpdir.join('b')), allow_hardlink=True) == 'hardlink'
+    assert calls[3:] == ['hardlink']
+    assert tmpdir.join('b').read() == 'data'
+    assert os.stat(str(src)).st_nlink == 2
+
+
+def test_real_errors_are_raised(tmpdir):
+    def broken(src, dst):
+        raise OSError(errno.ENOSPC, "disk full")
+    cloner = Cloner([('reflink', broken), ('copy', dict(STRATEGIES)['copy'])])
+    src = tmpdir.join('src')
+    src.write('data')
+    with pytest.raises(OSError):
+        cloner.clone_file(str(src), str(tmpdir.join('dst')))
+
+
+def test_clone_tree(tmpdir):
+    skeleton = tmpdir.mkdir('skeleton')
+    skeleton.join('Contents', 'Resources', 'app.icns').write('icns', ensure=True)
+    skeleton.join('Contents', 'MacOS').ensure(dir=True)
+    used = Cloner().clone_tree(str(skeleton), str(tmpdir.join('App.app')),
+                               lambda relpath: relpath.startswith('Contents/Resources/'))
+    assert list(used) == ['Contents/Resources/app.icns']
+    assert tmpdir.join('App.app', 'Contents', 'MacOS').isdir()
+    assert tmpdir.join('App.app', 'Contents', 'Resources', 'app.icns').read() == 'icns'
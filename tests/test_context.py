@@ -0,0 +1,144 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import, division, print_function, unicode_literals
+import json
+import sys
+import threading
+import xml.etree.ElementTree as ET
+
+import pytest
+
+import menuinst
+from menuinst.main import main
+from menuinst.context import InstallContext
+
+
+def test_user_context(tmpdir):
+    home = str(tmpdir)
+    context = InstallContext.user(home)
+    assert context.mode == 'user'
+    assert context.appdir == str(tmpdir.join('.local', 'share', 'applications'))
+    assert context.menu_file == str(tmpdir.join('.config', 'menus', 'applications.menu'))
+    assert context.lock is InstallContext.user(home).lock
+    assert context.lock is not InstallContext.system().lock
+
+    context = InstallContext.user(environ={'XDG_DATA_HOME': '/data'})
+    assert context.appdir == '/data/applications'
+
+
+def test_windows_user_context():
+    context = InstallContext.windows_user('C:\\Users\\jane')
+    assert context.dirs['desktop'] == 'C:\\Users\\jane\\Desktop'
+    assert context.dirs['start'].endswith('\\Start Menu\\Programs')
+
+
+@pytest.mark.skipif(not sys.platform.startswith('linux'), reason="Linux only")
+def test_install_for_many_users(tmpdir):
+    prefix = tmpdir.mkdir('prefix')
+    prefix.mkdir('Menu').join('menu.json').write(json.dumps({
+        'menu_name': 'Anaconda',
+        'menu_items': [{'id': 'spyder', 'name': 'Spyder', 'cmd': ['spyder'],
+                        'terminal': False}],
+    }))
+    menu_path = str(prefix.join('Menu', 'menu.json'))
+    homes = [tmpdir.mkdir('home%d' % i) for i in range(8)]
+    # eight users and a system root, provisioned concurrently by one process
+    contexts = [InstallContext.user(str(home)) for home in homes]
+    contexts.append(InstallContext('system', str(tmpdir.join('usr', 'share')),
+                                   str(tmpdir.join('etc', 'xdg'))))
+
+    threads = [threading.Thread(target=menuinst.install,
+                                args=(menu_path, False, str(prefix)),
+                                kwargs={'root_prefix': str(prefix), 'context': context})
+               for context in contexts]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    for context in contexts:
+        with open('%s/Anaconda_spyder.desktop' % context.appdir) as fi:
+            assert 'Exec=spyder\n' in fi.read()
+        menus = ET.parse(context.menu_file).getroot().findall('Menu/Name')
+        assert [e.text for e in menus] == ['Anaconda']
+    assert 'MergeFile' in open(contexts[0].menu_file).read()
+
+
+@pytest.mark.skipif(not sys.platform.startswith('linux'), reason="Linux only")
+def test_staged_install(tmpdir):
+    destdir = tmpdir.join('image')
+    prefix = '/opt/conda'
+    menu_dir = destdir.join('opt', 'conda', 'Menu')
+    menu_dir.ensure(dir=True)
+    menu_dir.join('menu.json').write(json.dumps({
+        'menu_name': 'Anaconda',
+        'menu_items': [{'id': 'spyder', 'name': 'Spyder', 'terminal': False,
+                        'cmd': ['{{WEBBROWSER}}', 'http://localhost']}],
+    }))
+    manifest_path = str(tmpdir.join('manifest.json'))
+    main(['--destdir', str(destdir), '--manifest', manifest_path, '-p', prefix,
+          'Menu/menu.json'])
+
+    entry = destdir.join('usr', 'share', 'applications', 'Anaconda_spyder.desktop').read()
+    assert 'Exec=/opt/conda/bin/python ' in entry
+    assert destdir.join('etc', 'xdg', 'menus', 'applications.menu').check()
+    with open(manifest_path) as fi:
+        manifest = json.load(fi)
+    paths = [f['path'] for f in manifest['files']]
+    assert '/usr/share/applications/Anaconda_spyder.desktop' in paths
+    assert '/etc/xdg/menus/applications.menu' in paths
+    assert '/opt/conda/Menu/menu.json' not in paths
+    # the cache of the build host stays out of the image
+    assert not [path for path in paths if '/var/cache/menuinst/' in path]
+    assert not [str(p) for p in destdir.visit() if 'menuinst' in p.basename and p.check(dir=1)
+                and p.dirpath().basename == 'cache']
+
+
+@pytest.mark.skipif(not sys.platform.startswith('linux'), reason="Linux only")
+def test_remove_last_menu_removes_launch_profile(tmpdir):
+    prefix = tmpdir.mkdir('prefix')
+    paths = []
+    for menu_name, name in (('Anaconda', 'spyder'), ('Tools', 'idle')):
+        path = prefix.ensure('Menu', dir=True).join('%s.json' % name)
+        path.write(json.dumps({
+            'menu_name': menu_name,
+            'menu_items': [{'id': name, 'name': name.title(), 'cmd': [name],
+                            'terminal': False}],
+        }))
+        paths.append(str(path))
+    context = InstallContext.user(str(tmpdir.mkdir('home')))
+    kwargs = dict(prefix=str(prefix), root_prefix=str(prefix), context=context)
+    for path in paths:
+        menuinst.install(path, **kwargs)
+    assert prefix.join('etc', 'menuinst', 'launch.json').check()
+
+    menuinst.install(paths[0], remove=True, **kwargs)
+    # still used by the other menu
+    assert prefix.join('etc', 'menuinst', 'launch.json').check()
+    menuinst.install(paths[1], remove=True, **kwargs)
+    assert not prefix.join('etc', 'menuinst').check()
+    # removing again finds nothing to do
+    menuinst.install(paths[1], remove=True, **kwargs)
+    assert not prefix.join('etc', 'menuinst').check()
+
+
+@pytest.mark.skipif(not sys.platform.startswith('linux'), reason="Linux only")
+def test_staged_install_twice(tmpdir):
+    destdir = tmpdir.join('image')
+    menu_dir = destdir.join('opt', 'conda', 'Menu')
+    menu_dir.ensure(dir=True)
+    menu_dir.join('menu.json').write(json.dumps({
+        'menu_name': 'Anaconda',
+        'menu_items': [{'id': 'spyder', 'name': 'Spyder', 'terminal': False,
+                        'cmd': ['spyder']}],
+    }))
+    manifests = []
+    for i in range(2):
+        manifest_path = str(tmpdir.join('manifest%d.json' % i))
+        main(['--destdir', str(destdir), '--manifest', manifest_path, '-p', '/opt/conda',
+              'Menu/menu.json'])
+        with open(manifest_path) as fi:
+            manifests.append(json.load(fi))
+    # the second install finds everything in place, and lists it all the same
+    assert manifests[0] == manifests[1]
+    paths = [f['path'] for f in manifests[1]['files']]
+    assert '/usr/share/applications/Anaconda_spyder.desktop' in paths
@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import, division, print_function, unicode_literals
+import os
+import plistlib
+import stat
+
+from menuinst import filetree
+from menuinst.context import InstallContext
+from menuinst.darwin import Application, Menu, ShortCut
+from menuinst.filetree import File, PlistFile
+
+
+def desired_tree(icon):
+    return {
+        'Contents/PkgInfo': File(b'APPLSpyd'),
+        'Contents/Info.plist': PlistFile({'CFBundleName': 'Spyder'}),
+        'Contents/Resources/spyder.icns': File(source=icon),
+        'Contents/MacOS/Spyder': File(b'#!/bin/bash\n', mode=0o755),
+    }
+
+
+def test_plan_and_apply(tmpdir):
+    icon = tmpdir.join('spyder.icns')
+    icon.write_binary(b'icns')
+    root = str(tmpdir.join('Spyder.app'))
+    desired = desired_tree(str(icon))
+
+    ops = filetree.plan(root, desired)
+    assert ('mkdir', '') in ops
+    assert sorted(relpath for op, relpath in ops if op == 'write') == sorted(desired)
+    filetree.apply(root, ops, desired)
+    assert filetree.plan(root, desired) == []
+    script = os.path.join(root, 'Contents', 'MacOS', 'Spyder')
+    assert stat.S_IMODE(os.stat(script).st_mode) == 0o755
+
+    # only what changed is touched
+    desired['Contents/Info.plist'] = PlistFile({'CFBundleName': 'Spyder 4'})
+    os.chmod(script, 0o644)
+    tmpdir.join('Spyder.app', 'Contents', 'Resources', 'old.icns').write('')
+    assert filetree.sync(root, desired) == [
+        ('remove', 'Contents/Resources/old.icns'),
+        ('write', 'Contents/Info.plist'),
+        ('chmod', 'Contents/MacOS/Spyder'),
+    ]
+    assert filetree.plan(root, desired) == []
+
+    icon.write_binary(b'new icns')
+    assert filetree.plan(root, desired) == [('write', 'Contents/Resources/spyder.icns')]
+
+
+def test_plist_format_does_not_matter(tmpdir):
+    path = tmpdir.join('Info.plist')
+    path.write_binary(plistlib.dumps({'a': 1, 'b': ['c']}, fmt=plistlib.FMT_BINARY))
+    assert PlistFile({'a': 1, 'b': ['c']}).matches(str(path))
+    assert not PlistFile({'a': 2, 'b': ['c']}).matches(str(path))
+    path.write('garbage')
+    assert not PlistFile({'a': 1}).matches(str(path))
+
+
+def test_application_update(tmpdir):
+    icon = tmpdir.join('launcher.icns')
+    icon.write_binary(b'icns')
+    shortcut = {'name': 'Launcher', 'cmd': '${BIN_DIR}/launcher', 'icns': str(icon)}
+    app_path = str(tmpdir.join('Launcher.app'))
+    prefix = str(tmpdir.join('env'))
+
+    assert Application(app_path, shortcut, prefix).create()
+    assert Application(app_path, shortcut, prefix).create() == []
+    launcher = str(tmpdir.join('launch.sh'))
+    assert Application(app_path, shortcut, prefix, launcher=launcher).create() == [
+        ('write', 'Contents/MacOS/Launcher')]
+    with open(os.path.join(app_path, 'Contents', 'Info.plist'), 'rb') as fi:
+        assert plistlib.load(fi)['CFBundleExecutable'] == 'Launcher'
+
+
+def test_applications_share_skeleton(tmpdir):
+    icon = tmpdir.join('launcher.icns')
+    icon.write_binary(b'icns')
+    prefix = str(tmpdir.join('env'))
+    for name in ('One', 'Two'):
+        shortcut = {'name': name, 'cmd': name.lower(), 'icns': str(icon)}
+        app = Application(str(tmpdir.join(name + '.app')), shortcut, prefix)
+        ops = app.create()
+        assert ('write', 'Contents/Resources/launcher.icns') not in ops
+        assert tmpdir.join(name + '.app', 'Contents', 'Resources', 'launcher.icns').read() \
+            == 'icns'
+    assert len(tmpdir.join('env', 'etc', 'menuinst', 'skeletons').listdir()) == 1
+
+
+def test_skeletons_are_removed(tmpdir):
+    icon = tmpdir.join('launcher.icns')
+    icon.write_binary(b'icns')
+    prefix = str(tmpdir.join('env'))
+    context = InstallContext('user', applications_dir=str(tmpdir.mkdir('Applications')))
+    menu = Menu('Anaconda', prefix, None, root_prefix=str(tmpdir.join('root')), context=context)
+    skeletons = tmpdir.join('env', 'etc', 'menuinst', 'skeletons')
+    one, two = [ShortCut(menu, {'name': name, 'cmd': name.lower(), 'icns': str(icon)})
+                for name in ('One', 'Two')]
+    one.create()
+    one.remove()
+    assert not skeletons.check()
+    one.create()
+    two.create()
+    assert len(skeletons.listdir()) == 1
+    # with its icon gone first
+    icon.remove()
+    one.remove()
+    two.remove()
+    menu.remove()
+    assert not skeletons.check()
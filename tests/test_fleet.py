@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import, division, print_function, unicode_literals
+import sys
+import xml.etree.ElementTree as ET
+
+import pytest
+
+from menuinst.context import InstallContext
+from menuinst.fleet import discover, fleet
+
+
+def test_discover(tmpdir, make_env):
+    root = tmpdir.mkdir('conda')
+    make_env(root)
+    make_env(root.mkdir('envs').mkdir('py3'))
+    root.join('envs').mkdir('no-menus').mkdir('conda-meta')
+    other = tmpdir.mkdir('elsewhere')
+    make_env(other)
+    environments_txt = tmpdir.join('environments.txt')
+    environments_txt.write('%s\n%s\n%s\n' % (root.join('envs', 'py3'), other,
+                                             tmpdir.join('gone')))
+
+    found = discover(str(root), str(environments_txt))
+    assert [prefix for prefix, paths in found] == [
+        str(root), str(root.join('envs', 'py3')), str(other)]
+    assert found[0][1] == [str(root.join('Menu', 'spyder.json'))]
+
+
+@pytest.mark.skipif(not sys.platform.startswith('linux'), reason="Linux only")
+@pytest.mark.parametrize('jobs', [1, 2])
+def test_fleet(tmpdir, jobs, make_env):
+    root = tmpdir.mkdir('conda')
+    make_env(root)
+    for i in range(4):
+        make_env(root.join('envs').ensure('env%d' % i, dir=True), name='app%d' % i)
+    root.join('envs', 'env0', 'Menu', 'broken.json').write('{')
+    context = InstallContext.user(str(tmpdir.mkdir('home')))
+
+    results = fleet(str(root), jobs=jobs, context=context, environments_txt=str(tmpdir))
+    assert [r.status for r in results].count('error') == 1
+    appdir = tmpdir.join('home', '.local', 'share', 'applications')
+    assert len(appdir.listdir('*.desktop')) == 2 * 5
+    menus = ET.parse(context.menu_file).getroot().findall('Menu/Name')
+    # one menu, edited once
+    assert [e.text for e in menus] == ['Anaconda']
+
+    results = fleet(str(root), remove=True, jobs=jobs, context=context,
+                    environments_txt=str(tmpdir))
+    assert [r.status for r in results].count('ok') == 5
+    assert appdir.listdir() == []
+    assert ET.parse(context.menu_file).getroot().findall('Menu/Name') == []
+
+
+@pytest.mark.skipif(not sys.platform.startswith('linux'), reason="Linux only")
+def test_fleet_shared_step_fails(tmpdir, monkeypatch, make_env):
+    from menuinst import linux
+
+    def create(self):
+        raise OSError(28, "No space left on device")
+    monkeypatch.setattr(linux.Menu, 'create', create)
+    root = tmpdir.mkdir('conda')
+    make_env(root)
+    make_env(root.join('envs').ensure('py3', dir=True))
+    context = InstallContext.user(str(tmpdir.mkdir('home')))
+
+    results = fleet(str(root), jobs=1, context=context, environments_txt=str(tmpdir))
+    assert [r.status for r in results] == ['error', 'error']
+    assert all('No space left' in r.detail for r in results)
+    assert results[1].prefix == str(root.join('envs', 'py3'))
+    # no shortcuts without their menu
+    assert not tmpdir.join('home', '.local', 'share', 'applications').check()
@@ -0,0 +1,136 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import, division, print_function, unicode_literals
+import errno
+import xml.etree.ElementTree as ET
+
+import pytest
+
+from menuinst import filetree, linux
+from menuinst.context import InstallContext
+from menuinst.darwin import Application
+from menuinst.fs import MemoryFileSystem, StatCache
+from menuinst.lnk import ShellLink, link_matches, read_lnk, write_lnk
+from menuinst.utils import rm_rf
+
+
+def test_memory_fs():
+    fs = MemoryFileSystem()
+    fs.makedirs('/a/b')
+    fs.write_bytes('/a/b/c.txt', b'data', 0o600)
+    assert fs.isdir('/a') and fs.isfile('/a/b/c.txt')
+    assert fs.listdir('/a') == ['b']
+    assert fs.stat('/a/b/c.txt').st_size == 4
+    assert list(fs.walk('/a')) == [('/a', ['b'], []), ('/a/b', [], ['c.txt'])]
+    with pytest.raises(OSError) as e:
+        fs.write_bytes('/x/y', b'')
+    assert e.value.errno == errno.ENOENT
+    with pytest.raises(OSError) as e:
+        fs.rmdir('/a')
+    assert e.value.errno == errno.ENOTEMPTY
+
+    fs.rename('/a/b', '/a/d')
+    assert fs.read_bytes('/a/d/c.txt') == b'data'
+    rm_rf('/a/d/c.txt', fs)
+    rm_rf('/a', fs)
+    assert not fs.exists('/a')
+
+
+def test_latency():
+    slept = []
+    fs = MemoryFileSystem(latency=0.25, sleep=slept.append)
+    fs.makedirs('/a')
+    fs.write_bytes('/a/f', b'')
+    assert fs.ops['mkdir'] == 1 and fs.ops['write'] == 1
+    assert fs.elapsed == 0.5
+    assert slept == [0.25, 0.25]
+
+
+def test_linux_install_in_memory():
+    fs = MemoryFileSystem(latency=0.01)
+    context = InstallContext.user('/home/jane', fs=fs)
+    menu = linux.Menu('Anaconda', '/opt/conda', None, root_prefix='/opt/conda',
+                      context=context)
+    menu.create()
+    linux.ShortCut(menu, {'id': 'spyder', 'name': 'Spyder', 'cmd': ['spyder'],
+                          'terminal': False}).create()
+
+    entry = fs.read_bytes('/home/jane/.local/share/applications/Anaconda_spyder.desktop')
+    assert b'Exec=spyder\n' in entry
+    root = ET.fromstring(fs.read_bytes(context.menu_file))
+    assert [e.text for e in root.findall('Menu/Name')] == ['Anaconda']
+    # only the fake home was touched, and the cost of that is known
+    assert all(path.startswith('/home/jane/') for path in fs.files)
+    assert fs.elapsed == pytest.approx(sum(fs.ops.values()) * 0.01)
+
+    linux.ShortCut(menu, {'id': 'spyder', 'name': 'Spyder', 'cmd': ['spyder'],
+                          'terminal': False}).remove()
+    menu.remove()
+    root = ET.fromstring(fs.read_bytes(context.menu_file))
+    assert root.findall('Menu/Name') == []
+    assert fs.listdir(context.appdir) == []
+
+
+def test_osx_bundle_in_memory():
+    fs = MemoryFileSystem()
+    fs.makedirs('/opt/conda/Menu')
+    fs.write_bytes('/opt/conda/Menu/spyder.icns', b'icns')
+    app = Application('/Applications/Spyder.app',
+                      {'name': 'Spyder', 'cmd': '${BIN_DIR}/spyder',
+                       'icns': '${MENU_DIR}/spyder.icns'},
+                      '/opt/conda', fs=fs)
+    ops = app.create()
+    assert ('write', 'Contents/Info.plist') in ops
+    assert fs.read_bytes('/Applications/Spyder.app/Contents/Resources/spyder.icns') == b'icns'
+    assert fs.stat('/Applications/Spyder.app/Contents/MacOS/Spyder').st_mode & 0o777 == 0o755
+    assert filetree.plan('/Applications/Spyder.app', app.bundle_files(), fs) == []
+
+
+def test_lnk_in_memory():
+    fs = MemoryFileSystem()
+    link = ShellLink('C:\\conda\\python.exe', 'Python', '-i', 'C:\\conda', 'C:\\conda\\py.ico')
+    write_lnk('/Python.lnk', link, fs)
+    assert read_lnk('/Python.lnk', fs).arguments == '-i'
+    assert link_matches('/Python.lnk', 'C:\\conda\\python.exe', 'Python', '-i', 'C:\\conda',
+                        'C:\\conda\\py.ico', fs=fs)
+
+
+def test_stat_cache():
+    fs = MemoryFileSystem()
+    fs.makedirs('/a/b')
+    fs.write_bytes('/a/f', b'data')
+    cache = StatCache(fs)
+    assert cache.isdir('/a/b') and cache.isfile('/a/f') and not cache.exists('/a/g')
+    assert not cache.isfile('/a/b/c') and not cache.exists('/a/x/y')
+    assert cache.ops == {'scandir': 3}
+
+    # our own changes are remembered, not fetched again
+    cache.write_bytes('/a/g', b'')
+    cache.makedirs('/a/x/y/z')
+    rm_rf('/a/f', cache)
+    assert cache.isfile('/a/g') and cache.isdir('/a/x/y/z') and not cache.lexists('/a/f')
+    assert cache.listdir('/a') == ['b', 'g', 'x']
+    assert cache.metadata_ops() == 3
+
+    # changes by others are only seen when asked to forget
+    fs.write_bytes('/a/b/new', b'')
+    assert not cache.exists('/a/b/new')
+    cache.forget('/a/b/new')
+    assert cache.exists('/a/b/new')
+    assert cache.stat('/a/g').st_size == 0
+
+
+def test_install_round_trips():
+    def install(n):
+        cache = StatCache(MemoryFileSystem())
+        context = InstallContext.user('/home/jane', fs=cache)
+        menu = linux.Menu('Anaconda', '/opt/conda', None, root_prefix='/opt/conda',
+                          context=context)
+        menu.create()
+        for i in range(n):
+            linux.ShortCut(menu, {'id': 'app%d' % i, 'name': 'App', 'cmd': ['app'],
+                                  'terminal': False}).create()
+        assert len(cache.listdir(context.appdir)) == 2 * n
+        return cache.metadata_ops()
+
+    # the metadata fetched does not grow with the number of shortcuts
+    assert install(1) == install(20) <= 10
@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import, division, print_function, unicode_literals
+import json
+import sys
+
+import pytest
+
+from menuinst import iter_install
+from menuinst.context import InstallContext
+from menuinst.fs import MemoryFileSystem, Recorder
+
+
+def test_recorder():
+    events = []
+    fs = Recorder(MemoryFileSystem(), lambda *event: events.append(event))
+    fs.makedirs('/a/b')
+    fs.makedirs('/a/b', exist_ok=True)
+    fs.write_bytes('/a/b/f', b'data')
+    assert fs.isfile('/a/b/f')
+    fs.unlink('/a/b/f')
+    assert [(kind, path, size) for kind, path, size, duration in events] == [
+        ('mkdir', '/a/b', None), ('created', '/a/b/f', 4), ('removed', '/a/b/f', None)]
+
+
+@pytest.mark.skipif(not sys.platform.startswith('linux'), reason="Linux only")
+def test_iter_install(tmpdir):
+    prefix = tmpdir.mkdir('conda')
+    path = prefix.mkdir('Menu').join('tools.json')
+    path.write(json.dumps({'menu_name': 'Anaconda', 'menu_items': [
+        {'id': id, 'name': id.title(), 'cmd': [id], 'terminal': False}
+        for id in ('spyder', 'idle')]}))
+    context = InstallContext.user(str(tmpdir.mkdir('home')))
+    appdir = tmpdir.join('home', '.local', 'share', 'applications')
+
+    events = iter_install(str(path), prefix=str(prefix), root_prefix=str(prefix),
+                          context=context)
+    assert next(events) == ('planned', str(path), None, None, ['spyder', 'idle'])
+    for event in events:
+        if event.path == str(appdir.join('Anaconda_spyderKDE.desktop')):
+            break
+    assert event.kind == 'wrote' and event.size > 0
+    # stopped after the first shortcut
+    events.close()
+    assert sorted(p.basename for p in appdir.listdir()) == [
+        'Anaconda_spyder.desktop', 'Anaconda_spyderKDE.desktop']
+
+    removed = [e.path for e in iter_install(str(path), True, str(prefix), str(prefix), context)
+               if e.kind == 'removed']
+    assert str(appdir.join('Anaconda_spyder.desktop')) in removed
+    assert appdir.listdir() == []
+
+    path.write('{')
+    assert [e.kind for e in iter_install(str(path), context=context)] == ['error']
+
+
+@pytest.mark.skipif(not sys.platform.startswith('linux'), reason="Linux only")
+def test_iter_install_deferred(tmpdir):
+    prefix = tmpdir.mkdir('conda')
+    path = prefix.mkdir('Menu').join('spyder.json')
+    path.write(json.dumps({'menu_name': 'Anaconda', 'menu_items': [
+        {'id': 'spyder', 'name': 'Spyder', 'cmd': ['spyder'], 'terminal': False}]}))
+    context = InstallContext.user(str(tmpdir.mkdir('home')))
+    appdir = tmpdir.join('home', '.local', 'share', 'applications')
+
+    deferred = []
+    list(iter_install(str(path), prefix=str(prefix), root_prefix=str(prefix), context=context,
+                      deferred=deferred))
+    assert [p.basename for p in appdir.listdir()] == ['Anaconda_spyder.desktop']
+    for func, args in deferred:
+        func(*args)
+    assert appdir.join('Anaconda_spyderKDE.desktop').check()
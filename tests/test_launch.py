@@ -0,0 +1,49 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import, division, print_function, unicode_literals
+import importlib.util
+import json
+import os
+import subprocess
+import sys
+
+from menuinst.launch import make_profile, read_profile, write_profile
+
+repo_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+cwp_py = os.path.join(repo_dir, 'cwp.py')
+
+
+def test_write_profile(tmpdir):
+    prefix = str(tmpdir)
+    profile = make_profile(prefix, '%USERPROFILE%\\Documents')
+    assert write_profile(prefix, profile)
+    assert read_profile(prefix) == profile
+    assert not write_profile(prefix, profile)
+    assert write_profile(prefix, make_profile(prefix, None))
+
+
+def test_cwp_dedupe_path():
+    spec = importlib.util.spec_from_file_location('cwp', cwp_py)
+    cwp = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(cwp)
+    assert cwp.dedupe_path(['/a', '/b/', '', '/a', '/b', '/c']) == ['/a', '/b/', '/c']
+
+
+def test_cwp_uses_profile(tmpdir):
+    prefix = tmpdir.mkdir('env')
+    workdir = tmpdir.mkdir('work')
+    profile = make_profile(str(prefix), str(workdir))
+    profile['env']['MENUINST_TEST'] = 'yes'
+    write_profile(str(prefix), profile)
+
+    env = dict(os.environ, PATH=os.pathsep.join([str(prefix), os.environ['PATH']]))
+    out = subprocess.check_output(
+        [sys.executable, '-I', '-S', cwp_py, str(prefix), sys.executable, '-c',
+         'import json, os; print(json.dumps([os.getcwd(), dict(os.environ)]))'],
+        env=env, universal_newlines=True)
+    cwd, child_env = json.loads(out)
+    assert cwd == str(workdir)
+    assert child_env['CONDA_PREFIX'] == str(prefix)
+    assert child_env['MENUINST_TEST'] == 'yes'
+    path = child_env['PATH'].split(os.pathsep)
+    assert path[:len(profile['path'])] == profile['path']
+    assert path.count(str(prefix)) == 1
@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import, division, print_function, unicode_literals
+import random
+import struct
+
+import pytest
+
+from menuinst.lnk import (LINK_CLSID, LnkError, ShellLink, audit, link_matches, parse_lnk,
+                          read_lnk, write_lnk)
+
+
+def string_data(value):
+    return struct.pack('<H', len(value)) + value.encode('utf-16-le')
+
+
+def make_lnk(target, description='', arguments='', workdir='', icon='', env_target=None):
+    flags = 0x2 | 0x80  # HasLinkInfo | IsUnicode
+    header = struct.pack('<I16sI', 0x4C, LINK_CLSID, 0) + b'\x00' * (0x4C - 24)
+
+    base = target.encode('cp1252') + b'\x00'
+    link_info_header_size = 0x1C
+    base_off = link_info_header_size
+    suffix_off = base_off + len(base)
+    body = base + b'\x00'
+    link_info = struct.pack('<7I', link_info_header_size + len(body), link_info_header_size,
+                            0x1, 0, base_off, 0, suffix_off) + body
+
+    strings = b''
+    for flag, value in ((0x04, description), (0x10, workdir),
+                        (0x20, arguments), (0x40, icon)):
+        if value:
+            flags |= flag
+            strings += string_data(value)
+
+    extra = b''
+    if env_target:
+        extra += struct.pack('<2I', 788, 0xA0000001)
+        extra += env_target.encode('cp1252').ljust(260, b'\x00')
+        extra += env_target.encode('utf-16-le').ljust(520, b'\x00')
+    extra += struct.pack('<I', 0)
+
+    header = header[:20] + struct.pack('<I', flags) + header[24:]
+    return header + link_info + strings + extra
+
+
+def test_parse_lnk():
+    data = make_lnk('C:\\Anaconda3\\python.exe', 'Spyder', '-m spyder',
+                    '%HOMEPATH%', 'C:\\Anaconda3\\Menu\\spyder.ico')
+    link = parse_lnk(data)
+    assert link.target == 'C:\\Anaconda3\\python.exe'
+    assert link.description == 'Spyder'
+    assert link.arguments == '-m spyder'
+    assert link.workdir == '%HOMEPATH%'
+    assert link.icon == 'C:\\Anaconda3\\Menu\\spyder.ico'
+
+
+def test_parse_lnk_environment_target():
+    data = make_lnk('C:\\Windows\\system32\\cmd.exe', 'Anaconda Prompt',
+                    env_target='%windir%\\system32\\cmd.exe')
+    assert parse_lnk(data).target == '%windir%\\system32\\cmd.exe'
+
+
+def test_parse_lnk_rejects_garbage():
+    with pytest.raises(LnkError):
+        parse_lnk(b'[Desktop Entry]\n' * 10)
+    with pytest.raises(LnkError):
+        parse_lnk(make_lnk('C:\\python.exe', 'truncated')[:-20])
+
+
+def test_parse_lnk_truncated_and_corrupt():
+    data = make_lnk('C:\\Anaconda3\\python.exe', 'Spyder', '-m spyder', '%HOMEPATH%',
+                    'C:\\Anaconda3\\Menu\\spyder.ico', env_target='%windir%\\cmd.exe')
+    for n in range(len(data)):
+        try:
+            parse_lnk(data[:n])
+        except LnkError:
+            pass
+    rng = random.Random(0)
+    for _ in range(2000):
+        mutated = bytearray(data)
+        mutated[rng.randrange(len(data))] = rng.randrange(256)
+        try:
+            parse_lnk(bytes(mutated))
+        except LnkError:
+            pass
+
+
+def test_link_matches(tmpdir):
+    path = str(tmpdir.join('Spyder.lnk'))
+    assert not link_matches(path, 'C:\\python.exe')
+    with open(path, 'wb') as fo:
+        fo.write(make_lnk('C:\\Anaconda3\\python.exe', 'Spyder', '-m spyder', '%HOMEPATH%'))
+    assert link_matches(path, '"c:/anaconda3/python.exe"', 'Spyder', '-m spyder', '%HOMEPATH%')
+    assert not link_matches(path, 'C:\\Anaconda3\\python.exe', 'Spyder', '-m spyder2',
+                            '%HOMEPATH%')
+
+
+def test_audit(tmpdir):
+    menu = tmpdir.mkdir('Anaconda3 (64-bit)')
+    menu.join('Spyder.lnk').write_binary(make_lnk('C:\\python.exe', 'Spyder'))
+    menu.join('broken.lnk').write_binary(b'garbage')
+    menu.join('desktop.ini').write('')
+    found = dict(audit(str(tmpdir)))
+    assert sorted(found) == sorted([str(menu.join('Spyder.lnk')), str(menu.join('broken.lnk'))])
+    assert found[str(menu.join('Spyder.lnk'))].description == 'Spyder'
+    assert isinstance(found[str(menu.join('broken.lnk'))], LnkError)
+    assert read_lnk(str(menu.join('Spyder.lnk'))).target == 'C:\\python.exe'
+
+
+def test_write_lnk(tmpdir):
+    path = str(tmpdir.join('Prompt.lnk'))
+    write_lnk(path, ShellLink('%windir%\\system32\\cmd.exe', 'Anaconda Prompt (é)', '/K activate',
+                              '%HOMEPATH%', 'C:\\Anaconda3\\Menu\\prompt.ico', icon_index=2))
+    link = read_lnk(path)
+    assert link.matches('%windir%\\system32\\cmd.exe', 'Anaconda Prompt (é)', '/K activate',
+                        '%HOMEPATH%', 'C:\\Anaconda3\\Menu\\prompt.ico')
+    assert link.icon_index == 2
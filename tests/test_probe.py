@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import, division, print_function, unicode_literals
+import os
+import threading
+import warnings
+
+import pytest
+
+from menuinst.probe import MAX_TIMEOUTS, ProbeTimeoutWarning, Prober, share_root
+
+
+class SlowProvider(object):
+    """
+    Pretends everything below \\\\deadhost is an unreachable share, and
+    C:\\slow and /slow are slow: calls block until the test releases them.
+    """
+    def __init__(self):
+        self.release = threading.Event()
+        self.calls = []
+        self.made = []
+
+    def _wait(self, op, path):
+        self.calls.append((op, path))
+        if path.startswith(('\\\\deadhost', 'C:\\slow', '/slow')):
+            self.release.wait(5)
+
+    def access(self, path, mode):
+        self._wait('access', path)
+        return True
+
+    def isdir(self, path):
+        self._wait('isdir', path)
+        return path in self.made
+
+    def makedirs(self, path):
+        self._wait('makedirs', path)
+        if path.startswith('C:\\readonly'):
+            raise OSError(13, 'Permission denied')
+        self.made.append(path)
+
+
+@pytest.fixture
+def provider():
+    provider = SlowProvider()
+    yield provider
+    provider.release.set()
+
+
+def test_share_root():
+    assert share_root('\\\\vmware-host\\Shared Folders\\Documents') == \
+        '\\\\vmware-host\\shared folders'
+    assert share_root('//vmware-host/Shared Folders') == '\\\\vmware-host\\shared folders'
+    assert share_root('C:/Users/me') is None
+    assert share_root('/home/me') is None
+
+
+def test_access_times_out(provider):
+    prober = Prober(provider, timeout=0.05)
+    with warnings.catch_warnings(record=True) as caught:
+        warnings.simplefilter('always')
+        assert prober.access('\\\\deadhost\\share\\Documents', os.W_OK) is False
+    assert [w.category for w in caught] == [ProbeTimeoutWarning]
+    warning = prober.timeouts[0]
+    assert (warning.op, warning.path) == ('access', '\\\\deadhost\\share\\Documents')
+
+    # the share is remembered as dead and not probed again
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        assert prober.ensure_dir('\\\\deadhost\\share\\Documents\\work') is False
+    assert len(provider.calls) == 1
+
+    # other locations are not affected
+    assert prober.access('C:\\Users\\me\\Documents', os.W_OK) is True
+
+
+def test_local_timeouts_are_not_remembered(provider):
+    prober = Prober(provider, timeout=0.05)
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        assert prober.access('C:\\slow\\Documents', os.W_OK) is False
+        assert prober.access('/slow/Documents', os.W_OK) is False
+    # the same drive, and the rest of the POSIX tree, are still probed
+    assert prober.access('C:\\Users\\me\\Documents', os.W_OK) is True
+    assert prober.access('/home/me', os.W_OK) is True
+    provider.release.set()
+    assert prober.access('C:\\slow\\Documents', os.W_OK) is True
+    assert len(provider.calls) == 5
+
+
+def test_timeouts_are_bounded(provider):
+    prober = Prober(provider, timeout=0.001)
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        for i in range(MAX_TIMEOUTS + 5):
+            prober.access('/slow/%d' % i, os.W_OK)
+    assert len(prober.timeouts) == MAX_TIMEOUTS
+    assert prober.timeouts[-1].path == '/slow/%d' % (MAX_TIMEOUTS + 4)
+
+
+def test_ensure_dir(provider):
+    prober = Prober(provider, timeout=1)
+    assert prober.ensure_dir('C:\\work') is True
+    assert provider.made == ['C:\\work']
+    assert prober.ensure_dir('C:\\work') is True
+    assert provider.made == ['C:\\work']
+    assert prober.ensure_dir('C:\\readonly\\work') is False
+    assert not prober.timeouts
@@ -0,0 +1,54 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import, division, print_function, unicode_literals
+import json
+import sys
+import threading
+
+import pytest
+
+import menuinst
+from menuinst.context import InstallContext
+from menuinst.progress import Scheduler
+
+
+def test_handle():
+    scheduler = Scheduler()
+    started, release = threading.Event(), threading.Event()
+    done = []
+
+    def block():
+        started.set()
+        release.wait()
+
+    handle = scheduler.submit([(block, ()), (done.append, (1,))])
+    started.wait()
+    assert not handle.wait(0.01)
+    assert not handle.cancel()
+    release.set()
+    assert handle.wait(5) and handle.done() and done == []
+
+    handle = scheduler.submit([(int, ('x',))])
+    with pytest.raises(ValueError):
+        handle.wait()
+    assert scheduler.submit([]).wait()
+    scheduler.shutdown()
+
+
+@pytest.mark.skipif(not sys.platform.startswith('linux'), reason="Linux only")
+def test_progressive_install(tmpdir):
+    prefix = tmpdir.mkdir('conda')
+    path = prefix.mkdir('Menu').join('spyder.json')
+    path.write(json.dumps({'menu_name': 'Anaconda', 'menu_items': [
+        {'id': 'spyder', 'name': 'Spyder', 'cmd': ['spyder'], 'terminal': False}]}))
+    context = InstallContext.user(str(tmpdir.mkdir('home')))
+    appdir = tmpdir.join('home', '.local', 'share', 'applications')
+
+    handle = menuinst.install(str(path), prefix=str(prefix), root_prefix=str(prefix),
+                              context=context, progressive=True).pending
+    assert appdir.join('Anaconda_spyder.desktop').check()
+    assert handle.wait(5)
+    assert appdir.join('Anaconda_spyderKDE.desktop').check()
+
+    menuinst.install(str(path), remove=True, prefix=str(prefix), root_prefix=str(prefix),
+                     context=context, progressive=True).pending.wait()
+    assert appdir.listdir() == []
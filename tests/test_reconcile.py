@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import, division, print_function, unicode_literals
+import os
+import sys
+import xml.etree.ElementTree as ET
+
+import pytest
+
+import menuinst
+from menuinst.context import InstallContext
+from menuinst.reconcile import referenced_prefix, reconcile
+
+
+def test_referenced_prefix():
+    assert referenced_prefix('Exec=/bin/bash /opt/conda/envs/py3/etc/menuinst/launch.sh '
+                             '/opt/conda/envs/py3/bin/spyder') == '/opt/conda/envs/py3'
+    assert referenced_prefix('/usr/bin/env /data/conda/bin/python -m idlelib') == '/data/conda'
+    assert referenced_prefix('C:\\Anaconda3\\pythonw.exe -I -S C:\\Anaconda3\\cwp.py '
+                             'C:\\Anaconda3\\envs\\py3 C:\\Anaconda3\\envs\\py3\\pythonw.exe'
+                             ) == 'C:\\Anaconda3\\envs\\py3'
+    assert referenced_prefix('Exec=spyder') is None
+
+
+@pytest.mark.skipif(not sys.platform.startswith('linux'), reason="Linux only")
+def test_reconcile(tmpdir, make_env):
+    root = tmpdir.mkdir('conda')
+    live = make_env(root)
+    gone = root.join('envs', 'old')
+    context = InstallContext.user(str(tmpdir.mkdir('home')))
+    for path, prefix in ((live, root), (make_env(gone, 'idle', 'Old'), gone)):
+        menuinst.install(path, prefix=str(prefix), root_prefix=str(root), context=context)
+    gone.remove()
+    os.unlink('%s/Anaconda_spyderKDE.desktop' % context.appdir)
+    env = {'environments_txt': str(tmpdir.join('none'))}
+
+    changes = reconcile(str(root), context, dry_run=True, **env)
+    assert sorted((c.action, os.path.basename(c.path)) for c in changes) == [
+        ('create', 'Anaconda_spyderKDE.desktop'),
+        ('delete', 'Old_idle.desktop'), ('delete', 'Old_idleKDE.desktop'),
+        ('remove-menu', 'Old')]
+    assert os.path.exists('%s/Old_idle.desktop' % context.appdir)
+
+    assert reconcile(str(root), context, jobs=1, **env) == changes
+    assert sorted(os.listdir(context.appdir)) == ['Anaconda_spyder.desktop',
+                                                  'Anaconda_spyderKDE.desktop']
+    menus = ET.parse(context.menu_file).getroot().findall('Menu/Name')
+    assert [e.text for e in menus] == ['Anaconda']
+    assert reconcile(str(root), context, dry_run=True, **env) == []
+
+    # a newer menu file updates its shortcuts
+    st = os.stat(live)
+    os.utime(live, (st.st_atime, st.st_mtime + 60))
+    assert set(c.action for c in reconcile(str(root), context, dry_run=True, **env)) == \
+        set(['update'])
+    # which leaves them as they were, and only needs doing once
+    assert set(c.action for c in reconcile(str(root), context, **env)) == set(['update'])
+    assert reconcile(str(root), context, dry_run=True, **env) == []
@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import, division, print_function, unicode_literals
+import json
+import os
+import plistlib
+
+from menuinst.lnk import ShellLink, read_lnk
+from menuinst.main import main
+from menuinst.relocate import relocate
+
+
+def test_relocate(tmpdir):
+    old, new = '/opt/old/envs/py38', '/data/envs/py38'
+    apps = tmpdir.mkdir('applications')
+    apps.join('spyder.desktop').write('[Desktop Entry]\nExec=%s/bin/spyder\n' % old)
+    apps.join('other.desktop').write('[Desktop Entry]\nExec=/usr/bin/gedit\n')
+    launch_dir = tmpdir.mkdir('py38').mkdir('etc').mkdir('menuinst')
+    script = launch_dir.join('launch.sh')
+    script.write('#!/bin/bash\nexec %s/bin/python "$@"\n' % old)
+    os.chmod(str(script), 0o755)
+    contents = apps.mkdir('Spyder.app').mkdir('Contents')
+    with open(str(contents.join('Info.plist')), 'wb') as fo:
+        plistlib.dump({'LSEnvironment': {'CONDA_PREFIX': old}, 'CFBundleName': 'Spyder'},
+                      fo, fmt=plistlib.FMT_BINARY)
+    contents.mkdir('MacOS').join('spyder').write('#!/bin/bash\n%s/bin/spyder\n' % old)
+    launch_dir.join('launch.json').write(json.dumps({'prefix': old, 'path': [old + '/bin']}))
+    roots = [str(apps), str(launch_dir)]
+
+    results = relocate(old, new, roots, jobs=2)
+    assert sorted((os.path.basename(r.path), r.status) for r in results) == [
+        ('Info.plist', 'patched'), ('launch.json', 'patched'),
+        ('launch.sh', 'patched'), ('spyder', 'patched'), ('spyder.desktop', 'patched')]
+    assert apps.join('spyder.desktop').read() == '[Desktop Entry]\nExec=%s/bin/spyder\n' % new
+    assert os.stat(str(script)).st_mode & 0o777 == 0o755
+    with open(str(contents.join('Info.plist')), 'rb') as fi:
+        assert plistlib.load(fi)['LSEnvironment'] == {'CONDA_PREFIX': new}
+    assert json.loads(launch_dir.join('launch.json').read()) == \
+        {'prefix': new, 'path': [new + '/bin']}
+    assert relocate(old, new, roots) == []
+    assert not [p for p in tmpdir.visit() if p.basename.endswith('.tmp')]
+
+
+def test_relocate_leaves_other_files_alone(tmpdir):
+    old, new = '/opt/old', '/data/new'
+    apps = tmpdir.mkdir('Applications')
+    apps.join('notes.txt').write('see %s/bin\n' % old)
+    bundle = apps.mkdir('Other.app')
+    bundle.join('readme.txt').write(old)
+    contents = bundle.mkdir('Contents')
+    contents.mkdir('Resources').join('config.json').write(json.dumps({'prefix': old}))
+    contents.mkdir('MacOS').join('other').write_binary(b'\xcf\xfa\xed\xfe' + old.encode())
+    contents.join('Info.plist').write(plistlib.dumps({'CFBundleName': 'Other'}).decode())
+
+    assert relocate(old, new, [str(apps)]) == []
+    assert apps.join('notes.txt').read() == 'see %s/bin\n' % old
+
+
+def test_relocate_matches_whole_prefixes(tmpdir):
+    old, new = '/opt/conda/envs/py3', '/data/py3'
+    apps = tmpdir.mkdir('applications')
+    apps.join('py3.desktop').write('[Desktop Entry]\nExec=%s/bin/spyder\nPath=%s\n' % (old, old))
+    apps.join('py38.desktop').write('[Desktop Entry]\nExec=%s8/bin/spyder\n' % old)
+    launch_dir = tmpdir.mkdir('py3').mkdir('etc').mkdir('menuinst')
+    launch_dir.join('launch.json').write(json.dumps({'path': [old + '8/bin', old + '/bin']}))
+
+    results = relocate(old, new, [str(apps), str(launch_dir)])
+    assert sorted(os.path.basename(r.path) for r in results) == ['launch.json', 'py3.desktop']
+    assert apps.join('py3.desktop').read() == \
+        '[Desktop Entry]\nExec=%s/bin/spyder\nPath=%s\n' % (new, new)
+    assert apps.join('py38.desktop').read() == '[Desktop Entry]\nExec=%s8/bin/spyder\n' % old
+    assert json.loads(launch_dir.join('launch.json').read()) == \
+        {'path': [old + '8/bin', new + '/bin']}
+
+
+def test_relocate_lnk(tmpdir, capsys):
+    menu = tmpdir.mkdir('Start Menu')
+    menu.join('Spyder.lnk').write_binary(ShellLink(
+        'C:\\Anaconda3\\pythonw.exe', 'Spyder', 'c:/anaconda3/cwp.py C:\\Anaconda3',
+        '%HOMEPATH%', 'C:\\Anaconda3\\Menu\\spyder.ico').to_bytes())
+    menu.join('broken.lnk').write_binary(b'C:\\Anaconda3'.decode('ascii').encode('utf-16-le'))
+
+    assert main(['relocate', '--root', str(menu), 'C:\\Anaconda3', 'D:\\Anaconda3']) == 1
+    out = capsys.readouterr().out
+    assert 'Spyder.lnk: patched' in out
+    assert 'broken.lnk: error:' in out
+    link = read_lnk(str(menu.join('Spyder.lnk')))
+    assert link.target == 'D:\\Anaconda3\\pythonw.exe'
+    assert link.arguments == 'D:\\Anaconda3/cwp.py D:\\Anaconda3'
+    assert link.icon == 'D:\\Anaconda3\\Menu\\spyder.ico'
+
+
+def test_relocate_failure_leaves_no_tmp_file(tmpdir, monkeypatch):
+    apps = tmpdir.mkdir('applications')
+    apps.join('spyder.desktop').write('[Desktop Entry]\nExec=/opt/old/bin/spyder\n')
+
+    def replace(src, dst):
+        raise OSError(13, "Permission denied")
+    monkeypatch.setattr(os, 'replace', replace)
+    results = relocate('/opt/old', '/data/new', [str(apps)])
+    assert [r.status for r in results] == ['error']
+    assert apps.listdir() == [apps.join('spyder.desktop')]
@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import, division, print_function, unicode_literals
+import json
+import os
+import plistlib
+
+from menuinst.lnk import read_lnk
+from menuinst.main import main
+from menuinst.render import DEFAULT_PLACEHOLDER, render
+
+
+HERE = os.path.dirname(__file__)
+
+
+ITEMS = {
+    'linux': {'id': 'spyder', 'name': 'Spyder', 'terminal': False,
+              'cmd': ['{{WEBBROWSER}}', 'http://localhost']},
+    'osx': {'name': 'Spyder', 'cmd': '${BIN_DIR}/spyder', 'icns': '${MENU_DIR}/spyder.icns'},
+    'win': {'name': 'Spyder', 'pywscript': '${PYTHON_SCRIPTS}/spyder-script.py',
+            'workdir': '${PERSONALDIR}', 'icon': '${MENU_DIR}/spyder.ico', 'desktop': True},
+}
+
+
+def write_menu(prefix, target):
+    menu = prefix.ensure('Menu', dir=True)
+    menu.join('spyder.icns').write_binary(b'icns')
+    menu.join('menu.json').write(json.dumps({
+        'menu_name': 'Anaconda3', 'menu_items': [ITEMS[target]]}))
+    return str(menu.join('menu.json'))
+
+
+def test_render_linux(tmpdir):
+    out = tmpdir.join('out')
+    written = render(write_menu(tmpdir, 'linux'), 'linux', str(out))
+    assert written == [
+        'share/applications/Anaconda3_spyder.desktop',
+        'share/applications/Anaconda3_spyderKDE.desktop',
+        'share/desktop-directories/Anaconda3.directory',
+    ]
+    entry = out.join('share', 'applications', 'Anaconda3_spyder.desktop').read()
+    assert ('Exec=%s/bin/python -m webbrowser -t http://localhost\n' % DEFAULT_PLACEHOLDER
+            in entry)
+    assert 'NotShowIn=KDE\n' in entry
+
+
+def test_render_osx(tmpdir):
+    out = tmpdir.join('out')
+    written = render(write_menu(tmpdir, 'osx'), 'osx', str(out), '/PLACEHOLDER')
+    app = out.join('Applications', 'Spyder.app', 'Contents')
+    assert len(written) == 4
+    assert app.join('Resources', 'spyder.icns').read_binary() == b'icns'
+    with open(str(app.join('Info.plist')), 'rb') as fi:
+        assert plistlib.load(fi)['CFBundleExecutable'] == 'Spyder'
+    assert b'/PLACEHOLDER/python.app' in app.join('MacOS', 'Spyder').read_binary()
+
+
+def test_render_win(tmpdir):
+    out = tmpdir.join('out')
+    written = render(write_menu(tmpdir, 'win'), 'win', str(out),
+                     'C:\\PLACEHOLDER', env_name='py38')
+    assert written == ['Desktop/Spyder (py38).lnk', 'Start Menu/Anaconda3/Spyder (py38).lnk']
+    link = read_lnk(str(out.join('Start Menu', 'Anaconda3', 'Spyder (py38).lnk')))
+    assert link.target == 'C:\\PLACEHOLDER\\pythonw.exe'
+    assert link.arguments.endswith('C:\\PLACEHOLDER\\Scripts\\spyder-script.py')
+    assert link.workdir == '%USERPROFILE%\\Documents'
+    assert link.icon == 'C:\\PLACEHOLDER\\Menu\\spyder.ico'
+
+
+def test_render_command(tmpdir, capsys):
+    out = tmpdir.join('out')
+    main(['render', '--target', 'win', '-o', str(out), os.path.join(HERE, 'menu-windows.json')])
+    written = capsys.readouterr().out.split('\n')[0]
+    link = read_lnk(str(out.join(*written.split('/'))))
+    assert link.target == '%windir%\\system32\\cmd.exe'
+    assert link.arguments == ('"/K" C:\\anaconda1anaconda2anaconda3\\Scripts\\activate.bat '
+                              'C:\\anaconda1anaconda2anaconda3')
@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import, division, print_function, unicode_literals
+import json
+import sys
+
+import pytest
+
+import menuinst
+from menuinst.context import InstallContext
+from menuinst.result import Artifact, InstallResult
+
+
+def test_record():
+    result = InstallResult('/p/Menu/a.json', '/p')
+    result.record('mkdir', '/apps', None, None)
+    result.record('created', '/apps/a', 10, 0.1)
+    result.record('removed', '/apps/b', None, None)
+    result.record('created', '/apps/b', 20, 0.1)
+    result.record('created', '/apps/tmp', 1, 0.1)
+    result.record('removed', '/apps/tmp', None, None)
+    result.record('skipped', '/apps/c', None, None)
+    result.record('removed', '/apps/.menuinst-trash/0123abcd', None, None)
+    assert result.artifacts == [Artifact('/apps/a', 'created', 10),
+                                Artifact('/apps/b', 'updated', 20),
+                                Artifact('/apps/c', 'skipped', None)]
+    assert result.bytes_written == 30
+    with result.phase('menu'):
+        pass
+
+    data = json.loads(json.dumps(result.to_json()))
+    assert data['artifacts'][1] == {'path': '/apps/b', 'action': 'updated', 'bytes': 20}
+    again = InstallResult.from_json(data)
+    assert again.artifacts == result.artifacts and list(again.timings) == ['menu']
+
+
+@pytest.mark.skipif(not sys.platform.startswith('linux'), reason="Linux only")
+def test_install_result(tmpdir):
+    prefix = tmpdir.mkdir('conda')
+    path = prefix.mkdir('Menu').join('spyder.json')
+    path.write(json.dumps({'menu_name': 'Anaconda', 'menu_items': [
+        {'id': 'spyder', 'name': 'Spyder', 'cmd': ['spyder'], 'terminal': False}]}))
+    prefix.mkdir('bin').join('activate').write('export MENUINST_TEST_PREFIX="$1"\n')
+    context = InstallContext.user(str(tmpdir.mkdir('home')))
+    appdir = tmpdir.join('home', '.local', 'share', 'applications')
+    launch_files = [str(prefix.join('etc', 'menuinst', fn)) for fn in ('launch.json', 'launch.sh')]
+    entries = [str(appdir.join('Anaconda_spyder.desktop')),
+               str(appdir.join('Anaconda_spyderKDE.desktop'))]
+
+    def install(remove=False):
+        return menuinst.install(str(path), remove, str(prefix), root_prefix=str(prefix),
+                                context=context)
+
+    result = install()
+    created = result.paths('created')
+    assert set(entries + launch_files + [context.menu_file]) <= set(created)
+    assert result.bytes_written >= appdir.join('Anaconda_spyder.desktop').size()
+    assert list(result.timings) == ['read', 'menu', 'shortcuts', 'total']
+
+    # an unchanged reinstall writes nothing
+    assert set(entries + launch_files) <= set(install().paths('skipped'))
+    assert install(remove=True).paths('removed')[:2] == entries
@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import, division, print_function, unicode_literals
+import json
+import os
+import sys
+import xml.etree.ElementTree as ET
+
+import pytest
+
+from menuinst.context import InstallContext
+from menuinst.transaction import MenuChange, Transaction, diff, link, menu_entries, unlink
+
+
+def record(name, *paths):
+    return {'name': name, 'files': [p for p, sha in paths],
+            'paths_data': {'paths_version': 1,
+                           'paths': [{'_path': p, 'sha256': sha} for p, sha in paths]}}
+
+
+def test_menu_entries(tmpdir):
+    path = tmpdir.join('spyder-4.0-py_0.json')
+    path.write(json.dumps({'files': ['bin/spyder', 'Menu/spyder.json', 'Menu/spyder.png',
+                                     'Menu\\win.json', 'Menu/sub/x.json']}))
+    assert menu_entries(str(path)) == {'Menu/spyder.json': None, 'Menu/win.json': None}
+
+
+def test_diff():
+    old = [record('spyder', ('Menu/spyder.json', 'a'), ('bin/spyder', 'b')),
+           record('idle', ('Menu/idle.json', 'c')),
+           record('notebook', ('Menu/notebook.json', 'd'))]
+    new = [record('spyder', ('Menu/spyder.json', 'e'), ('bin/spyder', 'f')),
+           record('idle', ('Menu/idle.json', 'c')),
+           record('console', ('Menu/console.json', 'g'))]
+    assert diff(new, old) == [MenuChange('install', 'Menu/console.json'),
+                              MenuChange('remove', 'Menu/notebook.json'),
+                              MenuChange('update', 'Menu/spyder.json')]
+    assert diff(new) == [MenuChange('install', 'Menu/%s.json' % name)
+                         for name in ('console', 'idle', 'spyder')]
+
+
+@pytest.mark.skipif(not sys.platform.startswith('linux'), reason="Linux only")
+def test_link_unlink(tmpdir):
+    prefix = tmpdir.mkdir('conda')
+    menu = prefix.mkdir('Menu').join('spyder.json')
+    context = InstallContext.user(str(tmpdir.mkdir('home')))
+    appdir = tmpdir.join('home', '.local', 'share', 'applications')
+
+    def write(title):
+        menu.write(json.dumps({'menu_name': 'Anaconda', 'menu_items': [
+            {'id': 'spyder', 'name': title, 'cmd': ['spyder'], 'terminal': False}]}))
+        return record('spyder', ('Menu/spyder.json', title))
+
+    v4 = write('Spyder 4')
+    results = link(str(prefix), [v4], root_prefix=str(prefix), context=context)
+    assert [(r.path, r.status) for r in results] == [(str(menu), 'ok')]
+    assert 'Name=Spyder 4\n' in appdir.join('Anaconda_spyder.desktop').read()
+
+    # an upgrade which leaves the menu file alone is nothing to do
+    assert unlink(str(prefix), [v4], [v4], str(prefix), context) == []
+
+    assert len(unlink(str(prefix), [record('spyder', ('Menu/spyder.json', 'x'))], [v4],
+                      str(prefix), context)) == 1
+    assert appdir.listdir() == []
+    v5 = write('Spyder 5')
+    assert len(link(str(prefix), [v5], [v4], str(prefix), context)) == 1
+    assert 'Name=Spyder 5\n' in appdir.join('Anaconda_spyder.desktop').read()
+
+    assert len(unlink(str(prefix), unlinked=[v5], root_prefix=str(prefix),
+                      context=context)) == 1
+    assert appdir.listdir() == []
+
+
+@pytest.mark.skipif(not sys.platform.startswith('linux'), reason="Linux only")
+def test_transaction(tmpdir):
+    prefix = tmpdir.mkdir('conda')
+    menu = prefix.mkdir('Menu').join('tools.json')
+    context = InstallContext.user(str(tmpdir.mkdir('home')))
+    appdir = tmpdir.join('home', '.local', 'share', 'applications')
+
+    def write(*items):
+        menu.write(json.dumps({'menu_name': 'Anaconda', 'menu_items': [
+            {'id': id, 'name': name, 'cmd': [id], 'terminal': False} for id, name in items]}))
+
+    write(('spyder', 'Spyder 4'), ('idle', 'IDLE'), ('qtconsole', 'Console'))
+    with Transaction(str(prefix), context) as t:
+        t.install(str(menu), str(prefix))
+    idle = appdir.join('Anaconda_idle.desktop').stat()
+    menu_file = os.stat(context.menu_file)
+
+    # an upgrade: the old menu file removed, the new one installed
+    t = Transaction(str(prefix), context)
+    t.remove(str(menu), str(prefix))
+    write(('spyder', 'Spyder 5'), ('idle', 'IDLE'), ('console', 'Console'))
+    t.install(str(menu), str(prefix))
+    assert sorted((c.action, c.shortcut) for c in t.commit()) == [
+        ('create', 'console'), ('remove', 'qtconsole'), ('update', 'spyder')]
+    assert sorted(p.basename for p in appdir.listdir()) == [
+        'Anaconda_%s.desktop' % id for id in ('console', 'consoleKDE', 'idle', 'idleKDE',
+                                              'spyder', 'spyderKDE')]
+    assert 'Name=Spyder 5\n' in appdir.join('Anaconda_spyder.desktop').read()
+    # the rest, and the menu, were left alone
+    assert appdir.join('Anaconda_idle.desktop').stat().mtime == idle.mtime
+    assert os.stat(context.menu_file).st_mtime_ns == menu_file.st_mtime_ns
+
+    t = Transaction(str(prefix), context)
+    t.remove(str(menu), str(prefix))
+    assert sorted(c.shortcut for c in t.commit()) == ['console', 'idle', 'spyder']
+    assert appdir.listdir() == []
+    assert ET.parse(context.menu_file).getroot().findall('Menu/Name') == []
@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import, division, print_function, unicode_literals
+import threading
+
+from menuinst import trash
+from menuinst.context import InstallContext
+from menuinst.darwin import Menu, ShortCut
+from menuinst.fs import MemoryFileSystem
+
+
+def make_app(fs, path, n=100):
+    fs.makedirs(path + '/Contents/Resources')
+    for i in range(n):
+        fs.write_bytes('%s/Contents/Resources/%d.png' % (path, i), b'png')
+
+
+def test_discard(tmpdir):
+    app = tmpdir.join('Spyder.app')
+    app.ensure('Contents', 'Info.plist')
+    shortcut = tmpdir.join('spyder.desktop')
+    shortcut.write('')
+    trash.discard(str(app))
+    trash.discard(str(shortcut))
+    trash.discard(str(tmpdir.join('missing.app')))
+    assert not app.check() and not shortcut.check()
+    trash.reaper.wait()
+    assert tmpdir.listdir() == []
+
+
+def test_removal_does_not_wait_for_deletion():
+    fs = MemoryFileSystem()
+    context = InstallContext('user', applications_dir='/Applications', fs=fs)
+    make_app(fs, '/Applications/Spyder.app')
+    menu = Menu(None, '/opt/conda', None, context=context)
+
+    # hold up the deletion of the trash until the removal returned
+    blocked = threading.Event()
+    rmtree = fs.rmtree
+    fs.rmtree = lambda path: blocked.wait() and rmtree(path)
+    ShortCut(menu, {'name': 'Spyder', 'cmd': '', 'icns': ''}).remove()
+    assert fs.listdir('/Applications') == [trash.TRASH_DIR]
+    assert len(fs.listdir('/Applications/' + trash.TRASH_DIR)) == 1
+    blocked.set()
+    trash.reaper.wait()
+    assert fs.listdir('/Applications') == []
+
+
+def test_resume():
+    # a trash which an earlier process did not get to empty
+    fs = MemoryFileSystem()
+    make_app(fs, '/Applications/%s/0123abcd' % trash.TRASH_DIR)
+    fs.makedirs('/Applications/Keep.app')
+    context = InstallContext('user', applications_dir='/Applications', fs=fs)
+    Menu(None, '/opt/conda', None, context=context).remove()
+    trash.reaper.wait()
+    assert fs.listdir('/Applications') == ['Keep.app']
@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import, division, print_function, unicode_literals
+import json
+import os
+import sys
+
+import pytest
+
+from menuinst.context import InstallContext
+from menuinst.watch import Inotify, Poller, Watch
+
+
+def write_menu(prefix, name, title):
+    prefix.ensure('Menu', dir=True).join('%s.json' % name).write(json.dumps({
+        'menu_name': 'Anaconda',
+        'menu_items': [{'id': name, 'name': title, 'cmd': [name], 'terminal': False}],
+    }))
+
+
+def test_poller(tmpdir):
+    prefix = tmpdir.mkdir('conda')
+    poller = Poller([str(prefix)], interval=0.01)
+    assert poller.wait(0.05) == set()
+    write_menu(prefix, 'spyder', 'Spyder')
+    assert poller.wait(0.05) == set([str(prefix)])
+    assert poller.wait(0) == set()
+
+
+@pytest.mark.skipif(not sys.platform.startswith('linux'), reason="Linux only")
+@pytest.mark.parametrize('backend', ['inotify', 'poll'])
+def test_watch(tmpdir, backend):
+    prefix = tmpdir.mkdir('conda')
+    write_menu(prefix, 'spyder', 'Spyder')
+    # without a Menu/ yet
+    other = tmpdir.mkdir('other')
+    context = InstallContext.user(str(tmpdir.mkdir('home')))
+    if backend == 'inotify':
+        watcher = Inotify([str(prefix), str(other)])
+    else:
+        watcher = Poller([str(prefix), str(other)], interval=0.01)
+    watch = Watch([str(prefix), str(other)], str(prefix), context, debounce=0.05,
+                  backend=watcher)
+    appdir = tmpdir.join('home', '.local', 'share', 'applications')
+
+    assert [(r.action, r.prefix) for r in watch.sync()] == [('create', str(prefix))]
+    assert appdir.join('Anaconda_spyder.desktop').check()
+
+    # a burst of changes is one batch
+    write_menu(other, 'idle', 'IDLE')
+    write_menu(prefix, 'spyder', 'Spyder 4')
+    write_menu(prefix, 'spyder', 'Spyder 5')
+    results = watch.step(5)
+    assert sorted((r.action, os.path.basename(r.path)) for r in results) == [
+        ('create', 'idle.json'), ('update', 'spyder.json')]
+    assert 'Name=Spyder 5\n' in appdir.join('Anaconda_spyder.desktop').read()
+
+    # removed with what it was, while the menu stays for the other one
+    prefix.join('Menu', 'spyder.json').remove()
+    assert [r.action for r in watch.step(5)] == ['remove']
+    assert sorted(appdir.listdir()) == [appdir.join('Anaconda_idle.desktop'),
+                                        appdir.join('Anaconda_idleKDE.desktop')]
+
+    other.join('Menu', 'broken.json').write('{')
+    assert [r.action for r in watch.step(5)] == ['error']
+    assert watch.step(0.1) == []
+    watcher.close()
@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import, division, print_function, unicode_literals
+import io
+import os
+import sys
+
+from menuinst.worker import StreamConnection, read_authkey, serve, spawn_stdio, write_authkey
+
+repo_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_serve_reports_each_job():
+    def handler(job):
+        if job['op'] == 'bad':
+            raise ValueError("boom")
+        return {'echo': job['path']}
+
+    rfile = io.StringIO('{"id": 1, "op": "install", "path": "a.json"}\n'
+                        '{"id": 2, "op": "bad"}\n'
+                        '{"id": 3, "op": "remove", "path": "b.json"}\n'
+                        '{"op": "shutdown"}\n'
+                        '{"id": 4, "op": "install", "path": "never.json"}\n')
+    wfile = io.StringIO()
+    serve(StreamConnection(rfile, wfile), handler)
+    results = [StreamConnection(io.StringIO(line), None).recv()
+               for line in wfile.getvalue().splitlines(True)]
+    assert results == [
+        {'id': 1, 'ok': True, 'echo': 'a.json'},
+        {'id': 2, 'ok': False, 'error': 'ValueError: boom'},
+        {'id': 3, 'ok': True, 'echo': 'b.json'},
+    ]
+
+
+def test_one_worker_for_many_jobs(tmpdir):
+    env = dict(os.environ, PYTHONPATH=repo_dir)
+    session = spawn_stdio(sys.executable, env=env)
+    try:
+        pid = session.submit('ping')['pid']
+        assert pid == session.process.pid
+        result = session.install(str(tmpdir.join('missing.json')), prefix=str(tmpdir),
+                                 root_prefix=str(tmpdir))
+        assert not result['ok']
+        assert 'missing.json' in result['error']
+        # the failed job did not take the worker down
+        assert session.submit('ping')['pid'] == pid
+    finally:
+        session.close()
+    assert session.process.returncode == 0
+
+
+def test_authkey_file():
+    authkey = os.urandom(16)
+    path = write_authkey(authkey)
+    if sys.platform != 'win32':
+        assert os.stat(path).st_mode & 0o777 == 0o600
+    assert read_authkey(path) == authkey
+    assert not os.path.exists(path)